@@ -0,0 +1,330 @@
+"""
+    @file broadcast.py
+    @description Contains the Server-Sent Events hub: one thread holding every event stream subscriber on a selector, fanning out published events with non-blocking writes.\n
+    @author Derek Tan
+"""
+
+from typing import TYPE_CHECKING
+import selectors
+import socket
+from collections import deque
+from threading import Lock, Thread
+from time import monotonic
+
+from core.overload import LoadShedder
+
+if TYPE_CHECKING:
+    from utils.traffic import TrafficRecorder
+
+# Slow subscriber policies, applied when an event does not fit in a subscriber's buffer:
+SSE_POLICY_DROP = "drop"  # NOTE: skip the event for that subscriber only.
+SSE_POLICY_DISCONNECT = "disconnect"  # NOTE: close the stream, so the client's EventSource reconnects and resyncs.
+
+SSE_DEFAULT_BUFFER = 65536
+SSE_DEFAULT_HEARTBEAT = 15.0
+SSE_DEFAULT_RETRY = 3000
+SSE_HEARTBEAT_BYTES = b": ping\n\n"
+
+def encode_event(data: str, event: str = None, event_id: str = None):
+    """
+        @description Encodes one event in the `text/event-stream` format. Multi-line data becomes several `data:` fields.
+    """
+    parts = []
+
+    if event is not None:
+        parts.append(f'event: {event}\n')
+
+    if event_id is not None:
+        parts.append(f'id: {event_id}\n')
+
+    for line in data.split("\n"):
+        parts.append(f'data: {line}\n')
+
+    parts.append("\n")
+
+    return "".join(parts).encode(encoding="utf-8")
+
+class Subscriber:
+    """
+        @description One event stream connection and its bounded buffer of encoded events not yet written. Events are shared `bytes` objects, so buffering costs no copies.
+    """
+    __slots__ = ("sock", "topic", "chunks", "offset", "pending", "dropped", "writing", "registered", "closed")
+
+    def __init__(self, client_sock: socket.socket, topic: str):
+        self.sock = client_sock
+        self.topic = topic
+        self.chunks: deque[bytes] = deque()
+        self.offset = 0
+        self.pending = 0
+        self.dropped = 0
+        self.writing = False
+        self.registered = False
+        self.closed = False
+
+    def push(self, payload: bytes):
+        self.chunks.append(payload)
+        self.pending += len(payload)
+
+class EventHub:
+    """
+        @description Holds event stream subscribers by topic without a thread each. `publish` encodes an event once and queues it for every subscriber of its topic, then the hub thread writes to whichever sockets can take it.
+        @note Each subscriber buffers at most `max_buffer` bytes. Events beyond that are dropped for the slow subscriber or close it, by `slow_policy`. Idle streams get a comment line every `heartbeat` seconds so dead peers are noticed.
+    """
+    def __init__(self, max_buffer: int = SSE_DEFAULT_BUFFER, slow_policy: str = SSE_POLICY_DROP, heartbeat: float = SSE_DEFAULT_HEARTBEAT, shedder: LoadShedder = None, recorder: "TrafficRecorder" = None):
+        if slow_policy not in (SSE_POLICY_DROP, SSE_POLICY_DISCONNECT):
+            raise ValueError(f'{__name__}: Invalid slow subscriber policy {slow_policy}')
+
+        self.max_buffer = max_buffer
+        self.slow_policy = slow_policy
+        self.heartbeat = heartbeat
+        self.shedder = shedder
+        self.recorder = recorder
+
+        self.selector = selectors.DefaultSelector()
+        self.wake_reader, self.wake_writer = socket.socketpair()
+        self.wake_reader.setblocking(False)
+        self.wake_writer.setblocking(False)
+        self.selector.register(self.wake_reader, selectors.EVENT_READ, None)
+
+        # NOTE: publishers and the hub thread share the state below under `lock`, but only the hub thread touches the selector and sockets.
+        self.lock = Lock()
+        self.topics: dict[str, set[Subscriber]] = {}
+        self.joining: list[Subscriber] = []
+        self.closing: list[Subscriber] = []
+        self.dirty: set[Subscriber] = set()
+        self.running = False
+        self.thread = Thread(target=self.run, name="event_hub", daemon=True)
+
+        # Stats:
+        self.subscriber_count = 0
+        self.published_count = 0
+        self.dropped_count = 0
+        self.slow_closed_count = 0
+
+    def start(self):
+        self.running = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.wake()
+
+        if self.thread.is_alive():
+            self.thread.join()
+
+        with self.lock:
+            for subscribers in list(self.topics.values()):
+                for subscriber in list(subscribers):
+                    self.close_subscriber(subscriber)
+
+            for subscriber in self.closing:
+                self.close_subscriber(subscriber)
+
+            self.closing.clear()
+
+        self.selector.close()
+        self.wake_reader.close()
+        self.wake_writer.close()
+
+    def wake(self):
+        try:
+            self.wake_writer.send(b"\0")
+        except OSError:
+            pass  # NOTE a full wake pipe already has the hub waking up.
+
+    def subscribe(self, topic: str, client_sock: socket.socket):
+        """
+            @description Takes over a connection whose event stream headers were already sent, adding it to `topic`. The hub closes it once the client leaves or falls behind.
+        """
+        client_sock.setblocking(False)
+        subscriber = Subscriber(client_sock, topic)
+
+        with self.lock:
+            self.topics.setdefault(topic, set()).add(subscriber)
+            self.joining.append(subscriber)
+            self.subscriber_count += 1
+
+        self.wake()
+
+        return subscriber
+
+    def publish(self, topic: str, data: str, event: str = None, event_id: str = None):
+        """
+            @description Sends an event to all subscribers of `topic`. Returns how many subscribers it was queued for.
+        """
+        return self.publish_raw(topic, encode_event(data, event, event_id))
+
+    def publish_raw(self, topic: str, payload: bytes):
+        queued_count = 0
+
+        with self.lock:
+            subscribers = self.topics.get(topic)
+
+            if not subscribers:
+                return 0
+
+            self.published_count += 1
+
+            for subscriber in list(subscribers):
+                if subscriber.pending + len(payload) > self.max_buffer:
+                    if self.slow_policy == SSE_POLICY_DROP:
+                        subscriber.dropped += 1
+                        self.dropped_count += 1
+                    else:
+                        self.slow_closed_count += 1
+                        self.mark_closing(subscriber)
+
+                    continue
+
+                subscriber.push(payload)
+                self.dirty.add(subscriber)
+                queued_count += 1
+
+        self.wake()
+
+        return queued_count
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "subscribers": self.subscriber_count,
+                "topics": {topic: len(subscribers) for topic, subscribers in self.topics.items() if subscribers},
+                "published": self.published_count,
+                "dropped_events": self.dropped_count,
+                "slow_closed": self.slow_closed_count
+            }
+
+    def mark_closing(self, subscriber: Subscriber):
+        """
+            @description Removes a subscriber from its topic right away, leaving the socket for the hub thread to close. Needs `lock` held.
+        """
+        if subscriber.closed:
+            return
+
+        subscriber.closed = True
+        self.topics[subscriber.topic].discard(subscriber)
+        self.dirty.discard(subscriber)
+        self.closing.append(subscriber)
+
+    def close_subscriber(self, subscriber: Subscriber):
+        """
+            @note Runs on the hub thread, or on shutdown after it stopped, with `lock` held.
+        """
+        if not subscriber.closed:
+            subscriber.closed = True
+            self.topics[subscriber.topic].discard(subscriber)
+            self.dirty.discard(subscriber)
+
+        if subscriber.sock is None:
+            return
+
+        if subscriber.registered:
+            self.selector.unregister(subscriber.sock)
+            subscriber.registered = False
+
+        if self.recorder is not None:
+            self.recorder.note_close(subscriber.sock)
+
+        subscriber.sock.close()
+        subscriber.sock = None
+        subscriber.chunks.clear()
+        self.subscriber_count -= 1
+
+        if self.shedder is not None:
+            self.shedder.note_closed()
+
+    def flush_subscriber(self, subscriber: Subscriber):
+        """
+            @description Writes as much buffered data as the socket takes without blocking, then watches for writability only while data is left.
+        """
+        if subscriber.sock is None:
+            return
+
+        while subscriber.chunks:
+            chunk = subscriber.chunks[0]
+
+            try:
+                sent_count = subscriber.sock.send(memoryview(chunk)[subscriber.offset :])
+            except BlockingIOError:
+                break
+            except OSError:
+                self.close_subscriber(subscriber)
+                return
+
+            subscriber.offset += sent_count
+            subscriber.pending -= sent_count
+
+            if subscriber.offset < len(chunk):
+                break
+
+            subscriber.chunks.popleft()
+            subscriber.offset = 0
+
+        want_write = len(subscriber.chunks) > 0
+
+        if want_write != subscriber.writing and subscriber.registered:
+            subscriber.writing = want_write
+            self.selector.modify(subscriber.sock, selectors.EVENT_READ | selectors.EVENT_WRITE if want_write else selectors.EVENT_READ, subscriber)
+
+    def check_peer(self, subscriber: Subscriber):
+        """
+            @description Reads from a readable stream: event stream clients send nothing, so this means they closed the connection.
+        """
+        try:
+            data = subscriber.sock.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+
+        if not data:
+            self.close_subscriber(subscriber)
+
+    def run(self):
+        next_beat = monotonic() + self.heartbeat
+
+        while self.running:
+            events = self.selector.select(max(0.0, next_beat - monotonic()))
+
+            with self.lock:
+                for key, mask in events:
+                    subscriber = key.data
+
+                    if subscriber is None:
+                        try:
+                            while self.wake_reader.recv(4096):
+                                pass
+                        except BlockingIOError:
+                            pass
+                    elif subscriber.sock is not None:
+                        if mask & selectors.EVENT_READ:
+                            self.check_peer(subscriber)
+
+                        if mask & selectors.EVENT_WRITE:
+                            self.flush_subscriber(subscriber)
+
+                for subscriber in self.joining:
+                    if subscriber.sock is not None:
+                        self.selector.register(subscriber.sock, selectors.EVENT_READ, subscriber)
+                        subscriber.registered = True
+
+                self.joining.clear()
+
+                for subscriber in self.closing:
+                    self.close_subscriber(subscriber)
+
+                self.closing.clear()
+
+                if monotonic() >= next_beat:
+                    next_beat = monotonic() + self.heartbeat
+
+                    for subscribers in self.topics.values():
+                        for subscriber in subscribers:
+                            if subscriber.pending == 0:
+                                subscriber.push(SSE_HEARTBEAT_BYTES)
+                                self.dirty.add(subscriber)
+
+                for subscriber in list(self.dirty):
+                    self.flush_subscriber(subscriber)
+
+                self.dirty.clear()
@@ -0,0 +1,165 @@
+"""
+    @file config.py
+    @description Contains the typed configuration of a Tippy server and its loader for JSON config files.\n
+    @author Derek Tan
+"""
+
+import json
+
+from http1.limits import ScanLimits, LIMIT_DEFAULT_IDLE_TIMEOUT, LIMIT_DEFAULT_HEAD_TIMEOUT, LIMIT_DEFAULT_BODY_TIMEOUT, LIMIT_DEFAULT_SEND_TIMEOUT, LIMIT_DEFAULT_MAX_LINE, LIMIT_DEFAULT_MAX_HEADERS, LIMIT_DEFAULT_MAX_HEADER_BYTES, LIMIT_DEFAULT_MAX_BODY
+from core.lanes import LANE_DEFAULT_WORKERS, LANE_DEFAULT_QUEUE
+from core.overload import LoadShedder, SHED_DEFAULT_RETRY_AFTER
+from core.pool import POOL_DEFAULT_MIN, POOL_DEFAULT_MAX, POOL_DEFAULT_UP_BUSY, POOL_DEFAULT_UP_WAIT, POOL_DEFAULT_IDLE_TIMEOUT, POOL_DEFAULT_INTERVAL
+from utils.cachepolicy import make_cache_policy
+
+TIPPY_VERSION_STRING = "Tippy/v0.5"
+TIPPY_DEFAULT_HOST_NAME = "localhost"
+TIPPY_DEFAULT_HOST_PORT = 8085
+TIPPY_DEFAULT_BACKLOG = 5
+TIPPY_DEFAULT_WWW_DIR = "./public"
+TIPPY_DEFAULT_STOP_TIMEOUT = 2.0
+
+# NOTE: older config files name these keys differently. The old fixed `worker_count` sets both pool limits.
+CONFIG_LEGACY_KEYS = {
+    "serveaddr": ("host_name",),
+    "port": ("host_port",),
+    "worker_count": ("min_workers", "max_workers")
+}
+
+class TippyConfig:
+    """
+        @description Every tunable of a `Tippy` server. Pass one as `Tippy(config=...)`, build one in code or read one with `load_config`.
+        @note `host_port=0` binds an ephemeral port, readable afterwards from `Tippy.get_port()`. Connection workers scale between `min_workers` and `max_workers` (see `core/pool.py`), and setting both equal gives a fixed pool. `endpoints` replaces the `host_name:host_port` listener with a list such as `["unix:/run/tippy.sock", ("::", 8080)]`. The load shedder is only built when one of its thresholds is set, the event hub only with `event_streams`, traffic capture only when `capture_path` is set, and the client cache policy only when `cache_rules` lists rules such as `{"path": "*.css", "max_age": 86400}`. The store is built on the first handler that uses it. Their modules are only imported then, and event and store settings left as `None` take those modules' defaults (`store_sweep=0` turns expiry sweeps off).
+    """
+    def __init__(self, server_name: str = TIPPY_VERSION_STRING, host_name: str = TIPPY_DEFAULT_HOST_NAME, host_port: int = TIPPY_DEFAULT_HOST_PORT, endpoints: list = None, backlog: int = TIPPY_DEFAULT_BACKLOG, min_workers: int = POOL_DEFAULT_MIN, max_workers: int = POOL_DEFAULT_MAX,
+                 scale_up_busy: float = POOL_DEFAULT_UP_BUSY, scale_up_wait: float = POOL_DEFAULT_UP_WAIT, worker_idle_timeout: float = POOL_DEFAULT_IDLE_TIMEOUT, scale_interval: float = POOL_DEFAULT_INTERVAL,
+                 public_folder: str = TIPPY_DEFAULT_WWW_DIR, bundle_path: str = None, lane_workers: int = LANE_DEFAULT_WORKERS, lane_queue: int = LANE_DEFAULT_QUEUE,
+                 idle_timeout: float = LIMIT_DEFAULT_IDLE_TIMEOUT, head_timeout: float = LIMIT_DEFAULT_HEAD_TIMEOUT, body_timeout: float = LIMIT_DEFAULT_BODY_TIMEOUT, send_timeout: float = LIMIT_DEFAULT_SEND_TIMEOUT,
+                 max_line_bytes: int = LIMIT_DEFAULT_MAX_LINE, max_headers: int = LIMIT_DEFAULT_MAX_HEADERS, max_header_bytes: int = LIMIT_DEFAULT_MAX_HEADER_BYTES, max_body_bytes: int = LIMIT_DEFAULT_MAX_BODY,
+                 max_queue_depth: int = None, max_queue_wait: float = None, max_active_conns: int = None, retry_after: int = SHED_DEFAULT_RETRY_AFTER,
+                 event_streams: bool = False, event_buffer: int = None, event_policy: str = None, event_heartbeat: float = None,
+                 store_shards: int = None, store_sweep: float = None, capture_path: str = None, capture_rate: float = 1.0, stop_timeout: float = TIPPY_DEFAULT_STOP_TIMEOUT, cache_rules: list = None):
+        if backlog < 1 or min_workers < 1 or max_workers < min_workers:
+            raise ValueError(f'{__name__}: Invalid backlog {backlog} or worker limits {min_workers} / {max_workers}')
+
+        if not 0 <= host_port <= 65535:
+            raise ValueError(f'{__name__}: Invalid port {host_port}')
+
+        self.server_name = server_name
+        self.host_name = host_name
+        self.host_port = host_port
+        self.endpoints = endpoints
+        self.backlog = backlog
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.scale_up_busy = scale_up_busy
+        self.scale_up_wait = scale_up_wait
+        self.worker_idle_timeout = worker_idle_timeout
+        self.scale_interval = scale_interval
+        self.public_folder = public_folder
+        self.bundle_path = bundle_path
+        self.lane_workers = lane_workers
+        self.lane_queue = lane_queue
+        self.idle_timeout = idle_timeout
+        self.head_timeout = head_timeout
+        self.body_timeout = body_timeout
+        self.send_timeout = send_timeout
+        self.max_line_bytes = max_line_bytes
+        self.max_headers = max_headers
+        self.max_header_bytes = max_header_bytes
+        self.max_body_bytes = max_body_bytes
+        self.max_queue_depth = max_queue_depth
+        self.max_queue_wait = max_queue_wait
+        self.max_active_conns = max_active_conns
+        self.retry_after = retry_after
+        self.event_streams = event_streams
+        self.event_buffer = event_buffer
+        self.event_policy = event_policy
+        self.event_heartbeat = event_heartbeat
+        self.store_shards = store_shards
+        self.store_sweep = store_sweep
+        self.capture_path = capture_path
+        self.capture_rate = capture_rate
+        self.stop_timeout = stop_timeout
+        self.cache_rules = cache_rules
+
+    def get_endpoints(self):
+        return self.endpoints if self.endpoints else [(self.host_name, self.host_port)]
+
+    def make_limits(self):
+        return ScanLimits(self.idle_timeout, self.head_timeout, self.body_timeout, self.send_timeout, self.max_line_bytes, self.max_headers, self.max_header_bytes, self.max_body_bytes)
+
+    def make_shedder(self):
+        if self.max_queue_depth is None and self.max_queue_wait is None and self.max_active_conns is None:
+            return None
+
+        return LoadShedder(self.max_queue_depth, self.max_queue_wait, self.max_active_conns, self.retry_after)
+
+    def make_recorder(self):
+        if self.capture_path is None:
+            return None
+
+        from utils.traffic import TrafficRecorder
+
+        return TrafficRecorder(self.capture_path, self.capture_rate)
+
+    def make_event_hub(self, shedder: LoadShedder = None, recorder = None):
+        if not self.event_streams:
+            return None
+
+        from core.broadcast import EventHub
+
+        hub_args = {"shedder": shedder, "recorder": recorder}
+
+        if self.event_buffer is not None:
+            hub_args["max_buffer"] = self.event_buffer
+
+        if self.event_policy is not None:
+            hub_args["slow_policy"] = self.event_policy
+
+        if self.event_heartbeat is not None:
+            hub_args["heartbeat"] = self.event_heartbeat
+
+        return EventHub(**hub_args)
+
+    def make_store(self):
+        from utils.kvstore import ShardedStore
+
+        store_args = {}
+
+        if self.store_shards is not None:
+            store_args["shard_count"] = self.store_shards
+
+        if self.store_sweep is not None:
+            store_args["sweep_interval"] = self.store_sweep if self.store_sweep > 0 else None
+
+        return ShardedStore(**store_args)
+
+    def make_cache_policy(self):
+        if not self.cache_rules:
+            return None
+
+        return make_cache_policy(self.cache_rules)
+
+def load_config(file_path: str):
+    """
+        @description Reads a JSON config file into a `TippyConfig`. Keys are `TippyConfig` argument names, plus the older `serveaddr`, `port` and `worker_count`. Missing keys keep their defaults, and a missing file gives the default config.
+    """
+    try:
+        with open(file_path, "r") as fs:
+            raw_config = json.load(fs)
+    except FileNotFoundError:
+        print(f'{__name__}: No config at {file_path}, using defaults')
+        return TippyConfig()
+
+    if not isinstance(raw_config, dict):
+        raise ValueError(f'{__name__}: {file_path} must hold a JSON object')
+
+    # NOTE: current key names win over the legacy ones they replace.
+    config_args = {name: value for key, value in raw_config.items() if key in CONFIG_LEGACY_KEYS for name in CONFIG_LEGACY_KEYS[key]}
+    config_args.update((key, value) for key, value in raw_config.items() if key not in CONFIG_LEGACY_KEYS)
+
+    try:
+        return TippyConfig(**config_args)
+    except TypeError as config_error:
+        raise ValueError(f'{__name__}: Bad config in {file_path}: {config_error}') from config_error
@@ -1,83 +1,269 @@
 """
     @file instance.py\n
     @summary Rewritten driver class for my HTTP/1.1 server, Tippy. This implementation supports thread pooling for concurrent connections.\n
-    @todo Fix constructor of `Tippy` class to accept a config dict!
     @author Derek Tan
 """
 
-from time import sleep
+from typing import TYPE_CHECKING
+from time import monotonic
 from queue import Queue
-from threading import Event, Thread
+from threading import Event, Lock, Thread
 
+from core.config import TippyConfig, TIPPY_VERSION_STRING, TIPPY_DEFAULT_HOST_NAME, TIPPY_DEFAULT_HOST_PORT, TIPPY_DEFAULT_BACKLOG, TIPPY_DEFAULT_WWW_DIR
 from core.producer import ConnProducer, producer_runnable
-from core.worker import ConnWorker, worker_runnable
+from core.worker import ConnWorker
+from core.pool import WorkerPool
+from core.lanes import RouteLane
+from core.overload import LoadShedder
+from http1.limits import ScanLimits
 
 from utils.rescache import ResourceCache
-from handlers.handcache import HandlerCache
+from handlers.handcache import HandlerCache, EXEC_CLASS_INLINE, EXEC_CLASS_SLOW
 from handlers.ctx.context import HandlerCtx
+from utils.profiling import ProfileHub
+
+if TYPE_CHECKING:
+    from utils.traffic import TrafficRecorder
+    from utils.kvstore import KeyValueStore
 
-TIPPY_VERSION_STRING = "Tippy/v0.5"
-TIPPY_DEFAULT_HOST_NAME = "localhost"
-TIPPY_DEFAULT_HOST_PORT = 8085
-TIPPY_DEFAULT_BACKLOG = 5
-TIPPY_DEFAULT_WWW_DIR = "./public"
-TIPPY_WORKER_COUNT = 2
 TIPPY_WORKER_NAME = 'tipster'
 
 class Tippy:
-    def __init__(self, server_name: str = TIPPY_VERSION_STRING, host_name: str = TIPPY_DEFAULT_HOST_NAME, host_port: int = TIPPY_DEFAULT_HOST_PORT, backlog:int = TIPPY_DEFAULT_BACKLOG, public_folder: str = TIPPY_DEFAULT_WWW_DIR):
+    """
+        @description The server: a producer thread accepting connections, a pool of workers serving them and the lanes, event hub and store around them.
+        @note Settings come from `config`, or when it is omitted from the loose arguments as before. Objects passed as `shedder`, `limits`, `recorder` or `store` override the ones the config would build. As a context manager, it runs the service on entry and stops it on exit.
+    """
+    def __init__(self, server_name: str = TIPPY_VERSION_STRING, host_name: str = TIPPY_DEFAULT_HOST_NAME, host_port: int = TIPPY_DEFAULT_HOST_PORT, backlog:int = TIPPY_DEFAULT_BACKLOG, public_folder: str = TIPPY_DEFAULT_WWW_DIR, bundle_path: str = None, shedder: LoadShedder = None, limits: ScanLimits = None, recorder: "TrafficRecorder" = None, event_buffer: int = None, event_policy: str = None, store: "KeyValueStore" = None, endpoints: list = None, config: TippyConfig = None):
+        if config is None:
+            config = TippyConfig(server_name=server_name, host_name=host_name, host_port=host_port, endpoints=endpoints, backlog=backlog, public_folder=public_folder, bundle_path=bundle_path, event_streams=event_buffer is not None or event_policy is not None, event_buffer=event_buffer, event_policy=event_policy)
+
         # Server data #
-        self.server_name = server_name
-        self.host_name = f'{host_name}:{host_port}'
-        self.resources = ResourceCache(public_folder)
+        self.config = config
+        self.server_name = config.server_name
+        self.resources = ResourceCache(config.public_folder, config.bundle_path)
         self.handlers = HandlerCache()
-        self.context = HandlerCtx(self.resources)
+        self.profiler = ProfileHub()
+        self.shedder = shedder if shedder is not None else config.make_shedder()
+        self.limits = limits if limits is not None else config.make_limits()
+        self.recorder = recorder if recorder is not None else config.make_recorder()
+        self.events = config.make_event_hub(self.shedder, self.recorder)
+        self.store = store
+        self.store_lock = Lock()
+        self.store_running = False
+        self.cache_policy = config.make_cache_policy()
+        self.context = HandlerCtx(self.resources, self.events, store, self.cache_policy, self.open_store)
+
+        # NOTE: cache rules are matched once per route here and in `set_handler`, never while serving.
+        if self.cache_policy is not None:
+            self.cache_policy.prepare_resources(self.resources)
 
         # Server concurrency #
-        self.shared_queue = Queue(backlog)
+        self.shared_queue = Queue(config.backlog)
         self.shared_eventer = Event()
+        self.ready_flag = Event()
+        self.stopped_flag = Event()
+
+        # NOTE routes not run inline go to a lane by their execution class. Workers share this dict, so `add_exec_class` works until `run_service`.
+        self.lanes: dict[str, RouteLane] = {}
+        self.add_exec_class(EXEC_CLASS_SLOW, config.lane_workers, config.lane_queue)
 
-        self.producer = ConnProducer((host_name, host_port), backlog)
-        self.workers: list[ConnWorker] = []
+        # NOTE: worker threads are only made by the pool in `run_service`, and later as load asks for them.
+        self.pool = WorkerPool(self.make_worker, self.shared_queue, self.shared_eventer, config.min_workers, config.max_workers, config.scale_up_busy, config.scale_up_wait, config.worker_idle_timeout, config.scale_interval, TIPPY_WORKER_NAME)
 
+        # NOTE: listeners bind here, last of all, so an ephemeral port is known before `run_service` and nothing above can fail with sockets left open.
+        self.producer = ConnProducer(config.get_endpoints(), config.backlog, self.shedder)
+        self.host_name = f'{config.host_name}:{self.get_port()}'
+
+        # NOTE: all service threads are daemons, so a server that is never stopped cannot keep the process alive. `stop_service` joins them.
         self.producer_thread = Thread(
             target=producer_runnable,
             name=f'top_{TIPPY_WORKER_NAME}',
-            args=(self.producer, self.shared_queue, self.shared_eventer)
+            args=(self.producer, self.shared_queue, self.shared_eventer),
+            daemon=True
         )
-        self.worker_threads: list[Thread] = []
-
-        # Latent thread creation... #
-        for i in range(0, TIPPY_WORKER_COUNT):
-            self.workers.append(ConnWorker(i, self.server_name, self.host_name, self.context, self.handlers))
-        
-        for thread_n in range(0, TIPPY_WORKER_COUNT):
-            self.worker_threads.append(
-                Thread(
-                    target=worker_runnable, name=f'{TIPPY_WORKER_NAME}{thread_n}',
-                    args=(self.workers[thread_n], self.shared_queue, self.shared_eventer)
-                )
-            )
-    
-    def set_handler(self, routes: list[str] = None, callback = None):
-        return self.handlers.add_handler(routes, callback) and self.resources.add_item_paths(routes)
+
+    def make_worker(self, worker_id: int):
+        return ConnWorker(worker_id, self.server_name, self.host_name, self.context, self.handlers, self.lanes, self.profiler, self.shedder, self.limits, self.recorder, self.config.retry_after)
+
+    def __enter__(self):
+        self.run_service()
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop_service()
+
+        return False
+
+    def get_addresses(self):
+        """
+            @description Gets the bound address of every listener, e.g. to find an ephemeral port.
+        """
+        return self.producer.get_addresses()
+
+    def get_port(self):
+        """
+            @description Gets the first bound TCP port, or `None` when listening only on Unix sockets.
+        """
+        for address in self.get_addresses():
+            if isinstance(address, tuple):
+                return address[1]
+
+        return None
+
+    def add_exec_class(self, name: str, max_workers: int, max_queue: int):
+        """
+            @description Adds or replaces an execution class: a lane of `max_workers` threads that queues at most `max_queue` requests before answering 503.
+        """
+        if name == EXEC_CLASS_INLINE:
+            raise ValueError(f'{__name__}: The {EXEC_CLASS_INLINE} class has no lane')
+
+        self.lanes[name] = RouteLane(name, max_workers, max_queue, self.context, self.shared_queue, self.shared_eventer, self.profiler, self.shedder, self.recorder)
+
+    def get_lane_stats(self):
+        return {name: lane.get_stats() for name, lane in self.lanes.items()}
+
+    def get_shed_stats(self):
+        """
+            @description Gets overload control counters, or `None` when this server runs without a `LoadShedder`.
+        """
+        if self.shedder is None:
+            return None
+
+        return self.shedder.get_stats()
+
+    def get_limit_stats(self):
+        """
+            @description Gets counts of connections cut off by each scanner limit.
+        """
+        return self.limits.get_stats()
+
+    def get_pool_stats(self):
+        """
+            @description Gets the worker pool's current, busy, peak and limit sizes, spawn and retire counts, and its latest scaling events as `(monotonic time, "up" or "down", new size, reason)`.
+        """
+        return self.pool.get_stats()
+
+    def open_store(self):
+        """
+            @description Gets the store behind `HandlerCtx.store`, building it from the config on first use. A store built while serving starts its expiry sweeps at once.
+        """
+        with self.store_lock:
+            if self.store is None:
+                self.store = self.config.make_store()
+
+                if self.store_running:
+                    self.store.start()
+
+            return self.store
+
+    def get_event_stats(self):
+        """
+            @description Gets event hub counters, or `None` when this server runs without event streams.
+        """
+        if self.events is None:
+            return None
+
+        return self.events.get_stats()
+
+    def publish(self, topic: str, data: str, event: str = None, event_id: str = None):
+        """
+            @description Pushes an event to every `SseHandler` stream subscribed to `topic`. Safe to call from any thread.
+        """
+        return self.context.publish(topic, data, event, event_id)
+
+    def set_handler(self, routes: list[str] = None, callback = None, exec_class: str = EXEC_CLASS_INLINE, methods: frozenset[str] = None):
+        """
+            @note Pass `exec_class=EXEC_CLASS_SLOW` (or a class from `add_exec_class`) for routes doing blocking I/O or heavy work, so they cannot hold up static files. Routes accept GET and HEAD unless `methods` (or the handler's `route_methods` attribute, as on `ProxyHandler`) says otherwise.
+        """
+        set_ok = self.handlers.add_handler(routes, callback, exec_class, methods) and self.resources.add_item_paths(routes)
+
+        if self.cache_policy is not None:
+            self.cache_policy.prepare_paths(routes, self.resources)
+
+        return set_ok
     
     def set_fallback_handler(self, fallback = None):
         self.handlers.set_fallback_handler(fallback)
 
-    def run_service(self):
-        # TODO Implement with 1 producer and n workers. Default to 2 workers.
+    def run_service(self, timeout: float = None):
+        """
+            @description Starts all service threads and waits until the producer is accepting. Returns whether it got ready within `timeout` seconds.
+        """
         # 1. Launch producer before workers.
         self.producer_thread.start()
 
-        sleep(0.010)
+        for lane in self.lanes.values():
+            lane.start()
+
+        if self.events is not None:
+            self.events.start()
+
+        with self.store_lock:
+            self.store_running = True
+
+            if self.store is not None:
+                self.store.start()
 
         # 2. Enjoy watching it serve your browser. :)
-        for worker_thread in self.worker_threads:
-            worker_thread.start()
-    
+        self.pool.start()
+
+        if not self.producer.ready_flag.wait(timeout):
+            return False
+
+        self.ready_flag.set()
+
+        return True
+
+    def wait_ready(self, timeout: float = None):
+        return self.ready_flag.wait(timeout)
+
+    def wait_stopped(self, timeout: float = None):
+        """
+            @description Blocks until `stop_service` finishes, e.g. to keep a main thread alive. Interruptible with CTRL+C.
+        """
+        return self.stopped_flag.wait(timeout)
+
     def stop_service(self):
+        """
+            @description Stops accepting, lets every thread finish and releases the listeners. Threads get `config.stop_timeout` seconds in total to exit.
+        """
+        if self.stopped_flag.is_set():
+            return
+
+        deadline = monotonic() + self.config.stop_timeout
         self.producer.soft_stop()
 
-        for worker in self.workers:
-            worker.cleanup()
+        # NOTE stop lanes first, as they hand kept-alive connections back to the workers.
+        for lane in self.lanes.values():
+            lane.stop(deadline)
+
+        for lane in self.lanes.values():
+            lane.join(max(0.0, deadline - monotonic()))
+
+        # NOTE the producer must be gone before the pool stops, as its accept loop clears the event workers wake on.
+        if self.producer_thread.is_alive():
+            self.producer_thread.join(max(0.0, deadline - monotonic()))
+
+        self.pool.stop(deadline)
+
+        self.producer.cleanup()
+
+        if self.events is not None:
+            self.events.stop()
+
+        with self.store_lock:
+            self.store_running = False
+
+            if self.store is not None:
+                self.store.cleanup()
+
+        self.handlers.cleanup()
+        self.profiler.cleanup()
+        self.resources.cleanup()
+
+        if self.recorder is not None:
+            self.recorder.cleanup()
+
+        self.ready_flag.clear()
+        self.stopped_flag.set()
@@ -0,0 +1,173 @@
+"""
+    @file lanes.py
+    @description Contains bounded thread lanes that run slow route handlers away from the connection workers.\n
+    @author Derek Tan
+"""
+
+from typing import TYPE_CHECKING
+from time import monotonic
+from threading import Event, Lock, Thread
+from socket import socket
+from queue import Queue, Empty, Full
+
+from http1.request import SimpleRequest
+from http1.sender import SimpleSender
+from handlers.ctx.context import HandlerCtx
+from utils.profiling import ProfileHub
+from core.overload import LoadShedder
+
+if TYPE_CHECKING:
+    from utils.traffic import TrafficRecorder
+
+LANE_DEFAULT_WORKERS = 4
+LANE_DEFAULT_QUEUE = 16
+
+class RouteLane:
+    """
+        @description An execution class for routes: a bounded job queue plus a fixed number of threads running the handlers.
+        @note A worker hands a whole connection to the lane along with its parsed request. Once the handler replies, a kept-alive connection goes back on the shared connection queue so the fast workers read its next request.
+    """
+    def __init__(self, name: str, max_workers: int, max_queue: int, context: HandlerCtx, conn_queue: Queue, conn_eventer: Event, profiler: ProfileHub = None, shedder: LoadShedder = None, recorder: "TrafficRecorder" = None):
+        if max_workers < 1 or max_queue < 1:
+            raise ValueError(f'{__name__}: Invalid lane limits {max_workers} / {max_queue}')
+
+        self.name = name
+        self.context = context
+        self.profiler = profiler if profiler is not None else ProfileHub()
+        self.shedder = shedder
+        self.recorder = recorder
+        self.conn_queue = conn_queue
+        self.conn_eventer = conn_eventer
+        self.jobs = Queue(max_queue)
+        self.stopping = False
+        self.threads = [Thread(target=self.run, name=f'{name}_lane{n}', daemon=True) for n in range(max_workers)]
+
+        # Stats:
+        self.stats_lock = Lock()
+        self.done_count = 0
+        self.rejected_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self, deadline: float = None):
+        """
+            @description Refuses new jobs and queues one stop item per lane thread behind the queued ones. Waits for queue room only until `deadline`, then closes the connections of the oldest queued jobs to make room, as threads stuck in slow handlers free none.
+        """
+        with self.stats_lock:
+            self.stopping = True
+
+        for _ in self.threads:
+            while True:
+                try:
+                    self.jobs.put(None, timeout=max(0.0, deadline - monotonic()) if deadline is not None else None)
+                    break
+                except Full:
+                    if not self.drop_job():
+                        return
+
+    def drop_job(self):
+        """
+            @description Closes the connection of the oldest queued job. Returns `False` when the queue only holds stop items.
+        """
+        try:
+            job = self.jobs.get_nowait()
+        except Empty:
+            return True
+
+        if job is None:
+            self.jobs.put_nowait(None)
+            return False
+
+        self.close_conn(job[2])
+
+        return True
+
+    def close_conn(self, client_sock: socket):
+        if self.recorder is not None:
+            self.recorder.note_close(client_sock)
+
+        client_sock.close()
+
+        if self.shedder is not None:
+            self.shedder.note_closed()
+
+    def join(self, timeout: float = None):
+        for thread in self.threads:
+            if thread.is_alive():
+                thread.join(timeout)
+
+    def submit(self, handler, client_sock: socket, client_addr, request: SimpleRequest, pending: bytes):
+        """
+            @description Queues a request for this lane, or returns `False` when the lane's queue is full or the lane is stopping.
+        """
+        # NOTE `stop` flips `stopping` under this lock too, so no job can be queued behind the stop items.
+        with self.stats_lock:
+            if self.stopping:
+                return False
+
+            try:
+                self.jobs.put_nowait((monotonic(), handler, client_sock, client_addr, request, pending))
+            except Full:
+                self.rejected_count += 1
+                return False
+
+        return True
+
+    def get_stats(self):
+        with self.stats_lock:
+            return {
+                "queued": self.jobs.qsize(),
+                "done": self.done_count,
+                "rejected": self.rejected_count,
+                "wait_avg": self.wait_total / self.done_count if self.done_count else 0.0,
+                "wait_max": self.wait_max
+            }
+
+    def run(self):
+        sender = SimpleSender()
+
+        while True:
+            job = self.jobs.get()
+
+            if job is None:
+                break
+
+            queued_time, handler, client_sock, client_addr, request, pending = job
+            wait_time = monotonic() - queued_time
+
+            with self.stats_lock:
+                self.done_count += 1
+                self.wait_total += wait_time
+                self.wait_max = max(self.wait_max, wait_time)
+
+            sender.attach(client_sock)
+            sender.set_cache_headers(self.context.get_cache_headers(request.path))
+            sender.set_resource(self.context.get_resource(request.path), request)
+            keep_conn = False
+
+            try:
+                if self.profiler.armed:
+                    handler_ok = self.profiler.profile_call(request.path, handler, self.context, request, sender)
+                else:
+                    handler_ok = handler(self.context, request, sender)
+
+                keep_conn = handler_ok and not request.before_close()
+            except Exception as lane_error:
+                print(f'{__name__}: Lane {self.name} handler error: {lane_error}')
+
+            # NOTE a detached connection now belongs to its handler, such as an event stream.
+            if sender.is_detached():
+                continue
+
+            sender.attach(None)
+
+            # NOTE once stopping, the workers may be gone too, so nothing would take the connection back.
+            if keep_conn and not self.stopping:
+                self.conn_queue.put((client_sock, client_addr, pending, monotonic()))
+                self.conn_eventer.set()
+            else:
+                self.close_conn(client_sock)
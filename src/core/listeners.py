@@ -0,0 +1,114 @@
+"""
+    @file listeners.py
+    @description Contains listening endpoints for the producer: TCP ports (IPv4, IPv6 or dual-stack) and Unix domain sockets for local reverse proxies.\n
+    @author Derek Tan
+"""
+
+import os
+import stat
+import socket
+
+LISTEN_DEFAULT_UNIX_MODE = 0o660
+LISTEN_UNIX_PREFIX = "unix:"
+
+class TcpEndpoint:
+    """
+        @description A TCP address to listen on. IPv6 hosts such as `::` also take IPv4 clients when `dualstack` is set and the platform supports it.
+    """
+    def __init__(self, host: str, port: int, dualstack: bool = True):
+        self.host = host
+        self.port = port
+        self.dualstack = dualstack
+
+    def open(self, backlog: int):
+        if ":" in self.host:
+            use_dualstack = self.dualstack and socket.has_dualstack_ipv6()
+            return socket.create_server((self.host, self.port), family=socket.AF_INET6, backlog=backlog, dualstack_ipv6=use_dualstack)
+
+        return socket.create_server((self.host, self.port), backlog=backlog)
+
+    def close(self, listener: socket.socket):
+        listener.close()
+
+    def __str__(self):
+        return f'[{self.host}]:{self.port}' if ":" in self.host else f'{self.host}:{self.port}'
+
+class UnixEndpoint:
+    """
+        @description A Unix domain socket path to listen on, given file permissions `mode` once bound. A stale socket file left by a crashed server is replaced, but one a live server still answers on is not.
+    """
+    def __init__(self, path: str, mode: int = LISTEN_DEFAULT_UNIX_MODE):
+        self.path = path
+        self.mode = mode
+        self.inode = None
+
+    def clear_stale(self):
+        try:
+            path_stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+
+        if not stat.S_ISSOCK(path_stat.st_mode):
+            raise OSError(f'{__name__}: {self.path} exists and is not a socket')
+
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+        try:
+            probe.connect(self.path)
+        except ConnectionRefusedError:
+            os.unlink(self.path)
+            return
+        finally:
+            probe.close()
+
+        raise OSError(f'{__name__}: Another server is listening on {self.path}')
+
+    def open(self, backlog: int):
+        self.clear_stale()
+
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+        try:
+            listener.bind(self.path)
+            os.chmod(self.path, self.mode)
+            listener.listen(backlog)
+        except OSError:
+            listener.close()
+            raise
+
+        self.inode = os.stat(self.path).st_ino
+
+        return listener
+
+    def close(self, listener: socket.socket):
+        listener.close()
+
+        # NOTE only remove the file if it is still ours and not a newer server's socket.
+        try:
+            if os.stat(self.path).st_ino == self.inode:
+                os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __str__(self):
+        return f'{LISTEN_UNIX_PREFIX}{self.path}'
+
+def parse_endpoint(spec):
+    """
+        @description Makes an endpoint from a `(host, port)` tuple, a `"unix:/path"` string, a `"host:port"` or `"[v6 host]:port"` string, or passes endpoint objects through.
+    """
+    if isinstance(spec, (TcpEndpoint, UnixEndpoint)):
+        return spec
+
+    if isinstance(spec, tuple):
+        return TcpEndpoint(spec[0], spec[1])
+
+    if spec.startswith(LISTEN_UNIX_PREFIX):
+        return UnixEndpoint(spec[len(LISTEN_UNIX_PREFIX) :])
+
+    host, _, port = spec.rpartition(":")
+
+    if not host or not port.isdigit():
+        raise ValueError(f'{__name__}: Invalid endpoint {spec}')
+
+    return TcpEndpoint(host.strip("[]"), int(port))
@@ -0,0 +1,100 @@
+"""
+    @file overload.py
+    @description Contains overload control for the accept thread: it turns away excess connections with a canned 503 reply instead of letting them queue.\n
+    @author Derek Tan
+"""
+
+from time import monotonic
+from threading import Lock
+from socket import socket, SHUT_RDWR
+from queue import Queue
+
+SHED_DEFAULT_RETRY_AFTER = 1
+SHED_WAIT_SMOOTHING = 0.2  # NOTE: weight of the newest sample in the queue wait moving average.
+
+SHED_REASON_QUEUE_DEPTH = "queue_depth"
+SHED_REASON_QUEUE_WAIT = "queue_wait"
+SHED_REASON_ACTIVE_CONNS = "active_conns"
+SHED_REASON_QUEUE_FULL = "queue_full"
+
+class LoadShedder:
+    """
+        @description Decides in the accept thread whether a new connection should be shed, and sheds it with a pre-built `503 Service Unavailable` plus `Retry-After` without reading its request.
+        @note Each threshold is optional: `max_queue_depth` caps connections waiting for a worker, `max_queue_wait` caps how long (in seconds) the oldest of them has waited and `max_active_conns` caps connections accepted but not yet closed.
+    """
+    def __init__(self, max_queue_depth: int = None, max_queue_wait: float = None, max_active_conns: int = None, retry_after: int = SHED_DEFAULT_RETRY_AFTER):
+        self.max_queue_depth = max_queue_depth
+        self.max_queue_wait = max_queue_wait
+        self.max_active_conns = max_active_conns
+        self.reply = f'HTTP/1.1 503 Service Unavailable\r\nRetry-After: {retry_after}\r\nContent-Length: 0\r\nConnection: Close\r\n\r\n'.encode(encoding="ascii")
+
+        self.lock = Lock()
+        self.active_conns = 0
+        self.queue_wait_avg = 0.0
+        self.shed_counts = {
+            SHED_REASON_QUEUE_DEPTH: 0,
+            SHED_REASON_QUEUE_WAIT: 0,
+            SHED_REASON_ACTIVE_CONNS: 0,
+            SHED_REASON_QUEUE_FULL: 0
+        }
+
+    def note_opened(self):
+        with self.lock:
+            self.active_conns += 1
+
+    def note_closed(self):
+        with self.lock:
+            self.active_conns -= 1
+
+    def note_queue_wait(self, wait_time: float):
+        with self.lock:
+            self.queue_wait_avg += SHED_WAIT_SMOOTHING * (wait_time - self.queue_wait_avg)
+
+    def check(self, queue_ref: Queue):
+        """
+            @description Gives the reason to shed a new connection, or `None` to admit it.
+        """
+        if self.max_active_conns is not None and self.active_conns >= self.max_active_conns:
+            return SHED_REASON_ACTIVE_CONNS
+
+        if self.max_queue_depth is not None and queue_ref.qsize() >= self.max_queue_depth:
+            return SHED_REASON_QUEUE_DEPTH
+
+        if self.max_queue_wait is not None:
+            # NOTE judge by the head of the queue: averages of finished waits lag behind, and stop updating once everything is shed.
+            with queue_ref.mutex:
+                oldest_item = queue_ref.queue[0] if queue_ref.queue else None
+
+            if oldest_item is not None and monotonic() - oldest_item[3] >= self.max_queue_wait:
+                return SHED_REASON_QUEUE_WAIT
+
+        return None
+
+    def shed(self, client_sock: socket, reason: str):
+        with self.lock:
+            self.shed_counts[reason] += 1
+
+        try:
+            client_sock.setblocking(False)
+            client_sock.send(self.reply)
+
+            # NOTE drain what already arrived so closing is less likely to reset the connection before the reply is read.
+            client_sock.recv(4096)
+        except OSError:
+            pass
+
+        try:
+            client_sock.shutdown(SHUT_RDWR)
+        except OSError:
+            pass
+
+        client_sock.close()
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "active_conns": self.active_conns,
+                "queue_wait_avg": self.queue_wait_avg,
+                "shed_total": sum(self.shed_counts.values()),
+                **{f'shed_{reason}': count for reason, count in self.shed_counts.items()}
+            }
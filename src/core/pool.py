@@ -0,0 +1,182 @@
+"""
+    @file pool.py
+    @description Contains the elastic pool of connection workers: it grows under load and shrinks back once workers sit idle.\n
+    @author Derek Tan
+"""
+
+from collections import deque
+from time import monotonic
+from threading import Event, Lock, Thread
+from queue import Queue, Full
+
+POOL_DEFAULT_MIN = 2
+POOL_DEFAULT_MAX = 16
+POOL_DEFAULT_UP_BUSY = 0.75
+POOL_DEFAULT_UP_WAIT = 0.005
+POOL_DEFAULT_IDLE_TIMEOUT = 10.0
+POOL_DEFAULT_INTERVAL = 0.02
+POOL_EVENT_LOG_SIZE = 64  # NOTE: only the latest scaling events are kept for stats.
+
+POOL_EVENT_UP = "up"
+POOL_EVENT_DOWN = "down"
+
+class WorkerPool:
+    """
+        @description Runs between `min_workers` and `max_workers` connection workers made by `make_worker(worker_id)`. A manager thread checks the pool every `check_interval` seconds and spawns workers when the busy ratio reaches `scale_up_busy` or the oldest queued connection has waited `scale_up_wait` seconds.
+        @note Workers retire themselves after waiting `idle_timeout` seconds for a connection, one at a time and never within `idle_timeout` of the last spawn. Growing fast and shrinking slowly keeps the pool from thrashing. With `min_workers == max_workers` there is no manager and workers never time out, as with the old fixed pool.
+    """
+    def __init__(self, make_worker, queue_ref: Queue, event_ref: Event, min_workers: int = POOL_DEFAULT_MIN, max_workers: int = POOL_DEFAULT_MAX, scale_up_busy: float = POOL_DEFAULT_UP_BUSY, scale_up_wait: float = POOL_DEFAULT_UP_WAIT, idle_timeout: float = POOL_DEFAULT_IDLE_TIMEOUT, check_interval: float = POOL_DEFAULT_INTERVAL, thread_prefix: str = "worker"):
+        if min_workers < 1 or max_workers < min_workers:
+            raise ValueError(f'{__name__}: Invalid pool limits {min_workers} / {max_workers}')
+
+        self.make_worker = make_worker
+        self.queue_ref = queue_ref
+        self.event_ref = event_ref
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.scale_up_busy = scale_up_busy
+        self.scale_up_wait = scale_up_wait
+        self.idle_timeout = idle_timeout if max_workers > min_workers else None
+        self.check_interval = check_interval
+        self.thread_prefix = thread_prefix
+
+        self.lock = Lock()
+        self.threads = {}  # NOTE: maps live workers to their threads.
+        self.next_id = 0
+        self.last_spawn_time = 0.0
+        self.stopping = False
+        self.stop_flag = Event()
+        self.manager_thread = Thread(target=self.run_manager, name=f'{thread_prefix}_pool', daemon=True)
+
+        # Stats:
+        self.peak_size = 0
+        self.spawned_count = 0
+        self.retired_count = 0
+        self.events = deque(maxlen=POOL_EVENT_LOG_SIZE)
+
+    def start(self):
+        with self.lock:
+            self.spawn(self.min_workers, None)
+
+        if self.idle_timeout is not None:
+            self.manager_thread.start()
+
+    def spawn(self, count: int, reason: str):
+        """
+            @note Call with the lock held.
+        """
+        for _ in range(count):
+            worker = self.make_worker(self.next_id)
+            worker.pool = self
+            worker_thread = Thread(target=worker.run, name=f'{self.thread_prefix}{self.next_id}', args=(self.queue_ref, self.event_ref), daemon=True)
+            self.threads[worker] = worker_thread
+            self.next_id += 1
+            worker_thread.start()
+
+        self.peak_size = max(self.peak_size, len(self.threads))
+
+        if reason is not None:
+            self.spawned_count += count
+            self.last_spawn_time = monotonic()
+            self.events.append((self.last_spawn_time, POOL_EVENT_UP, len(self.threads), reason))
+            print(f'{__name__}: Grew pool to {len(self.threads)} workers on {reason}')
+
+    def try_retire(self, worker, idle_time: float):
+        """
+            @description Called by a worker that waited `idle_time` seconds for a connection. Returns whether it should exit.
+        """
+        with self.lock:
+            now = monotonic()
+
+            if self.stopping or idle_time < self.idle_timeout or len(self.threads) <= self.min_workers or now - self.last_spawn_time < self.idle_timeout:
+                return False
+
+            del self.threads[worker]
+            self.retired_count += 1
+            self.events.append((now, POOL_EVENT_DOWN, len(self.threads), "idle"))
+
+        print(f'{__name__}: Retired worker {worker.id}, pool at {len(self.threads)}')
+
+        return True
+
+    def get_oldest_wait(self):
+        # NOTE peek at the queue head like the load shedder does. A stop item there counts as no wait.
+        with self.queue_ref.mutex:
+            oldest_item = self.queue_ref.queue[0] if self.queue_ref.queue else None
+
+        return monotonic() - oldest_item[3] if oldest_item is not None else 0.0
+
+    def check(self):
+        """
+            @description One manager step: grows the pool when it is saturated.
+        """
+        with self.lock:
+            if self.stopping:
+                return
+
+            size = len(self.threads)
+
+            if size >= self.max_workers:
+                return
+
+            # NOTE a worker holds its connection between keep-alive requests too, so a held socket counts as busy.
+            busy = sum(1 for worker in self.threads if worker.current_socket is not None)
+            queued = self.queue_ref.qsize()
+            oldest_wait = self.get_oldest_wait()
+
+            if oldest_wait >= self.scale_up_wait:
+                reason = "queue_wait"
+            elif busy >= size * self.scale_up_busy:
+                reason = "busy_ratio"
+            else:
+                return
+
+            # NOTE at least double the pool, as the producer queues one connection at a time and a burst's backlog waits unseen in the listener's accept queue.
+            self.spawn(min(max(queued, size), self.max_workers - size), reason)
+
+    def run_manager(self):
+        while not self.stop_flag.wait(self.check_interval):
+            self.check()
+
+    def stop(self, deadline: float):
+        """
+            @description Stops scaling, then asks every worker to exit and joins them until `deadline` (a `monotonic()` time).
+        """
+        with self.lock:
+            self.stopping = True
+            threads = list(self.threads.items())
+
+        self.stop_flag.set()
+
+        if self.manager_thread.is_alive():
+            self.manager_thread.join(max(0.0, deadline - monotonic()))
+
+        for worker, _ in threads:
+            worker.cleanup()
+
+        # NOTE wake workers parked on the event before queueing stop items, so they drain the bounded queue as it fills.
+        self.event_ref.set()
+
+        # NOTE one stop item per worker, even ones already gone, since any worker may take the item queued for another. Pooled workers also exit on their next wait timeout.
+        try:
+            for _ in threads:
+                self.queue_ref.put(None, timeout=max(0.0, deadline - monotonic()))
+        except Full:
+            print(f'{__name__}: Workers did not drain the queue in time')
+
+        for _, worker_thread in threads:
+            if worker_thread.is_alive():
+                worker_thread.join(max(0.0, deadline - monotonic()))
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "size": len(self.threads),
+                "busy": sum(1 for worker in self.threads if worker.current_socket is not None),
+                "min": self.min_workers,
+                "max": self.max_workers,
+                "peak": self.peak_size,
+                "spawned": self.spawned_count,
+                "retired": self.retired_count,
+                "events": list(self.events)
+            }
@@ -4,48 +4,163 @@
     @author Derek Tan
 """
 
+import selectors
+from time import monotonic
 from threading import Event
 from queue import Queue, Full
-from socket import create_server, socket
+from socket import socket, socketpair
+
+from core.overload import LoadShedder, SHED_REASON_QUEUE_FULL
+from core.listeners import parse_endpoint
 
 class ConnProducer:
-    def __init__(self, address_tuple: tuple[str, int], backlog_len: int) -> None:
+    """
+        @description Accepts connections from one or more endpoints with one selector-driven loop and queues them for the workers.
+        @note `endpoints` holds `(host, port)` tuples, `"host:port"` or `"unix:/path"` strings, or `TcpEndpoint` / `UnixEndpoint` objects.
+    """
+    def __init__(self, endpoints: list, backlog_len: int, shedder: LoadShedder = None) -> None:
         if backlog_len < 1:
             raise ValueError(f'{__name__}: Invalid socket backlog {backlog_len}')
 
-        self.host_info = address_tuple
-        self.server_socket = create_server(address=self.host_info, backlog=backlog_len)
+        if not endpoints:
+            raise ValueError(f'{__name__}: No endpoints to listen on')
+
+        self.endpoints = [parse_endpoint(spec) for spec in endpoints]
+        self.listeners: list[socket] = []
+        self.selector = selectors.DefaultSelector()
+        self.shedder = shedder
         self.is_listening = False
-    
-    def run(self, queue_ref: Queue, event_ref: Event):
+        self.ready_flag = Event()
+        self.ready: list[socket] = []
+
+        try:
+            for endpoint in self.endpoints:
+                listener = endpoint.open(backlog_len)
+                self.listeners.append(listener)
+
+                # NOTE a readable listener may have lost its connection to a client reset, so never let accept block.
+                listener.setblocking(False)
+                self.selector.register(listener, selectors.EVENT_READ, endpoint)
+        except OSError:
+            self.close_listeners()
+            self.selector.close()
+            raise
+
+        # NOTE: written to by `soft_stop` to wake the accept loop out of `select`.
+        self.wake_reader, self.wake_writer = socketpair()
+        self.selector.register(self.wake_reader, selectors.EVENT_READ, None)
         self.is_listening = True
-        print(f'{__name__}: Started listening at {self.host_info[0]}:{self.host_info[1]}')
+
+    def get_addresses(self):
+        return [listener.getsockname() for listener in self.listeners]
+
+    def close_listeners(self):
+        for endpoint, listener in zip(self.endpoints, self.listeners):
+            endpoint.close(listener)
+
+        self.listeners.clear()
+
+    def accept_next(self):
+        """
+            @description Waits until any endpoint has a pending connection and accepts it. Returns `None` once stopped.
+        """
+        while self.is_listening:
+            if not self.ready:
+                try:
+                    events = self.selector.select()
+                except (OSError, ValueError):
+                    return None
+
+                self.ready = [key.fileobj for key, _ in events if key.data is not None]
+                continue
+
+            try:
+                return self.ready.pop().accept()
+            except BlockingIOError:
+                continue
+            except OSError:
+                if not self.is_listening:
+                    return None
+
+                raise
+
+        return None
+
+    def run(self, queue_ref: Queue, event_ref: Event):
+        print(f'{__name__}: Started listening at {", ".join(str(endpoint) for endpoint in self.endpoints)}')
+        self.ready_flag.set()
+
+        if self.shedder is not None:
+            return self.run_shedding(queue_ref, event_ref)
 
         while self.is_listening:
             # Tell workers to wait until an item is placed.
             event_ref.clear()
 
-            try:
-                # First, listen for a new connection request.
-                connection_info = self.server_socket.accept()
+            # First, listen for a new connection request on any endpoint.
+            accepted = self.accept_next()
+
+            if accepted is None:
+                break
 
-                print(f'{__name__}: Accepted connection from {connection_info[1]}')
+            client_sock, client_addr = accepted
+
+            try:
+                print(f'{__name__}: Accepted connection from {client_addr}')
 
                 # Try to put the connection as a new task tuple on the queue. Wait until the queue has space.
-                queue_ref.put(item=connection_info)
+                queue_ref.put(item=(client_sock, client_addr, b'', monotonic()))
             except Full as queue_error:
-                connection_info[0].close()
+                client_sock.close()
                 print(f'{__name__}: Failed to queue client connection with error: {queue_error}')
                 continue
             
             # Tell workers to wake up.
             event_ref.set()
             queue_ref.join()
-    
+
+    def run_shedding(self, queue_ref: Queue, event_ref: Event):
+        """
+            @description Accept loop for overload control: never blocks on the queue, and answers connections over the shedder's limits right away.
+        """
+        # NOTE workers block on the queue itself here, since this loop never waits for them to drain it.
+        event_ref.set()
+
+        while self.is_listening:
+            accepted = self.accept_next()
+
+            if accepted is None:
+                break
+
+            client_sock, client_addr = accepted
+            shed_reason = self.shedder.check(queue_ref)
+
+            if shed_reason is None:
+                try:
+                    queue_ref.put_nowait((client_sock, client_addr, b'', monotonic()))
+                except Full:
+                    shed_reason = SHED_REASON_QUEUE_FULL
+
+            if shed_reason is not None:
+                self.shedder.shed(client_sock, shed_reason)
+                continue
+
+            self.shedder.note_opened()
+            print(f'{__name__}: Accepted connection from {client_addr}')
+
     def soft_stop(self):
         self.is_listening = False
-        self.server_socket.close()
+        self.wake_writer.send(b"\0")
+        self.close_listeners()
         print(f'{__name__}: Stopped producer.')
 
+    def cleanup(self):
+        """
+            @description Releases the selector and wake sockets once the accept loop has exited.
+        """
+        self.selector.close()
+        self.wake_reader.close()
+        self.wake_writer.close()
+
 def producer_runnable(producer_ref: ConnProducer, queue_ref: Queue, event_ref: Event):
     producer_ref.run(queue_ref, event_ref)
@@ -4,17 +4,25 @@
     @author Derek Tan
 """
 
+from typing import TYPE_CHECKING
 from calendar import timegm
-from time import gmtime
+from time import gmtime, monotonic
 from threading import Event
-from socket import socket
-from queue import Queue
+from socket import socket, SHUT_RDWR
+from queue import Queue, Empty
 
 from http1.request import SimpleRequest
 from http1.scanner import HttpScanner
+from http1.limits import ScanLimits, ScanLimitError
 from http1.sender import SimpleSender, RES_ERR_BODY
 from handlers.ctx.context import HandlerCtx
-from handlers.handcache import HandlerCache
+from handlers.handcache import HandlerCache, EXEC_CLASS_INLINE
+from core.lanes import RouteLane
+from core.overload import LoadShedder, SHED_DEFAULT_RETRY_AFTER
+from utils.profiling import ProfileHub
+
+if TYPE_CHECKING:
+    from utils.traffic import TrafficRecorder
 
 WORKER_ST_IDLE = 0
 WORKER_ST_CONSUME = 1
@@ -26,24 +34,32 @@ WORKER_ST_RESET = 6
 WORKER_ST_END = 7
 
 class ConnWorker:
-    def __init__(self, _id: int, server_name: str, host_name: str, worker_context: HandlerCtx, handlers: HandlerCache) -> None:
+    def __init__(self, _id: int, server_name: str, host_name: str, worker_context: HandlerCtx, handlers: HandlerCache, lanes: dict[str, RouteLane] = None, profiler: ProfileHub = None, shedder: LoadShedder = None, limits: ScanLimits = None, recorder: "TrafficRecorder" = None, retry_after: int = SHED_DEFAULT_RETRY_AFTER) -> None:
         self.id = _id
         self.state = WORKER_ST_IDLE
         self.server_name = server_name
         self.host_name = host_name
         self.current_socket = None
-        self.scanner = None
-        self.sender = None
-        self.temp_request = None
+        self.current_addr = None
+        # NOTE: the scanner, sender and request are reused for every connection and request this worker serves.
+        self.scanner = HttpScanner(limits=limits, recorder=recorder)
+        self.sender = SimpleSender()
+        self.temp_request = SimpleRequest()
         self.handlers = handlers
+        self.lanes = lanes if lanes is not None else {}
+        self.profiler = profiler if profiler is not None else ProfileHub()
+        self.shedder = shedder
+        self.limits = limits
+        self.recorder = recorder
+        self.retry_after = retry_after
         self.context = worker_context
+        self.stopping = False
+        self.pool = None  # NOTE: set by an elastic `WorkerPool`, which this worker may retire from while idle.
     
-    def should_send_update(self):
-        resource_ref = self.context.get_resource(self.temp_request.path)
-
-        # Check if the resource exists to be checked by caching time.
+    def should_send_update(self, resource_ref):
+        # Dynamic routes such as proxies have no static resource to compare, so always let their handlers run.
         if resource_ref is None:
-            return False
+            return True
         
         # Compute if the resource hits the cache by time diffs.
         resource_modify_time = resource_ref.get_modify_date()
@@ -54,17 +70,43 @@ class ConnWorker:
     def do_consume(self, queue_ref: Queue[tuple], event_ref: Event):
         print(f'{__name__}: Worker {self.id} awaiting work.')
 
-        # Wait for the producer to signal that work is available...
-        event_ref.wait()
+        idle_timeout = self.pool.idle_timeout if self.pool is not None else None
+        idle_start = monotonic()
+
+        while True:
+            # Wait for the producer to signal that work is available, then get the work item: connections handed back by a lane also carry their already buffered bytes.
+            try:
+                if event_ref.wait(idle_timeout):
+                    work_item = queue_ref.get(timeout=idle_timeout)
+                    break
+            except Empty:
+                pass
+
+            # NOTE only pooled workers time out of their waits. They exit once the pool is stopping, and may retire when idle for long enough.
+            if self.stopping or self.pool.try_retire(self, monotonic() - idle_start):
+                return WORKER_ST_END
 
         print(f'{__name__}: Worker {self.id} woke up.')
 
-        # Get the work item.
-        client_sock, client_addr = queue_ref.get()
+        if work_item is None:
+            queue_ref.task_done()
+            return WORKER_ST_END
+
+        client_sock, client_addr, pending, queued_time = work_item
+
+        # NOTE connections still queued at shutdown are closed rather than served.
+        if self.stopping:
+            self.current_socket = client_sock
+            queue_ref.task_done()
+            return WORKER_ST_RESET
+
+        if self.shedder is not None:
+            self.shedder.note_queue_wait(monotonic() - queued_time)
 
         self.current_socket = client_sock
-        self.scanner = HttpScanner(self.current_socket.makefile('r'))
-        self.sender = SimpleSender(self.current_socket.makefile('wb'))
+        self.current_addr = client_addr
+        self.scanner.attach(self.current_socket, pending)
+        self.sender.attach(self.current_socket)
 
         print(f'{__name__}@worker {self.id}: Consumed client connection with {client_addr}')
 
@@ -73,9 +115,31 @@ class ConnWorker:
         return WORKER_ST_RECV
 
     def do_recieve(self):
-        self.temp_request = self.scanner.next_request()
+        try:
+            self.scanner.next_request(self.temp_request)
+        except ScanLimitError as limit_error:
+            return self.do_cut_off(limit_error)
+        except ConnectionError:
+            # NOTE clients closing idle keep-alive connections is routine, not an error.
+            return WORKER_ST_RESET
 
         return WORKER_ST_HANDLE
+
+    def do_cut_off(self, limit_error: ScanLimitError):
+        """
+            @description Drops a connection that broke a scanner limit, replying first unless it merely idled out.
+        """
+        if self.limits is not None:
+            self.limits.note_cut(limit_error.kind)
+
+        if limit_error.status is not None:
+            self.sender.send_heading(limit_error.status)
+            self.sender.send_header("Date", self.context.get_gmt_str())
+            self.sender.send_header("Server", self.server_name)
+            self.sender.send_header("Connection", "Close")
+            self.sender.send_body(RES_ERR_BODY, "*/*", None)
+
+        return WORKER_ST_RESET
     
     def do_handle(self):
         # Validate all important headers I can to check which requests are malformed.
@@ -83,45 +147,101 @@ class ConnWorker:
             return self.do_good_handle()
         
         # Send error replies on malformed HTTP/1.1 responses: deal with lack of 'Host: ...' for now.
-        return self.do_bad_handle()
+        return self.do_bad_handle("400")
     
     def do_good_handle(self):
-        req_method_ok = self.temp_request.method_supported()
+        route_methods = self.handlers.get_methods(self.temp_request.path)
+        req_method_ok = self.temp_request.method in route_methods if route_methods is not None else self.temp_request.method_supported()
 
         if not req_method_ok:
             return self.do_bad_handle("501")
         
-        if not self.should_send_update():
+        resource_ref = self.context.get_resource(self.temp_request.path)
+
+        # NOTE If-None-Match takes precedence over the modify date check. A client may hold either the plain or the gzip variant.
+        if resource_ref is not None:
+            for encoding in (None, "gzip"):
+                resource_etag = resource_ref.get_etag(encoding)
+
+                if resource_etag is not None and self.temp_request.matches_etag(resource_etag):
+                    return self.do_bad_handle("304", {"ETag": resource_etag})
+
+        if not self.should_send_update(resource_ref):
             return self.do_bad_handle("304")
         
         req_is_last = self.temp_request.before_close()
 
         handler_ref = self.handlers.get_handler(self.temp_request.path)
+        exec_class = self.handlers.get_exec_class(self.temp_request.path)
+
+        if exec_class != EXEC_CLASS_INLINE:
+            return self.do_hand_off(handler_ref, exec_class)
+
+        self.sender.set_cache_headers(self.context.get_cache_headers(self.temp_request.path))
+        self.sender.set_resource(resource_ref, self.temp_request)
+        # NOTE the profiler costs a single flag check unless a capture is armed. Only the thread running the handler profiles it, so a lane route counts once.
+        if self.profiler.armed:
+            handler_ok = self.profiler.profile_call(self.temp_request.path, handler_ref, self.context, self.temp_request, self.sender)
+        else:
+            handler_ok = handler_ref(self.context, self.temp_request, self.sender)
+
+        # NOTE handlers such as event streams may take the connection over, so just let go of it.
+        if self.sender.is_detached():
+            return self.do_release()
 
         # NOTE handlers only fail on bad I/O operations... Reset connection in this case too so no malformed replies are sent back easily.
-        if not handler_ref(self.context, self.temp_request, self.sender) or req_is_last:
+        if not handler_ok or req_is_last:
             return WORKER_ST_RESET
 
         return WORKER_ST_REDO
 
-    def do_bad_handle(self, http_status: str):
-        error_reply_top_ok = self.sender.send_heading(http_status)
+    def do_hand_off(self, handler_ref, exec_class: str):
+        """
+            @description Passes the connection and its current request to the route's lane so this worker can go serve other connections.
+        """
+        lane = self.lanes.get(exec_class)
+        pending = self.scanner.take_pending()
+
+        # NOTE shed the request when its lane is saturated rather than letting slow routes pile up on the workers. Like the accept-time shedding, the client is told when to retry and its connection is closed.
+        if lane is None or not lane.submit(handler_ref, self.current_socket, self.current_addr, self.temp_request.copy(), pending):
+            self.scanner.attach(self.current_socket, pending)
+            return self.do_bad_handle("503", {"Retry-After": str(self.retry_after)}, True)
+
+        return self.do_release()
+
+    def do_release(self):
+        """
+            @description Forgets the current connection without closing it, as its new owner does that.
+        """
+        self.current_socket = None
+        self.current_addr = None
+        self.scanner.attach(None)
+        self.sender.attach(None)
+
+        return WORKER_ST_CONSUME
+
+    def do_bad_handle(self, http_status: str, extra_headers: dict = None, must_close: bool = False):
+        req_is_last = must_close or self.temp_request.before_close()
+
+        self.sender.send_heading(http_status)
+
+        if extra_headers is not None:
+            for header_name, header_value in extra_headers.items():
+                self.sender.send_header(header_name, header_value)
 
-        # A write error likely means the connection is poor or dead... Reset the socket to encourage a reconnect.
-        if not error_reply_top_ok:
-            return WORKER_ST_RESET
-        
         # Send common headers before 'Connection' header for cleaner control flow.
         self.sender.send_header("Date", self.context.get_gmt_str())
         self.sender.send_header("Server", self.server_name)
         
         # Also respect client wishes to close the connection for protocol courtesy.
-        if self.temp_request.before_close():
+        if req_is_last:
             self.sender.send_header("Connection", "Close")
         else:
             self.sender.send_header("Connection", "Keep-Alive")
-        
-        self.sender.send_body(RES_ERR_BODY, "*/*", None)
+
+        # A write error likely means the connection is poor or dead... Reset the socket to encourage a reconnect.
+        if not self.sender.send_body(RES_ERR_BODY, "*/*", None) or req_is_last:
+            return WORKER_ST_RESET
 
         return WORKER_ST_REDO
     
@@ -131,24 +251,34 @@ class ConnWorker:
         return WORKER_ST_RECV
     
     def do_reset(self):
-        self.current_socket.close()
-        self.scanner.reset()
-        self.scanner = None
-        self.sender = None
+        if self.current_socket is not None:
+            if self.recorder is not None:
+                self.recorder.note_close(self.current_socket)
+
+            self.current_socket.close()
+            self.current_socket = None
+            self.current_addr = None
+
+            if self.shedder is not None:
+                self.shedder.note_closed()
+
+        self.scanner.attach(None)
+        self.sender.attach(None)
 
         return WORKER_ST_CONSUME
 
     def cleanup(self):
-        self.state = WORKER_ST_END
+        """
+            @description Asks a running worker to stop: a connection it is blocked on gets shut down, then it exits on taking a `None` stop item off the queue.
+        """
+        self.stopping = True
+        client_sock = self.current_socket
 
-        if self.current_socket is not None:
-            self.current_socket.close()
-
-        self.scanner = None
-        self.sender = None
-        self.handlers = None
-        self.context = None
-        print(f'{__name__}: Stopped worker {self.id}')
+        if client_sock is not None:
+            try:
+                client_sock.shutdown(SHUT_RDWR)
+            except OSError:
+                pass  # NOTE the worker may have closed it meanwhile.
 
     def do_next(self, queue_ref: Queue[tuple], event_ref: Event):
         if self.state == WORKER_ST_IDLE:
@@ -177,5 +307,4 @@ class ConnWorker:
                 print(f'{__name__}: Worker error: {serve_error}')
                 self.state = WORKER_ST_ERROR
 
-def worker_runnable(worker_ref: ConnWorker, queue_ref: Queue[tuple], event_ref: Event):
-    worker_ref.run(queue_ref, event_ref)
+        print(f'{__name__}: Stopped worker {self.id}')
@@ -0,0 +1,65 @@
+"""
+    @file admin.py
+    @description Admin handler for toggling the profiler of a running server over HTTP.
+    @author Derek Tan
+"""
+
+from http1.request import SimpleRequest
+from http1.sender import SimpleSender, RES_GET_BODY, RES_HEAD_BODY
+from handlers.ctx.context import HandlerCtx
+from utils.profiling import ProfileHub, PROFILE_DEFAULT_REQUESTS
+
+PROFILE_ADMIN_PREFIX = "/_admin/profile"
+PROFILE_ADMIN_ROUTES = [
+    f'{PROFILE_ADMIN_PREFIX}/cprofile',
+    f'{PROFILE_ADMIN_PREFIX}/sampler',
+    f'{PROFILE_ADMIN_PREFIX}/tracemalloc'
+]
+
+class ProfileAdminHandler:
+    """
+        @description Handles `PROFILE_ADMIN_ROUTES`: `.../cprofile` arms a cProfile capture, `.../sampler` toggles the stack sampler and `.../tracemalloc` toggles allocation tracing. Not registered by default, since anyone reaching these routes can slow the server down.
+        @note Pass `route` to profile only one route with each cProfile capture.
+    """
+    def __init__(self, hub: ProfileHub, request_count: int = PROFILE_DEFAULT_REQUESTS, route: str = None):
+        self.hub = hub
+        self.request_count = request_count
+        self.route = route
+
+    def run_action(self, path: str):
+        action = path[len(PROFILE_ADMIN_PREFIX) + 1 :]
+
+        if action == "cprofile":
+            if not self.hub.arm_cprofile(self.request_count, self.route):
+                return "cprofile capture already running"
+
+            return f'cprofile armed for {self.request_count} requests'
+        elif action == "sampler":
+            out_path = self.hub.toggle_sampler()
+            return f'sampler stopped, wrote {out_path}' if out_path else "sampler started"
+        elif action == "tracemalloc":
+            out_path = self.hub.toggle_tracemalloc()
+            return f'tracemalloc stopped, wrote {out_path}' if out_path else "tracemalloc started"
+
+        return "unknown action"
+
+    def __call__(self, context: HandlerCtx, request: SimpleRequest, response: SimpleSender):
+        # NOTE HEAD must stay side-effect free, so only GET runs the action.
+        body_data = b''
+
+        if request.method == "GET":
+            body_data = f'{self.run_action(request.path)}\n'.encode(encoding="ascii")
+
+        response.send_heading("200")
+        response.send_header("Date", context.get_gmt_str())
+        response.send_header("Cache-Control", "no-store")
+
+        if request.before_close():
+            response.send_header("Connection", "Close")
+        else:
+            response.send_header("Connection", "Keep-Alive")
+
+        if request.method == "HEAD":
+            return response.send_body(RES_HEAD_BODY, "text/plain", body_data)
+
+        return response.send_body(RES_GET_BODY, "text/plain", body_data)
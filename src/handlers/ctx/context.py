@@ -4,15 +4,79 @@
 """
 
 import time
+from threading import Lock
+from typing import TYPE_CHECKING
 import utils.rescache as resources
+from utils.cachepolicy import CachePolicy
+
+if TYPE_CHECKING:
+    from core.broadcast import EventHub
+    from utils.kvstore import KeyValueStore
+
+CTX_ATTR_MISSING = object()
+
+class StoreAttributes:
+    """
+        @description Dict-style view of a store, so handlers written against the old `HandlerCtx.attributes` dict keep working. Each operation is atomic on its own, but read-modify-write sequences are not: use `store.incr` or `store.update` for those.
+    """
+    def __init__(self, store: "KeyValueStore"):
+        self.store = store
+
+    def __getitem__(self, name):
+        value = self.store.get(name, CTX_ATTR_MISSING)
+
+        if value is CTX_ATTR_MISSING:
+            raise KeyError(name)
+
+        return value
+
+    def __setitem__(self, name, data):
+        self.store.set(name, data)
+
+    def __delitem__(self, name):
+        if not self.store.delete(name):
+            raise KeyError(name)
+
+    def __contains__(self, name):
+        return self.store.get(name, CTX_ATTR_MISSING) is not CTX_ATTR_MISSING
+
+    def get(self, name, default = None):
+        return self.store.get(name, default)
+
+def make_default_store():
+    from utils.kvstore import ShardedStore
+
+    return ShardedStore()
 
 class HandlerCtx:
     """
         @description Encapsulates reusable data and functions for any application handler.
+        @note Without a `store`, one is made by `open_store` when a handler first touches `store` or `attributes`, so servers whose handlers keep no state never load the store module.
     """
-    def __init__(self, rescache: resources.ResourceCache):
+    def __init__(self, rescache: resources.ResourceCache, events: "EventHub" = None, store: "KeyValueStore" = None, cache_policy: CachePolicy = None, open_store = None):
         self.resources = rescache
-        self.attributes = {}
+        self.cache_policy = cache_policy
+        self.events = events
+        self.open_store = open_store if open_store is not None else make_default_store
+        self.store_lock = Lock()
+
+        # NOTE: handlers run on many threads at once, so shared state lives in a store with atomic operations such as `store.incr` and `store.compare_and_set`.
+        if store is not None:
+            self.attributes = StoreAttributes(store)
+            self.store = store
+
+    def __getattr__(self, name):
+        # NOTE: only reached while `store` is unset, as afterwards both names are plain attributes.
+        if name not in ("store", "attributes"):
+            raise AttributeError(name)
+
+        with self.store_lock:
+            if "store" not in self.__dict__:
+                store = self.open_store()
+                self.attributes = StoreAttributes(store)
+                self.store = store
+
+        return self.__dict__[name]
 
     def get_gmt_str(self):
         """
@@ -37,8 +101,26 @@ class HandlerCtx:
     def get_resource(self, name):
         return self.resources.get_item(name)
 
-    def set_attr(self, name, data):
-        self.attributes[name] = data
+    def get_cache_headers(self, name):
+        """
+            @description Gets the resolved client cache headers for a request path, or `None` without a matching rule.
+        """
+        if self.cache_policy is None:
+            return None
+
+        return self.cache_policy.lookup(name, self.resources)
+
+    def publish(self, topic: str, data: str, event: str = None, event_id: str = None):
+        """
+            @description Pushes an event to the event stream subscribers of `topic`. Returns how many subscribers it was queued for.
+        """
+        if self.events is None:
+            return 0
+
+        return self.events.publish(topic, data, event, event_id)
+
+    def set_attr(self, name, data, ttl: float = None):
+        self.store.set(name, data, ttl)
 
-    def get_attr(self, name):
-        self.attributes.get(name)
+    def get_attr(self, name, default = None):
+        return self.store.get(name, default)
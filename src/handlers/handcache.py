@@ -3,13 +3,22 @@
     @author Derek Tan
 """
 
+# Execution classes: inline routes run on the connection worker itself, any other class names a `RouteLane`.
+EXEC_CLASS_INLINE = "inline"
+EXEC_CLASS_SLOW = "slow"
+
 class HandlerCache:
     def __init__(self):
         self.path_table = {}
         self.handlers = []
+        self.exec_classes = []
+        self.method_sets = []
         self.fallback = None
 
-    def add_handler(self, paths: list[str], handler=None):
+    def add_handler(self, paths: list[str], handler=None, exec_class: str = EXEC_CLASS_INLINE, methods: frozenset[str] = None):
+        """
+            @note `methods` are the request methods the route accepts, by default the handler's own `route_methods` attribute if it has one, else `HTTP_METHODS` (GET and HEAD). Workers answer 501 to the rest before the handler runs.
+        """
         if not handler or not paths:
             return False
 
@@ -17,6 +26,8 @@ class HandlerCache:
             return False
 
         self.handlers.append(handler)
+        self.exec_classes.append(exec_class)
+        self.method_sets.append(methods if methods is not None else getattr(handler, "route_methods", None))
         new_index = len(self.handlers) - 1
 
         for path in paths:
@@ -32,5 +43,34 @@ class HandlerCache:
 
         return self.handlers[handler_index]
     
+    def get_exec_class(self, path: str):
+        handler_index = self.path_table.get(path)
+
+        if handler_index is None:
+            return EXEC_CLASS_INLINE
+
+        return self.exec_classes[handler_index]
+
+    def get_methods(self, path: str):
+        """
+            @description Gets the route's accepted methods, or `None` for the default `HTTP_METHODS`.
+        """
+        handler_index = self.path_table.get(path)
+
+        if handler_index is None:
+            return None
+
+        return self.method_sets[handler_index]
+
     def set_fallback_handler(self, fallback = None):
         self.fallback = fallback
+
+    def cleanup(self):
+        """
+            @description Lets handlers holding their own resources, such as a `ProxyHandler`'s pooled connections, release them on shutdown.
+        """
+        for handler in self.handlers:
+            handler_cleanup = getattr(handler, "cleanup", None)
+
+            if handler_cleanup is not None:
+                handler_cleanup()
@@ -0,0 +1,303 @@
+"""
+    @file microcache.py
+    @description Opt-in micro-caching of dynamic handler responses, with single-flight misses and stale-while-revalidate.
+    @author Derek Tan
+"""
+
+from collections import OrderedDict
+from threading import Event, Lock, Thread
+from time import monotonic
+
+import http1.consts as consts
+from http1.request import SimpleRequest
+from http1.sender import SimpleSender, SENDER_CACHEABLE_STATUSES
+from handlers.ctx.context import HandlerCtx
+
+MICROCACHE_DEFAULT_MAX_BYTES = 8 * 1024 * 1024
+MICROCACHE_DEFAULT_TTL = 1.0
+MICROCACHE_DEFAULT_STALE_TTL = 0.0
+MICROCACHE_DEFAULT_WAIT = 5.0
+MICROCACHE_ENTRY_OVERHEAD = 256  # NOTE: rough per-entry bookkeeping cost counted against the memory budget.
+MICROCACHE_STATUSES = frozenset((200, 203, 204, 301, 404, 410))
+
+def takes_cache_policy(head: bytes):
+    """
+        @description Checks whether a captured response head should get the route's cache policy headers, as `SimpleSender.send_body` would have added them: the status must be cacheable and the handler must not have sent its own `Cache-Control`.
+    """
+    status_tokens = head[0 : head.find(consts.HTTP_ENDL_BYTES)].split(b' ', 2)
+
+    if len(status_tokens) < 2 or status_tokens[1].decode(encoding="latin-1") not in SENDER_CACHEABLE_STATUSES:
+        return False
+
+    return b'\r\ncache-control:' not in head.lower()
+
+class CaptureSender(SimpleSender):
+    """
+        @description Sender that records a handler's whole response in memory instead of writing it to a socket.
+    """
+    def __init__(self):
+        super().__init__(None)
+        self.captured = bytearray()
+
+    def flush(self, body_data: bytes = None):
+        self.captured += self.out_buffer
+
+        if body_data:
+            self.captured += body_data
+
+        self.out_buffer.clear()
+
+        return True
+
+class CacheEntry:
+    __slots__ = ("head", "body", "size", "fresh_until", "stale_until", "takes_policy")
+
+    def __init__(self, head: bytes, body: bytes, fresh_until: float, stale_until: float):
+        self.head = head
+        self.body = body
+        self.takes_policy = takes_cache_policy(head)
+        self.size = len(head) + len(body) + MICROCACHE_ENTRY_OVERHEAD
+        self.fresh_until = fresh_until
+        self.stale_until = stale_until
+
+class Flight:
+    """
+        @description One in-progress handler run that other requests for the same key wait on.
+    """
+    __slots__ = ("done", "entry")
+
+    def __init__(self):
+        self.done = Event()
+        self.entry = None
+
+class MicroCache:
+    """
+        @description Shared LRU store of captured responses under one memory budget. Several `CachedHandler`s may share one store.
+    """
+    def __init__(self, max_bytes: int = MICROCACHE_DEFAULT_MAX_BYTES, max_entry_bytes: int = None):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes if max_entry_bytes is not None else max_bytes // 8
+        self.entries: OrderedDict[tuple, CacheEntry] = OrderedDict()
+        self.flights: dict[tuple, Flight] = {}
+        self.used_bytes = 0
+        self.lock = Lock()
+
+        # Stats:
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def lookup(self, key: tuple, now: float):
+        """
+            @description Finds a usable entry and joins or starts a flight for the key if it needs refreshing.
+            @returns `(entry, flight, is_leader)`: the entry is `None` on a miss. The caller must run the handler and call `finish` when `is_leader` is set.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is not None:
+                if now < entry.fresh_until:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return entry, None, False
+
+                if now < entry.stale_until:
+                    self.entries.move_to_end(key)
+                    self.stale_hits += 1
+
+                    # NOTE only the first stale hit revalidates, the rest keep serving the stale copy meanwhile.
+                    if key in self.flights:
+                        return entry, None, False
+
+                    flight = Flight()
+                    self.flights[key] = flight
+                    return entry, flight, True
+
+                self.drop(key)
+
+            flight = self.flights.get(key)
+
+            if flight is not None:
+                self.coalesced += 1
+                return None, flight, False
+
+            self.misses += 1
+            flight = Flight()
+            self.flights[key] = flight
+
+            return None, flight, True
+
+    def finish(self, key: tuple, flight: Flight, entry: CacheEntry):
+        """
+            @description Ends a flight, storing its entry if there is one, and wakes up any waiters.
+        """
+        with self.lock:
+            self.flights.pop(key, None)
+
+            if entry is not None and entry.size <= self.max_entry_bytes:
+                self.drop(key)
+                self.entries[key] = entry
+                self.used_bytes += entry.size
+
+                while self.used_bytes > self.max_bytes:
+                    self.drop(next(iter(self.entries)))
+                    self.evictions += 1
+
+        flight.entry = entry
+        flight.done.set()
+
+    def drop(self, key: tuple):
+        old_entry = self.entries.pop(key, None)
+
+        if old_entry is not None:
+            self.used_bytes -= old_entry.size
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "used_bytes": self.used_bytes,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions
+            }
+
+class CachedHandler:
+    """
+        @description Wraps a handler so its responses are reused for `ttl` seconds, e.g. `server.set_handler(["/stats"], CachedHandler(handle_stats, ttl=1.0))`.
+        @note Keys are the method, path and the values of the `vary` request headers. Concurrent misses on one key run the handler once. For `stale_ttl` seconds past expiry, the stale copy keeps being served while one background run refreshes it. Responses with an uncacheable status or a `no-store` / `private` Cache-Control are passed through but never stored.
+    """
+    def __init__(self, handler, ttl: float = MICROCACHE_DEFAULT_TTL, stale_ttl: float = MICROCACHE_DEFAULT_STALE_TTL, vary: tuple[str] = (), cache: MicroCache = None, methods: tuple[str] = ("GET", "HEAD")):
+        if ttl <= 0:
+            raise ValueError(f'{__name__}: Invalid cache TTL {ttl}')
+
+        self.handler = handler
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.vary = tuple(name.lower() for name in vary)
+        self.cache = cache if cache is not None else MicroCache()
+        self.methods = frozenset(methods)  # NOTE: only the methods to cache, the route accepts whatever the wrapped handler does.
+        self.route_methods = getattr(handler, "route_methods", None)
+
+    def make_key(self, request: SimpleRequest):
+        return (request.method, request.path) + tuple(request.get_header(name) for name in self.vary)
+
+    def make_entry(self, captured: bytearray):
+        """
+            @description Splits a captured response into a head without its `Connection` header and a body, or gives `None` if it must not be cached.
+        """
+        head_end = captured.find(b'\r\n\r\n')
+
+        if head_end < 0:
+            return None
+
+        head_lines = bytes(captured[0 : head_end]).split(consts.HTTP_ENDL_BYTES)
+        status_tokens = head_lines[0].split(b' ', 2)
+
+        if len(status_tokens) < 2 or not status_tokens[1].isdigit() or int(status_tokens[1]) not in MICROCACHE_STATUSES:
+            return None
+
+        kept_lines = [head_lines[0]]
+
+        for line in head_lines[1:]:
+            lowered = line.lower()
+
+            if lowered.startswith(b'connection:'):
+                continue
+
+            if lowered.startswith(b'cache-control:') and (b'no-store' in lowered or b'private' in lowered):
+                return None
+
+            kept_lines.append(line)
+
+        now = monotonic()
+        head = consts.HTTP_ENDL_BYTES.join(kept_lines) + consts.HTTP_ENDL_BYTES
+
+        return CacheEntry(head, bytes(captured[head_end + 4 :]), now + self.ttl, now + self.ttl + self.stale_ttl)
+
+    def run_handler(self, context: HandlerCtx, request: SimpleRequest):
+        """
+            @returns The handler's success flag, its captured response bytes and the cache entry made from them, if any.
+        """
+        capture = CaptureSender()
+        handler_ok = self.handler(context, request, capture)
+        entry = self.make_entry(capture.captured) if handler_ok else None
+
+        return handler_ok, capture.captured, entry
+
+    def revalidate(self, context: HandlerCtx, request: SimpleRequest, key: tuple, flight: Flight):
+        entry = None
+
+        try:
+            entry = self.run_handler(context, request)[2]
+        except Exception as revalidate_error:
+            print(f'{__name__}: Revalidation failed with error: {revalidate_error}')
+        finally:
+            self.cache.finish(key, flight, entry)
+
+    def send_entry(self, request: SimpleRequest, response: SimpleSender, entry: CacheEntry):
+        is_last = request.before_close()
+
+        response.queue_raw(entry.head)
+
+        # NOTE handlers run against a capture without the route's cache policy, so it is added on every reply instead of being frozen into the entry.
+        if entry.takes_policy:
+            response.queue_cache_headers()
+
+        response.queue_raw(b'Connection: Close\r\n\r\n' if is_last else b'Connection: Keep-Alive\r\n\r\n')
+
+        return response.flush(entry.body) and not is_last
+
+    def cleanup(self):
+        handler_cleanup = getattr(self.handler, "cleanup", None)
+
+        if handler_cleanup is not None:
+            handler_cleanup()
+
+    def __call__(self, context: HandlerCtx, request: SimpleRequest, response: SimpleSender):
+        if request.method not in self.methods:
+            return self.handler(context, request, response)
+
+        key = self.make_key(request)
+        entry, flight, is_leader = self.cache.lookup(key, monotonic())
+
+        if entry is not None:
+            if is_leader:
+                # NOTE the worker reuses its request object, so the background refresh needs its own copy.
+                Thread(target=self.revalidate, name='microcache_refresh', args=(context, request.copy(), key, flight), daemon=True).start()
+
+            return self.send_entry(request, response, entry)
+
+        if not is_leader:
+            if flight.done.wait(MICROCACHE_DEFAULT_WAIT) and flight.entry is not None:
+                return self.send_entry(request, response, flight.entry)
+
+            # NOTE the leader's response was not cacheable or took too long, so run the handler directly.
+            return self.handler(context, request, response)
+
+        handler_ok = False
+        captured = None
+
+        try:
+            handler_ok, captured, entry = self.run_handler(context, request)
+        finally:
+            self.cache.finish(key, flight, entry)
+
+        if entry is not None:
+            return self.send_entry(request, response, entry)
+
+        if not captured:
+            return handler_ok
+
+        head_end = captured.find(b'\r\n\r\n')
+
+        if head_end >= 0 and takes_cache_policy(bytes(captured[0 : head_end + 2])):
+            response.queue_raw(captured[0 : head_end + 2])
+            response.queue_cache_headers()
+            return response.send_raw(captured[head_end + 2 :]) and handler_ok
+
+        return response.send_raw(captured) and handler_ok
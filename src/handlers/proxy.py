@@ -0,0 +1,460 @@
+"""
+    @file proxy.py
+    @description Reverse-proxy handler forwarding requests to upstream HTTP/1.1 servers over pooled keep-alive connections.
+    @author Derek Tan
+"""
+
+import select
+import socket
+from threading import Event, Lock, Thread
+
+import http1.consts as consts
+from http1.request import SimpleRequest
+from http1.scanner import HttpScanner
+from http1.sender import SimpleSender, RES_ERR_BODY
+from handlers.ctx.context import HandlerCtx
+
+PROXY_BALANCE_ROUND_ROBIN = "round-robin"
+PROXY_BALANCE_LEAST_CONN = "least-conn"
+
+PROXY_DEFAULT_CONNECT_TIMEOUT = 2.0
+PROXY_DEFAULT_READ_TIMEOUT = 10.0
+PROXY_DEFAULT_MAX_IDLE = 8
+PROXY_DEFAULT_HEALTH_INTERVAL = 5.0
+PROXY_STREAM_CHUNK_SIZE = 16384
+
+# NOTE: proxy routes forward these methods and their bodies instead of the server's GET / HEAD default.
+PROXY_METHODS = frozenset(("GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"))
+
+# NOTE: safe methods, the only ones resent once a request may have reached the upstream.
+PROXY_RETRY_METHODS = frozenset(("GET", "HEAD", "OPTIONS"))
+
+# NOTE: hop-by-hop headers only apply to one connection, so they are never forwarded either way.
+PROXY_HOP_HEADERS = frozenset((
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "proxy-connection",
+    "te",
+    "trailer",
+    "transfer-encoding",
+    "upgrade"
+))
+
+class UpstreamConnectError(ConnectionError):
+    """
+        @description Raised when no connection to an upstream could be opened, timeouts included, so the upstream counts as down rather than slow.
+    """
+
+class UpstreamConn:
+    """
+        @description One persistent connection to an upstream, with its own read buffer.
+    """
+    def __init__(self, address: tuple[str, int], connect_timeout: float, read_timeout: float):
+        try:
+            self.socket = socket.create_connection(address, timeout=connect_timeout)
+        except OSError as connect_error:
+            raise UpstreamConnectError(f'Cannot connect to {address[0]}:{address[1]}: {connect_error}') from connect_error
+
+        self.socket.settimeout(read_timeout)
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.scanner = HttpScanner(self.socket, PROXY_STREAM_CHUNK_SIZE)
+
+    def is_dropped(self):
+        """
+            @description Checks an idle connection without blocking: between requests there must be nothing to read, so readable means the upstream closed or broke it.
+        """
+        try:
+            readable, _, _ = select.select([self.socket], [], [], 0)
+        except (OSError, ValueError):
+            return True
+
+        return bool(readable)
+
+    def close(self):
+        try:
+            self.socket.close()
+        except OSError:
+            pass
+
+class Upstream:
+    """
+        @description An upstream server plus its pool of idle connections and its health.
+    """
+    def __init__(self, address: tuple[str, int], max_idle: int = PROXY_DEFAULT_MAX_IDLE):
+        self.address = address
+        self.host_name = f'{address[0]}:{address[1]}'
+        self.max_idle = max_idle
+        self.idle_conns: list[UpstreamConn] = []
+        self.active = 0
+        self.healthy = True
+        self.lock = Lock()
+
+    def take_conn(self, connect_timeout: float, read_timeout: float):
+        """
+            @description Gets an idle pooled connection or opens a new one. The second result tells whether the connection was reused.
+        """
+        while True:
+            with self.lock:
+                if not self.idle_conns:
+                    break
+
+                conn = self.idle_conns.pop()
+
+            if not conn.is_dropped():
+                return conn, True
+
+            conn.close()
+
+        return UpstreamConn(self.address, connect_timeout, read_timeout), False
+
+    def give_conn(self, conn: UpstreamConn):
+        with self.lock:
+            if len(self.idle_conns) < self.max_idle:
+                self.idle_conns.append(conn)
+                return
+
+        conn.close()
+
+    def close_all(self):
+        with self.lock:
+            temp_conns = self.idle_conns
+            self.idle_conns = []
+
+        for conn in temp_conns:
+            conn.close()
+
+class ProxyHandler:
+    """
+        @description Handler that forwards requests to a set of upstreams and streams their responses back. Register it like any handler, e.g. `server.set_handler(["/api"], ProxyHandler([("127.0.0.1", 9000)]))`.
+        @note Upstreams are chosen by `PROXY_BALANCE_ROUND_ROBIN` or `PROXY_BALANCE_LEAST_CONN` among the healthy ones. A background thread re-checks health every `health_interval` seconds by connecting, or by a GET of `health_path` if one is given. The route accepts `PROXY_METHODS`, forwarding request bodies sent with a `Content-Length`.
+    """
+    route_methods = PROXY_METHODS
+
+    def __init__(self, upstreams: list[tuple[str, int]], balance: str = PROXY_BALANCE_ROUND_ROBIN, connect_timeout: float = PROXY_DEFAULT_CONNECT_TIMEOUT, read_timeout: float = PROXY_DEFAULT_READ_TIMEOUT, max_idle: int = PROXY_DEFAULT_MAX_IDLE, health_interval: float = PROXY_DEFAULT_HEALTH_INTERVAL, health_path: str = None):
+        if not upstreams:
+            raise ValueError(f'{__name__}: No upstreams given')
+
+        if balance not in (PROXY_BALANCE_ROUND_ROBIN, PROXY_BALANCE_LEAST_CONN):
+            raise ValueError(f'{__name__}: Invalid balance mode {balance}')
+
+        self.upstreams = [Upstream(address, max_idle) for address in upstreams]
+        self.balance = balance
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.health_path = health_path
+        self.next_index = 0
+        self.pick_lock = Lock()
+
+        self.health_eventer = Event()
+        self.health_thread = None
+
+        if health_interval > 0:
+            self.health_thread = Thread(target=self.run_health_checks, name='proxy_health', args=(health_interval,), daemon=True)
+            self.health_thread.start()
+
+    # UPSTREAM SELECTION
+
+    def pick_upstream(self):
+        with self.pick_lock:
+            candidates = [upstream for upstream in self.upstreams if upstream.healthy]
+
+            # NOTE try every upstream when all are marked down, since health checks may lag behind recovery.
+            if not candidates:
+                candidates = self.upstreams
+
+            if self.balance == PROXY_BALANCE_LEAST_CONN:
+                chosen = min(candidates, key=lambda upstream: upstream.active)
+            else:
+                chosen = candidates[self.next_index % len(candidates)]
+                self.next_index += 1
+
+            chosen.active += 1
+
+        return chosen
+
+    def release_upstream(self, upstream: Upstream):
+        with self.pick_lock:
+            upstream.active -= 1
+
+    # HEALTH CHECKS
+
+    def check_upstream(self, upstream: Upstream):
+        try:
+            conn = UpstreamConn(upstream.address, self.connect_timeout, self.read_timeout)
+        except OSError:
+            return False
+
+        try:
+            if self.health_path is None:
+                return True
+
+            conn.socket.sendall(f'GET {self.health_path} {consts.HTTP_SCHEMA}\r\nHost: {upstream.host_name}\r\nConnection: close\r\n\r\n'.encode(encoding="latin-1"))
+            status_tokens = conn.scanner.read_line().split(b' ', 2)
+
+            return len(status_tokens) >= 2 and status_tokens[1].isdigit() and int(status_tokens[1]) < 500
+        except (OSError, ValueError, BufferError):
+            return False
+        finally:
+            conn.close()
+
+    def run_health_checks(self, interval: float):
+        while not self.health_eventer.wait(interval):
+            for upstream in self.upstreams:
+                upstream_ok = self.check_upstream(upstream)
+
+                if upstream_ok != upstream.healthy:
+                    print(f'{__name__}: Upstream {upstream.host_name} is now {"up" if upstream_ok else "down"}')
+
+                upstream.healthy = upstream_ok
+
+    def cleanup(self):
+        self.health_eventer.set()
+
+        for upstream in self.upstreams:
+            upstream.close_all()
+
+    # FORWARDING
+
+    def build_upstream_request(self, request: SimpleRequest, upstream: Upstream):
+        temp_buf = bytearray(f'{request.method} {request.path} {consts.HTTP_SCHEMA}\r\n'.encode(encoding="latin-1"))
+        client_host = None
+
+        for name, value in request.iter_raw_headers():
+            if name in PROXY_HOP_HEADERS or name == "content-length":
+                continue
+
+            if name == "host":
+                client_host = value
+                continue
+
+            temp_buf += name.encode(encoding="latin-1") + b': ' + value + consts.HTTP_ENDL_BYTES
+
+        temp_buf += f'Host: {upstream.host_name}\r\n'.encode(encoding="latin-1")
+
+        if client_host is not None:
+            temp_buf += b'X-Forwarded-Host: ' + client_host + consts.HTTP_ENDL_BYTES
+
+        body_data = request.get_body()
+
+        if body_data:
+            temp_buf += f'Content-Length: {len(body_data)}\r\n'.encode(encoding="latin-1")
+
+        temp_buf += b'Connection: keep-alive\r\n\r\n'
+
+        if body_data:
+            temp_buf += body_data
+
+        return temp_buf
+
+    def read_upstream_head(self, conn: UpstreamConn):
+        """
+            @description Reads the upstream's status line and headers. Returns the status code, reason and a list of `(lower-case name, raw line)` pairs.
+        """
+        status_tokens = conn.scanner.read_line().split(b' ', 2)
+
+        if len(status_tokens) < 2 or not status_tokens[0].startswith(b'HTTP/'):
+            raise ValueError("Invalid upstream status line!")
+
+        status_code = int(status_tokens[1])
+        status_msg = bytes(status_tokens[2]) if len(status_tokens) > 2 else b''
+        header_lines = []
+
+        while True:
+            line = conn.scanner.read_line()
+
+            if not line:
+                break
+
+            colon_pos = line.find(consts.HTTP_HDR_SP_BYTES)
+
+            if colon_pos < 0:
+                raise ValueError("Invalid upstream header!")
+
+            header_lines.append((bytes(line[0 : colon_pos].strip().lower()).decode(encoding="latin-1"), bytes(line)))
+
+        return status_code, status_msg, header_lines
+
+    def stream_length(self, conn: UpstreamConn, response: SimpleSender, remaining: int):
+        while remaining > 0:
+            chunk = conn.scanner.read_some(min(remaining, PROXY_STREAM_CHUNK_SIZE))
+
+            if not chunk:
+                raise ConnectionResetError("Upstream closed connection.")
+
+            remaining -= len(chunk)
+
+            if not response.send_raw(chunk):
+                return False
+
+        return True
+
+    def stream_chunked(self, conn: UpstreamConn, response: SimpleSender):
+        while True:
+            size_line = bytes(conn.scanner.read_line())
+            chunk_len = int(size_line.split(b';', 1)[0], 16)
+
+            if not response.send_raw(size_line + consts.HTTP_ENDL_BYTES):
+                return False
+
+            if chunk_len == 0:
+                break
+
+            # NOTE forward the chunk along with its trailing CRLF.
+            if not self.stream_length(conn, response, chunk_len + 2):
+                return False
+
+        trailer_line = conn.scanner.read_line()
+
+        while trailer_line:
+            if not response.send_raw(bytes(trailer_line) + consts.HTTP_ENDL_BYTES):
+                return False
+
+            trailer_line = conn.scanner.read_line()
+
+        return response.send_raw(consts.HTTP_ENDL_BYTES)
+
+    def stream_until_close(self, conn: UpstreamConn, response: SimpleSender):
+        chunk = conn.scanner.read_some(PROXY_STREAM_CHUNK_SIZE)
+
+        while chunk:
+            if not response.send_raw(chunk):
+                return False
+
+            chunk = conn.scanner.read_some(PROXY_STREAM_CHUNK_SIZE)
+
+        return True
+
+    def exchange(self, upstream: Upstream, request: SimpleRequest):
+        """
+            @description Sends the request upstream and reads the response head. A pooled connection that turns out to be dead is retried on a fresh one when sending fails, but once the request went out only for `PROXY_RETRY_METHODS`, as the upstream may already have acted on it.
+            @note A malformed response head is never retried.
+        """
+        upstream_req = self.build_upstream_request(request, upstream)
+
+        while True:
+            conn, reused = upstream.take_conn(self.connect_timeout, self.read_timeout)
+
+            try:
+                conn.socket.sendall(upstream_req)
+            except ConnectionError as send_error:
+                conn.close()
+
+                if not reused:
+                    raise send_error
+
+                continue
+            except Exception as other_error:
+                conn.close()
+                raise other_error
+
+            try:
+                return conn, self.read_upstream_head(conn)
+            except ConnectionError as read_error:
+                conn.close()
+
+                if not reused or request.method not in PROXY_RETRY_METHODS:
+                    raise read_error
+            except Exception as other_error:
+                conn.close()
+                raise other_error
+
+    def read_framing(self, header_lines: list[tuple[str, bytes]]):
+        """
+            @description Gets the upstream response's Content-Length (or `None`), whether it is chunked and whether the upstream closes after it. Raises `ValueError` on a malformed length.
+        """
+        content_len = None
+        is_chunked = False
+        upstream_closes = False
+
+        for name, line in header_lines:
+            if name == "content-length":
+                raw_len = line[line.find(b':') + 1 :].strip()
+
+                if not raw_len.isdigit():
+                    raise ValueError(f'Invalid upstream Content-Length {bytes(raw_len)}')
+
+                content_len = int(raw_len)
+            elif name == "transfer-encoding":
+                is_chunked = b'chunked' in line.lower()
+            elif name == "connection":
+                upstream_closes = b'close' in line.lower()
+
+        return content_len, is_chunked, upstream_closes
+
+    def send_error(self, context: HandlerCtx, request: SimpleRequest, response: SimpleSender, status: str):
+        response.send_heading(status)
+        response.send_header("Date", context.get_gmt_str())
+        response.send_header("Connection", "Close" if request.before_close() else "Keep-Alive")
+
+        return response.send_body(RES_ERR_BODY, "*/*", None)
+
+    def __call__(self, context: HandlerCtx, request: SimpleRequest, response: SimpleSender):
+        upstream = self.pick_upstream()
+
+        try:
+            return self.forward(context, upstream, request, response)
+        finally:
+            self.release_upstream(upstream)
+
+    def forward(self, context: HandlerCtx, upstream: Upstream, request: SimpleRequest, response: SimpleSender):
+        try:
+            conn, (status_code, status_msg, header_lines) = self.exchange(upstream, request)
+        except TimeoutError:
+            # NOTE only a slow reply lands here. Failing to connect, even by timing out, raises UpstreamConnectError and marks the upstream down below.
+            return self.send_error(context, request, response, "504")
+        except (OSError, BufferError, ValueError) as proxy_error:
+            print(f'{__name__}: Upstream {upstream.host_name} failed with error: {proxy_error}')
+
+            # NOTE only health checks can mark an upstream up again, so leave it be when they are off.
+            if self.health_thread is not None:
+                upstream.healthy = False
+
+            return self.send_error(context, request, response, "502")
+
+        try:
+            content_len, is_chunked, upstream_closes = self.read_framing(header_lines)
+        except ValueError as framing_error:
+            # NOTE nothing was sent to the client yet, so it still gets a clean error while the confused upstream connection is dropped.
+            print(f'{__name__}: Upstream {upstream.host_name} sent a bad response head: {framing_error}')
+            conn.close()
+            return self.send_error(context, request, response, "502")
+
+        # NOTE HEAD replies and 1xx/204/304 statuses never carry a body whatever their headers say.
+        no_body = request.method == "HEAD" or status_code < 200 or status_code in (204, 304)
+        until_close = not no_body and not is_chunked and content_len is None
+        client_closes = request.before_close() or until_close
+
+        response.queue_raw(f'{consts.HTTP_SCHEMA} {status_code} '.encode(encoding="latin-1") + status_msg + consts.HTTP_ENDL_BYTES)
+
+        temp_buf = bytearray()
+
+        for name, line in header_lines:
+            if name not in PROXY_HOP_HEADERS or (name == "transfer-encoding" and is_chunked and not no_body):
+                temp_buf += line + consts.HTTP_ENDL_BYTES
+
+        temp_buf += b'Connection: Close\r\n\r\n' if client_closes else b'Connection: Keep-Alive\r\n\r\n'
+
+        try:
+            stream_ok = response.send_raw(temp_buf)
+
+            if stream_ok and not no_body:
+                if is_chunked:
+                    stream_ok = self.stream_chunked(conn, response)
+                elif content_len is not None:
+                    stream_ok = self.stream_length(conn, response, content_len)
+                else:
+                    stream_ok = self.stream_until_close(conn, response)
+        except (OSError, ValueError, BufferError) as stream_error:
+            # NOTE the client already got a partial reply, so the only safe thing left is to drop its connection.
+            print(f'{__name__}: Upstream {upstream.host_name} failed mid-response with error: {stream_error}')
+            conn.close()
+            return False
+
+        if stream_ok and not upstream_closes and not until_close:
+            upstream.give_conn(conn)
+        else:
+            conn.close()
+
+        return stream_ok and not client_closes
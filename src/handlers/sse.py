@@ -0,0 +1,46 @@
+"""
+    @file sse.py
+    @description Handler turning a route into a Server-Sent Events stream of a hub topic.
+    @author Derek Tan
+"""
+
+from http1.request import SimpleRequest
+from http1.sender import SimpleSender, RES_ERR_BODY
+import http1.consts as consts
+from handlers.ctx.context import HandlerCtx
+from core.broadcast import SSE_DEFAULT_RETRY
+
+class SseHandler:
+    """
+        @description Answers a GET with `text/event-stream` headers, then hands the connection to the server's `EventHub` under `topic`, freeing the worker at once. Publish to the topic with `Tippy.publish` or `HandlerCtx.publish`.
+        @note `retry_ms` tells browsers how long to wait before reconnecting a dropped stream. The server needs `TippyConfig(event_streams=True)`, else streams are answered with 503.
+    """
+    def __init__(self, topic: str, retry_ms: int = SSE_DEFAULT_RETRY):
+        self.topic = topic
+        self.preamble = f'retry: {retry_ms}\n\n'.encode(encoding="ascii")
+
+    def __call__(self, context: HandlerCtx, request: SimpleRequest, response: SimpleSender):
+        if context.events is None or request.method not in ("GET", "HEAD"):
+            response.send_heading("405" if context.events is not None else "503")
+            response.send_header("Date", context.get_gmt_str())
+            return response.send_body(RES_ERR_BODY, "*/*", None)
+
+        response.send_heading("200")
+        response.send_header("Date", context.get_gmt_str())
+        response.send_header("Content-Type", "text/event-stream")
+        response.send_header("Cache-Control", "no-cache")
+
+        if request.method == "HEAD":
+            response.queue_raw(consts.HTTP_ENDL_BYTES)
+            return response.send_raw(None)
+
+        # NOTE the stream has no length and ends when either side closes, so it is never kept alive for another request.
+        response.send_header("Connection", "Close")
+        response.queue_raw(consts.HTTP_ENDL_BYTES)
+
+        if not response.send_raw(self.preamble):
+            return False
+
+        context.events.subscribe(self.topic, response.detach())
+
+        return True
@@ -12,6 +12,46 @@ HTTP_METHODS = {
 
 HTTP_SCHEMA = "HTTP/1.1"
 
+# NOTE: maps raw method tokens to interned names so request objects never hold per-request copies of them.
+HTTP_METHOD_NAMES = {
+    b"HEAD": "HEAD",
+    b"GET": "GET"
+}
+
+# Well-known Headers:
+
+HTTP_HDR_HOST = 0
+HTTP_HDR_CONNECTION = 1
+HTTP_HDR_CONTENT_TYPE = 2
+HTTP_HDR_CONTENT_LENGTH = 3
+HTTP_HDR_TRANSFER_ENCODING = 4
+HTTP_HDR_IF_MODIFIED_SINCE = 5
+HTTP_HDR_IF_UNMODIFIED_SINCE = 6
+HTTP_HDR_CACHE_CONTROL = 7
+
+HTTP_KNOWN_HEADERS = (
+    "host",
+    "connection",
+    "content-type",
+    "content-length",
+    "transfer-encoding",
+    "if-modified-since",
+    "if-unmodified-since",
+    "cache-control"
+)
+
+HTTP_KNOWN_HDR_COUNT = len(HTTP_KNOWN_HEADERS)
+
+# NOTE: lower-case header names to their fixed slot in a request.
+HTTP_KNOWN_HDR_SLOTS = {name: slot for slot, name in enumerate(HTTP_KNOWN_HEADERS)}
+
+# NOTE: raw header names to slots, including the usual title-cased spellings so that the scanner can skip lower-casing most names.
+HTTP_KNOWN_HDR_RAW_SLOTS = {}
+
+for hdr_slot, hdr_name in enumerate(HTTP_KNOWN_HEADERS):
+    HTTP_KNOWN_HDR_RAW_SLOTS[hdr_name.encode(encoding="ascii")] = hdr_slot
+    HTTP_KNOWN_HDR_RAW_SLOTS[hdr_name.title().encode(encoding="ascii")] = hdr_slot
+
 # Statuses:
 
 HTTP_STATS = {
@@ -19,8 +59,16 @@ HTTP_STATS = {
     "304": "Not Modified",
     "400": "Bad Request",
     "404": "Not Found",
+    "405": "Method Not Allowed",
+    "408": "Request Timeout",
+    "413": "Content Too Large",
+    "414": "URI Too Long",
+    "431": "Request Header Fields Too Large",
     "500": "Server Error",
-    "501": "Not Implemented"
+    "501": "Not Implemented",
+    "502": "Bad Gateway",
+    "503": "Service Unavailable",
+    "504": "Gateway Timeout"
 }
 
 # Message Punctuation:
@@ -28,4 +76,6 @@ HTTP_STATS = {
 HTTP_SP = " "
 HTTP_HDR_SP = ":"
 HTTP_ENDL = "\r\n"
+HTTP_ENDL_BYTES = b"\r\n"
+HTTP_HDR_SP_BYTES = b":"
 
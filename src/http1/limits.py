@@ -0,0 +1,73 @@
+"""
+    @file limits.py
+    @description Deadlines and size caps applied while scanning requests, so slow or oversized clients cannot hold a worker.
+    @author Derek Tan
+"""
+
+from threading import Lock
+
+# Scan phases: waiting for a request's first byte, reading its head, then reading its body.
+SCAN_PHASE_IDLE = 0
+SCAN_PHASE_HEAD = 1
+SCAN_PHASE_BODY = 2
+
+LIMIT_DEFAULT_IDLE_TIMEOUT = 15.0
+LIMIT_DEFAULT_HEAD_TIMEOUT = 10.0
+LIMIT_DEFAULT_BODY_TIMEOUT = 30.0
+LIMIT_DEFAULT_SEND_TIMEOUT = 30.0
+LIMIT_DEFAULT_MAX_LINE = 8190
+LIMIT_DEFAULT_MAX_HEADERS = 100
+LIMIT_DEFAULT_MAX_HEADER_BYTES = 16384
+LIMIT_DEFAULT_MAX_BODY = 1048576
+
+# Cut-off kinds:
+CUT_IDLE_TIMEOUT = "idle_timeout"
+CUT_HEAD_TIMEOUT = "head_timeout"
+CUT_BODY_TIMEOUT = "body_timeout"
+CUT_LINE_TOO_LONG = "line_too_long"
+CUT_TOO_MANY_HEADERS = "too_many_headers"
+CUT_HEADERS_TOO_LARGE = "headers_too_large"
+CUT_BODY_TOO_LARGE = "body_too_large"
+CUT_BAD_LENGTH = "bad_length"
+
+class ScanLimitError(Exception):
+    """
+        @description Raised by the scanner when a request breaks a limit. `status` is the reply to send before closing, or `None` to close quietly.
+    """
+    def __init__(self, status: str, kind: str):
+        super().__init__(f'Request cut off: {kind}')
+        self.status = status
+        self.kind = kind
+
+class ScanLimits:
+    """
+        @description Scanner limits shared by all workers of a server, plus counters of the cut-offs they caused. A `None` timeout or cap disables that check.
+        @note The idle deadline runs until a request's first byte, the head deadline from there to the blank line ending the headers and the body deadline from there to the body's last byte. The send timeout then covers writing the reply.
+    """
+    def __init__(self, idle_timeout: float = LIMIT_DEFAULT_IDLE_TIMEOUT, head_timeout: float = LIMIT_DEFAULT_HEAD_TIMEOUT, body_timeout: float = LIMIT_DEFAULT_BODY_TIMEOUT, send_timeout: float = LIMIT_DEFAULT_SEND_TIMEOUT, max_line_bytes: int = LIMIT_DEFAULT_MAX_LINE, max_headers: int = LIMIT_DEFAULT_MAX_HEADERS, max_header_bytes: int = LIMIT_DEFAULT_MAX_HEADER_BYTES, max_body_bytes: int = LIMIT_DEFAULT_MAX_BODY):
+        self.phase_timeouts = (idle_timeout, head_timeout, body_timeout)
+        self.send_timeout = send_timeout
+        self.max_line_bytes = max_line_bytes
+        self.max_headers = max_headers
+        self.max_header_bytes = max_header_bytes
+        self.max_body_bytes = max_body_bytes
+
+        self.lock = Lock()
+        self.cut_counts = {
+            CUT_IDLE_TIMEOUT: 0,
+            CUT_HEAD_TIMEOUT: 0,
+            CUT_BODY_TIMEOUT: 0,
+            CUT_LINE_TOO_LONG: 0,
+            CUT_TOO_MANY_HEADERS: 0,
+            CUT_HEADERS_TOO_LARGE: 0,
+            CUT_BODY_TOO_LARGE: 0,
+            CUT_BAD_LENGTH: 0
+        }
+
+    def note_cut(self, kind: str):
+        with self.lock:
+            self.cut_counts[kind] += 1
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.cut_counts)
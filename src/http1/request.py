@@ -4,21 +4,70 @@
 """
 
 import calendar
+import sys
 import time
 import http1.consts as consts
 
 class SimpleRequest:
+    """
+        @description Compact HTTP/1.1 request. Well-known headers live in fixed slots and other headers in a small dict. Header values are kept as the raw bytes read from the socket and are only decoded when a handler asks for them.
+        @note Workers reuse one request object across keep-alive requests by calling `reset` instead of making a new one.
+    """
+    __slots__ = ("method", "path", "schema", "known_headers", "extra_headers", "body_data")
+
     def __init__(self, method_name="HEAD", rel_path="/"):
         self.method = method_name
         self.path = rel_path
-        self.headers = {}
+        self.schema = consts.HTTP_SCHEMA
+        self.known_headers = [None] * consts.HTTP_KNOWN_HDR_COUNT
+        self.extra_headers = {}
+        self.body_data = None
+
+    def reset(self, method_name="HEAD", rel_path="/", schema=consts.HTTP_SCHEMA):
+        self.method = method_name
+        self.path = rel_path
+        self.schema = schema
+
+        known = self.known_headers
+
+        for slot in range(consts.HTTP_KNOWN_HDR_COUNT):
+            known[slot] = None
+
+        self.extra_headers.clear()
         self.body_data = None
 
     def get_header(self, header_name=""):
-        result = self.headers.get(header_name)
+        """
+            @description Gets a header value by its lower-case name, or `None` if the header is not present.
+        """
+        slot = consts.HTTP_KNOWN_HDR_SLOTS.get(header_name)
+
+        if slot is not None:
+            result = self.known_headers[slot]
+
+            # NOTE decode lazily: most requests never look at most of their headers.
+            if result.__class__ is bytes:
+                result = result.decode(encoding="latin-1")
+                self.known_headers[slot] = result
 
-        if result is None:
-            return ""
+            return result
+
+        result = self.extra_headers.get(header_name)
+
+        if result.__class__ is bytes:
+            result = result.decode(encoding="latin-1")
+            self.extra_headers[header_name] = result
+
+        return result
+
+    def get_raw_header(self, slot: int):
+        """
+            @description Gets a well-known header value by its slot without decoding it. See `HTTP_HDR_*` in consts.
+        """
+        result = self.known_headers[slot]
+
+        if result.__class__ is str:
+            return result.encode(encoding="latin-1")
 
         return result
 
@@ -26,10 +75,52 @@ class SimpleRequest:
         if header_name is None or header_value is None:
             return False
 
-        self.headers[header_name] = header_value
+        slot = consts.HTTP_KNOWN_HDR_SLOTS.get(header_name)
+
+        if slot is not None:
+            self.known_headers[slot] = header_value
+        else:
+            self.extra_headers[sys.intern(header_name)] = header_value
 
         return True
 
+    def put_known_header(self, slot: int, header_value: bytes):
+        """
+            @description Stores a raw well-known header value. Only the first occurrence of a header is kept.
+        """
+        if self.known_headers[slot] is None:
+            self.known_headers[slot] = header_value
+
+    def put_extra_header(self, header_name: str, header_value: bytes):
+        if header_name not in self.extra_headers:
+            self.extra_headers[header_name] = header_value
+
+    def iter_raw_headers(self):
+        """
+            @description Yields `(lower-case name, raw value)` pairs for every header in this request.
+        """
+        for slot, value in enumerate(self.known_headers):
+            if value is not None:
+                yield consts.HTTP_KNOWN_HEADERS[slot], self.get_raw_header(slot)
+
+        for name, value in self.extra_headers.items():
+            if value.__class__ is str:
+                value = value.encode(encoding="latin-1")
+
+            yield name, value
+
+    def copy(self):
+        """
+            @description Makes a detached copy of this request, for work that outlives the worker's reused request object.
+        """
+        result = SimpleRequest(self.method, self.path)
+        result.schema = self.schema
+        result.known_headers[:] = self.known_headers
+        result.extra_headers.update(self.extra_headers)
+        result.body_data = self.body_data
+
+        return result
+
     def get_body(self):
         return self.body_data
 
@@ -37,7 +128,7 @@ class SimpleRequest:
         self.body_data = data
 
     def method_supported(self):
-        return consts.HTTP_METHODS[self.method] is not None
+        return consts.HTTP_METHODS.get(self.method) is not None
 
     def get_check_modify_date(self):
         """
@@ -72,8 +163,64 @@ class SimpleRequest:
 
         return calendar.timegm(request_unmod_time)
 
+    def accepts_encoding(self, encoding: str):
+        """
+            @description Checks `Accept-Encoding` for a content coding such as `"gzip"`, which `*` also covers unless the coding is listed with `q=0`.
+        """
+        accept_header = self.get_header("accept-encoding")
+
+        if not accept_header:
+            return False
+
+        wildcard_ok = False
+
+        for item in accept_header.split(","):
+            coding, _, params = item.partition(";")
+            coding = coding.strip().lower()
+            params = params.strip().lower()
+            item_ok = True
+
+            if params.startswith("q="):
+                try:
+                    item_ok = float(params[2:]) > 0
+                except ValueError:
+                    item_ok = False
+
+            if coding == encoding:
+                return item_ok
+
+            if coding == "*":
+                wildcard_ok = item_ok
+
+        return wildcard_ok
+
+    def matches_etag(self, etag: str):
+        """
+            @description Checks whether `If-None-Match` lists `etag` or is `*`. Weak tags compare equal to strong ones, as for GET and HEAD.
+        """
+        match_header = self.get_header("if-none-match")
+
+        if not match_header:
+            return False
+
+        if match_header.strip() == "*":
+            return True
+
+        for item in match_header.split(","):
+            item = item.strip()
+
+            if item.startswith("W/"):
+                item = item[2:]
+
+            if item == etag:
+                return True
+
+        return False
+
     def before_close(self):
-        return self.get_header("connection") == "Close"
+        return self.get_raw_header(consts.HTTP_HDR_CONNECTION) == b"Close"
 
     def __str__(self):
-        return f'{self.method} {self.path} {consts.HTTP_SCHEMA} {self.headers}'
+        temp_headers = {name: self.get_header(name) for name, _ in self.iter_raw_headers()}
+
+        return f'{self.method} {self.path} {self.schema} {temp_headers}'
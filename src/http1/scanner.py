@@ -3,9 +3,16 @@
     @author Derek Tan
 """
 
+from typing import TYPE_CHECKING
 import socket
+import sys
+from time import monotonic
 import http1.consts as consts
 import http1.request as requests
+from http1.limits import ScanLimits, ScanLimitError, SCAN_PHASE_IDLE, SCAN_PHASE_HEAD, SCAN_PHASE_BODY, CUT_IDLE_TIMEOUT, CUT_HEAD_TIMEOUT, CUT_BODY_TIMEOUT, CUT_LINE_TOO_LONG, CUT_TOO_MANY_HEADERS, CUT_HEADERS_TOO_LARGE, CUT_BODY_TOO_LARGE, CUT_BAD_LENGTH
+
+if TYPE_CHECKING:
+    from utils.traffic import TrafficRecorder
 
 # State Aliases:
 SCANNER_ST_IDLE = 0
@@ -17,105 +24,343 @@ SCANNER_ST_CHUNK_BLOB = 5
 SCANNER_ST_END = 6
 SCANNER_ST_ERROR = 7
 
+# NOTE: also the longest line the scanner accepts, since a line must fit in the buffer.
+SCANNER_BUFFER_SIZE = 8192
+
 class HttpScanner:
-    def __init__(self, in_stream: socket.SocketIO):
+    """
+        @description Reads HTTP/1.1 requests from a socket into a reusable request object. Owns one receive buffer that is kept across connections, so a worker's scanner does no per-connection allocation.
+    """
+    def __init__(self, in_socket: socket.socket = None, buffer_size: int = SCANNER_BUFFER_SIZE, limits: ScanLimits = None, recorder: "TrafficRecorder" = None):
         # Reader state:
         self.state = SCANNER_ST_IDLE
 
-        # File stream from socket:
-        self.reader = in_stream
+        # Client socket:
+        self.reader = in_socket
+
+        # Receive buffer: unread bytes are in buffer[start:end].
+        self.buffer = bytearray(buffer_size)
+        self.view = memoryview(self.buffer)
+        self.start = 0
+        self.end = 0
 
         # List of status line tokens:
         self.temps = None
 
-        # Header lookup and cache dict:
-        self.hdr_cache = {
-            "host": None,
-            "connection": None,
-            "content-type": None,
-            "content-length": None,
-            "transfer-encoding": None,
-            "if-modified-since": None,
-            "if-unmodified-since": None,
-            "cache-control": None
-        }
+        # Request being filled:
+        self.request = None
+
+        # Limits, when enforced: the current phase's deadline and the head's size so far.
+        self.limits = limits
+        self.phase = SCAN_PHASE_IDLE
+        self.deadline = None
+        self.header_count = 0
+        self.header_bytes = 0
+
+        # Traffic capture, when on: the current connection's capture id, or `None` if it is not sampled.
+        self.recorder = recorder
+        self.capture_id = None
 
         # Cache for bytes to put in request object:
         self.temp_data = None
+        self.content_len = 0
+
+    def attach(self, in_socket: socket.socket, pending: bytes = b''):
+        """
+            @description Binds this scanner to a new client connection, dropping any bytes left from the last one. `pending` holds bytes already read from the new connection elsewhere, e.g. pipelined requests.
+        """
+        self.reader = in_socket
+        self.start = 0
+        self.end = len(pending)
+        self.buffer[0 : self.end] = pending
+        self.capture_id = None
+
+        if self.recorder is not None and in_socket is not None:
+            self.capture_id = self.recorder.open_conn(in_socket)
+
+        self.reset()
+
+    def take_pending(self):
+        """
+            @description Removes and returns the bytes buffered past the current request.
+        """
+        result = bytes(self.view[self.start : self.end])
+        self.start = 0
+        self.end = 0
+
+        return result
 
     def reset(self):
         self.state = SCANNER_ST_IDLE
         self.temps = None
-        self.hdr_cache["host"] = None
-        self.hdr_cache["connection"] = None
-        self.hdr_cache["content-type"] = None
-        self.hdr_cache["content-length"] = None
-        self.hdr_cache["transfer-encoding"] = None
-        self.hdr_cache["if-modified-since"] = None
-        self.hdr_cache["if-unmodified-since"] = None
-        self.hdr_cache["cache-control"] = None
+        self.request = None
         self.temp_data = None
+        self.content_len = 0
+        self.header_count = 0
+        self.header_bytes = 0
+
+    def begin_phase(self, phase: int):
+        self.phase = phase
+
+        if self.limits is None:
+            return
+
+        phase_timeout = self.limits.phase_timeouts[phase]
+        self.deadline = None if phase_timeout is None else monotonic() + phase_timeout
+
+    def check_deadline(self):
+        """
+            @description Makes the next receive time out when the current phase's deadline passes.
+        """
+        if self.deadline is None:
+            return
+
+        remaining = self.deadline - monotonic()
+
+        if remaining <= 0:
+            raise self.make_timeout_error()
+
+        self.reader.settimeout(remaining)
+
+    def make_timeout_error(self):
+        if self.phase == SCAN_PHASE_IDLE:
+            return ScanLimitError(None, CUT_IDLE_TIMEOUT)
+        elif self.phase == SCAN_PHASE_HEAD:
+            return ScanLimitError("408", CUT_HEAD_TIMEOUT)
+
+        return ScanLimitError("408", CUT_BODY_TIMEOUT)
+
+    def recv_into_buffer(self):
+        self.check_deadline()
+
+        try:
+            recv_count = self.reader.recv_into(self.view[self.end :])
+        except socket.timeout:
+            if self.deadline is None:
+                raise
+
+            raise self.make_timeout_error()
+
+        if recv_count == 0:
+            raise ConnectionResetError("Client closed connection.")
+
+        if self.capture_id is not None:
+            self.recorder.note_data(self.capture_id, self.view[self.end : self.end + recv_count])
+
+        # NOTE the head deadline starts with a request's first byte, not when the worker started waiting.
+        if self.phase == SCAN_PHASE_IDLE:
+            self.begin_phase(SCAN_PHASE_HEAD)
+
+        self.end += recv_count
+
+    def recv_bytes(self, limit: int):
+        self.check_deadline()
+
+        try:
+            result = self.reader.recv(limit)
+        except socket.timeout:
+            if self.deadline is None:
+                raise
+
+            raise self.make_timeout_error()
+
+        if self.capture_id is not None and result:
+            self.recorder.note_data(self.capture_id, result)
+
+        return result
+
+    def fill_buffer(self):
+        """
+            @description Receives more bytes into the buffer, compacting unread bytes to its front first if needed.
+            @note Raises `ConnectionResetError` on a closed connection and `BufferError` when a single line overflows the buffer.
+        """
+        if self.start == self.end:
+            self.start = 0
+            self.end = 0
+        elif self.end == len(self.buffer):
+            if self.start == 0:
+                raise BufferError("HTTP line too long!")
+
+            pending = self.end - self.start
+            self.buffer[0 : pending] = self.view[self.start : self.end]
+            self.start = 0
+            self.end = pending
+
+        self.recv_into_buffer()
+
+    def read_line(self, max_len: int = None):
+        """
+            @note Raises `BufferError` for lines longer than `max_len` or the buffer.
+        """
+        endl_pos = self.buffer.find(b"\n", self.start, self.end)
+
+        while endl_pos < 0:
+            scan_from = self.end - self.start
+
+            if max_len is not None and scan_from > max_len:
+                raise BufferError("HTTP line too long!")
+
+            self.fill_buffer()
+            endl_pos = self.buffer.find(b"\n", self.start + scan_from, self.end)
+
+        if max_len is not None and endl_pos - self.start > max_len:
+            raise BufferError("HTTP line too long!")
+
+        line = self.buffer[self.start : endl_pos].strip()
+        self.start = endl_pos + 1
+
+        return line
+
+    def read_exact(self, count: int):
+        if count <= 0:
+            return b''
 
-    def state_heading(self, line: str):
-        tokens = line.split(consts.HTTP_SP)
+        buffered = self.end - self.start
+
+        if buffered >= count:
+            result = bytes(self.view[self.start : self.start + count])
+            self.start += count
+            return result
+
+        result = bytearray(self.view[self.start : self.end])
+        self.start = 0
+        self.end = 0
+
+        while len(result) < count:
+            chunk = self.recv_bytes(count - len(result))
+
+            if not chunk:
+                raise ConnectionResetError("Client closed connection.")
+
+            result += chunk
+
+        return bytes(result)
+
+    def read_some(self, limit: int):
+        """
+            @description Reads up to `limit` bytes, preferring already buffered ones. Returns empty bytes once the peer closes.
+        """
+        if self.start == self.end:
+            return self.recv_bytes(limit)
+
+        count = min(limit, self.end - self.start)
+        result = bytes(self.view[self.start : self.start + count])
+        self.start += count
+
+        return result
+
+    def state_heading(self, line: bytearray):
+        tokens = line.split(b' ')
 
         if len(tokens) != 3:
             return SCANNER_ST_ERROR
 
-        self.temps = tokens[0 : 3]
+        self.temps = tokens
 
         return SCANNER_ST_HEADER
 
-    def state_header(self, line: str):
+    def state_header(self, line: bytearray):
         if not line:
             return SCANNER_ST_BODY
 
-        first_colon_pos = -1
+        if self.limits is not None:
+            self.header_count += 1
+            self.header_bytes += len(line) + 2
 
-        try:
-            first_colon_pos = line.index(consts.HTTP_HDR_SP) 
-        except:
+            if self.limits.max_headers is not None and self.header_count > self.limits.max_headers:
+                raise ScanLimitError("431", CUT_TOO_MANY_HEADERS)
+
+            if self.limits.max_header_bytes is not None and self.header_bytes > self.limits.max_header_bytes:
+                raise ScanLimitError("431", CUT_HEADERS_TOO_LARGE)
+
+        first_colon_pos = line.find(consts.HTTP_HDR_SP_BYTES)
+
+        if first_colon_pos < 0:
             return SCANNER_ST_ERROR
 
-        header_name = line[0 : first_colon_pos].strip().lower()
-        header_value = line[first_colon_pos + 1 :].strip()
+        header_name = bytes(line[0 : first_colon_pos].rstrip())
+        header_value = bytes(line[first_colon_pos + 1 :].strip())
+        slot = consts.HTTP_KNOWN_HDR_RAW_SLOTS.get(header_name)
 
-        if self.hdr_cache.get(header_name) is None:
-            self.hdr_cache[header_name] = header_value
+        if slot is None:
+            slot = consts.HTTP_KNOWN_HDR_RAW_SLOTS.get(header_name.lower())
+
+        if slot is not None:
+            self.request.put_known_header(slot, header_value)
+        else:
+            self.request.put_extra_header(sys.intern(header_name.decode(encoding="latin-1").lower()), header_value)
 
         return SCANNER_ST_HEADER
 
     def state_body(self, content_len = 0):
-        if self.hdr_cache["transfer-encoding"] == "chunked":
+        if self.request.get_raw_header(consts.HTTP_HDR_TRANSFER_ENCODING) == b"chunked":
+            self.temp_data = bytearray()
             return SCANNER_ST_CHUNK_LEN
 
-        self.temp_data = self.reader.read(content_len)
+        self.temp_data = self.read_exact(content_len)
 
         return SCANNER_ST_END
 
-    def state_chunk_len(self, line: str):
-        if line is None:
-            return SCANNER_ST_END
+    def state_chunk_len(self, line: bytearray):
+        try:
+            self.content_len = int(line.split(b';', 1)[0], 16)
+        except ValueError:
+            return SCANNER_ST_ERROR
 
-        if len(line) > 0:  # NOTE chunk length lines are usually ignored, so just check for their presence.
+        if self.content_len > 0:
             return SCANNER_ST_CHUNK_BLOB
 
+        # NOTE skip any trailers up to the final blank line.
+        while self.read_line():
+            pass
+
         return SCANNER_ST_END
 
-    def state_chunk_blob(self, chunk_line: str):
-        if len(chunk_line) > 0:
-            temp_chunk_data = chunk_line.encode(encoding="ascii")
-            temp_chunk_size = len(temp_chunk_data)
+    def state_chunk_blob(self):
+        if self.limits is not None and self.limits.max_body_bytes is not None and len(self.temp_data) + self.content_len > self.limits.max_body_bytes:
+            raise ScanLimitError("413", CUT_BODY_TOO_LARGE)
 
-            self.temp_data.join(temp_chunk_data)
-            self.hdr_cache["content-length"] += temp_chunk_size
+        self.temp_data += self.read_exact(self.content_len)
+        self.read_line()
 
-            return SCANNER_ST_CHUNK_LEN
+        return SCANNER_ST_CHUNK_LEN
 
-        return SCANNER_ST_END
+    def next_request(self, request: requests.SimpleRequest = None):
+        """
+            @description Reads the next request on the connection into `request`, or into a new request object if none is given.
+        """
+        if request is None:
+            request = requests.SimpleRequest()
 
-    def next_request(self):
-        temp_line = None
+        self.request = request
+
+        # NOTE pipelined bytes already buffered mean the next request has begun, so there is no idle wait.
+        self.begin_phase(SCAN_PHASE_IDLE if self.start == self.end else SCAN_PHASE_HEAD)
+
+        try:
+            self.scan_request(request)
+        except BufferError:
+            if self.limits is None:
+                raise
+
+            if self.state == SCANNER_ST_HEADING:
+                raise ScanLimitError("414", CUT_LINE_TOO_LONG)
+
+            raise ScanLimitError("431", CUT_HEADERS_TOO_LARGE)
+
+        if self.limits is not None:
+            self.deadline = None
+            self.reader.settimeout(self.limits.send_timeout)
+
+        if self.temp_data.__class__ is bytearray:
+            self.temp_data = bytes(self.temp_data)
+
+        request.put_body(self.temp_data)
+
+        return request
+
+    def scan_request(self, request: requests.SimpleRequest):
+        max_line = None if self.limits is None else self.limits.max_line_bytes
 
         while self.state != SCANNER_ST_END:
             # print(f'HttpScanner.state = {self.state}')  # DEBUG!
@@ -125,45 +370,44 @@ class HttpScanner:
                 self.state = SCANNER_ST_HEADING
             elif self.state == SCANNER_ST_HEADING:
                 # Process status line...
-                temp_line = self.reader.readline().strip()
-                self.state = self.state_heading(temp_line)
+                self.state = self.state_heading(self.read_line(max_line))
+
+                if self.state == SCANNER_ST_HEADER:
+                    raw_method, raw_path, raw_schema = self.temps
+                    req_method = consts.HTTP_METHOD_NAMES.get(bytes(raw_method))
+
+                    if req_method is None:
+                        req_method = raw_method.decode(encoding="latin-1")
+
+                    # TODO: Check req_schema for http version support. Versions affect how request processing works: Host is not needed for 1.0, for example.
+                    request.reset(req_method, raw_path.decode(encoding="latin-1"), raw_schema.decode(encoding="latin-1"))
             elif self.state == SCANNER_ST_HEADER:
                 # Process header...
-                temp_line = self.reader.readline().strip()
-                self.state = self.state_header(temp_line)
+                self.state = self.state_header(self.read_line(max_line))
             elif self.state == SCANNER_ST_BODY:
                 # Process body:
-                clen_str = self.hdr_cache["content-length"]
+                clen_raw = request.get_raw_header(consts.HTTP_HDR_CONTENT_LENGTH)
                 cont_len = 0
 
-                # NOTE: parse content-length only if available!
-                if clen_str is not None:
-                    cont_len = int(clen_str)
-                else:
-                    self.hdr_cache["content-length"] = 0
-                    cont_len = 0
+                # NOTE: parse content-length only if available! Only plain digits are valid, so signs, spaces and junk get a 400 instead of a misread body.
+                if clen_raw is not None:
+                    clen_raw = clen_raw.strip()
+
+                    if not clen_raw.isdigit():
+                        raise ScanLimitError("400", CUT_BAD_LENGTH)
+
+                    cont_len = int(clen_raw)
 
+                if self.limits is not None and self.limits.max_body_bytes is not None and cont_len > self.limits.max_body_bytes:
+                    raise ScanLimitError("413", CUT_BODY_TOO_LARGE)
+
+                self.begin_phase(SCAN_PHASE_BODY)
                 self.state = self.state_body(cont_len)
             elif self.state == SCANNER_ST_CHUNK_LEN:
-                temp_line = self.reader.readline().strip()
-                self.state = self.state_chunk_len(temp_line)
+                self.state = self.state_chunk_len(self.read_line())
             elif self.state == SCANNER_ST_CHUNK_BLOB:
-                temp_line = self.reader.readline().strip()
-                self.state = self.state_chunk_blob(temp_line)
+                self.state = self.state_chunk_blob()
             elif self.state == SCANNER_ST_END:
                 pass
             else:
                 raise Exception("Invalid HTTP msg syntax!")
-
-        # TODO: Put req_schema into request object for checking http version support. Versions affect how request processing works: Host is not needed for 1.0, for example.
-        req_method, req_path, req_schema = self.temps
-
-        request = requests.SimpleRequest(req_method, req_path)
-
-        # NOTE: load headers!
-        for hkey in self.hdr_cache:
-            request.put_header(hkey, self.hdr_cache[hkey])
-
-        request.put_body(self.temp_data);
-
-        return request
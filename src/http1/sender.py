@@ -5,49 +5,179 @@
 
 import socket
 import http1.consts as consts
+from http1.request import SimpleRequest
 
 RES_HEAD_BODY = 0
 RES_GET_BODY = 1
 RES_ERR_BODY = 2
 
+# NOTE: bodies up to this size are copied after the headers so that the whole response goes out in one send.
+SENDER_COALESCE_SIZE = 4096
+
+# NOTE: only these replies carry the route's cache policy headers, so errors are never kept by browsers.
+SENDER_CACHEABLE_STATUSES = frozenset(("200", "203", "204", "206", "301", "308"))
+
+# NOTE: pre-encoded status lines, built once instead of per response.
+RES_STATUS_LINES = {
+    code: f'{consts.HTTP_SCHEMA} {code} {msg}{consts.HTTP_ENDL}'.encode(encoding="ascii")
+    for code, msg in consts.HTTP_STATS.items()
+}
+
 class SimpleSender:
-    def __init__(self, out_stream: socket.SocketIO):
-        self.writer = out_stream
-    
+    """
+        @description Writes HTTP/1.1 responses to a socket. The heading and headers are gathered in one reusable buffer and sent along with the body in `send_body`.
+        @note Only the sending calls (`flush`, `send_raw` and `send_body`) touch the socket, so their results are the ones to check for write errors. `send_heading`, `send_header` and `queue_raw` just buffer.
+    """
+    def __init__(self, out_socket: socket.socket = None):
+        self.writer = out_socket
+        self.out_buffer = bytearray()
+        self.cache_headers = None
+        self.resource = None
+        self.resource_request = None
+
+    def attach(self, out_socket: socket.socket):
+        """
+            @description Binds this sender to a new client connection.
+        """
+        self.writer = out_socket
+        self.out_buffer.clear()
+        self.cache_headers = None
+        self.resource = None
+        self.resource_request = None
+
+    def set_cache_headers(self, cache_headers):
+        """
+            @description Gives the current request's resolved cache policy headers (see `utils/cachepolicy.py`), sent with a successful body unless the handler sends its own `Cache-Control`.
+        """
+        self.cache_headers = cache_headers
+
+    def queue_cache_headers(self):
+        """
+            @description Appends the route's cache policy headers to the pending buffer, for replies written as raw bytes rather than through `send_body`.
+        """
+        cache_headers = self.cache_headers
+        self.cache_headers = None
+
+        if cache_headers is not None:
+            self.out_buffer += cache_headers.get_bytes()
+
+    def set_resource(self, resource, request: SimpleRequest):
+        """
+            @description Gives the static resource of the current route, if any. When a handler sends exactly that resource's bytes, `send_body` adds its `ETag` and swaps in its gzip variant if `request` accepts one.
+        """
+        self.resource = resource
+        self.resource_request = request
+
+    def add_resource_headers(self, resource, request: SimpleRequest, body_data: bytes):
+        """
+            @description Adds the validator and encoding headers of a static resource body. Returns the body to send, compressed when the client accepts it.
+        """
+        gzip_data = resource.get_encoded("gzip")
+
+        if gzip_data is not None:
+            # NOTE caches must key on Accept-Encoding whichever variant this reply carries.
+            self.send_header("Vary", "Accept-Encoding")
+
+            if request.accepts_encoding("gzip"):
+                self.send_header("ETag", resource.get_etag("gzip"))
+                self.send_header("Content-Encoding", "gzip")
+                return gzip_data
+
+        etag = resource.get_etag()
+
+        if etag is not None:
+            self.send_header("ETag", etag)
+
+        return body_data
+
+    def detach(self):
+        """
+            @description Hands this sender's connection over to the caller, such as an event stream, which then owns and closes it. Workers and lanes see `is_detached()` after the handler returns and let go of the socket.
+        """
+        out_socket = self.writer
+        self.writer = None
+        self.out_buffer.clear()
+
+        return out_socket
+
+    def is_detached(self):
+        return self.writer is None
+
     def send_heading(self, status_code: str):
-        checked_stat_code = status_code
-        temp_stat_msg = consts.HTTP_STATS[checked_stat_code]
+        temp_buf = RES_STATUS_LINES.get(status_code)
+
+        if temp_buf is None:
+            temp_buf = RES_STATUS_LINES["501"]
 
-        if temp_stat_msg is None:
-            checked_stat_code = "501"
-            temp_stat_msg = consts.HTTP_STATS[checked_stat_code]
-        
-        temp_buf = f'{consts.HTTP_SCHEMA} {checked_stat_code} {temp_stat_msg}{consts.HTTP_ENDL}'.encode(encoding="ascii")
+        if status_code not in SENDER_CACHEABLE_STATUSES:
+            self.cache_headers = None
 
-        return self.writer.write(temp_buf) > 0
+        self.out_buffer += temp_buf
 
     def send_header(self, header_name: str, header_value: str):
-        temp_buf = f'{header_name}: {header_value}{consts.HTTP_ENDL}'.encode(encoding="ascii")
+        if header_name == "Cache-Control":
+            self.cache_headers = None
+
+        self.out_buffer += f'{header_name}: {header_value}{consts.HTTP_ENDL}'.encode(encoding="ascii")
 
-        return self.writer.write(temp_buf) > 0
+    def flush(self, body_data: bytes = None):
+        """
+            @description Sends the buffered heading and headers, plus an optional body.
+        """
+        try:
+            if body_data:
+                if len(body_data) <= SENDER_COALESCE_SIZE:
+                    self.out_buffer += body_data
+                    self.writer.sendall(self.out_buffer)
+                else:
+                    self.writer.sendall(self.out_buffer)
+                    self.writer.sendall(body_data)
+            elif self.out_buffer:
+                self.writer.sendall(self.out_buffer)
+        except OSError:
+            return False
+        finally:
+            self.out_buffer.clear()
+
+        return True
+
+    def queue_raw(self, data: bytes):
+        """
+            @description Appends already formatted heading or header bytes to the pending buffer without sending yet.
+        """
+        self.out_buffer += data
+
+    def send_raw(self, data: bytes):
+        """
+            @description Sends the buffered heading and headers followed by already formatted bytes, such as part of a streamed body.
+        """
+        return self.flush(data)
 
     def send_body(self, body_code: int, mime_str: str, body_data: bytes):
-        write_ok = False
-        
+        cache_headers = self.cache_headers
+        self.cache_headers = None
+        resource = self.resource
+        self.resource = None
+
+        if cache_headers is not None and body_code != RES_ERR_BODY:
+            self.out_buffer += cache_headers.get_bytes()
+
+        # NOTE only a body that is the route's own resource gets its ETag and variant, so handlers building other bodies are unaffected.
+        if resource is not None and body_code != RES_ERR_BODY and body_data is resource.as_bytes():
+            body_data = self.add_resource_headers(resource, self.resource_request, body_data)
+
         if body_code == RES_GET_BODY:
             self.send_header("Content-Type", mime_str)
             self.send_header("Content-Length", f'{len(body_data)}')
-            self.writer.write(consts.HTTP_ENDL.encode(encoding="ascii"))
-            write_ok = self.writer.write(body_data) > 0
+            self.out_buffer += consts.HTTP_ENDL_BYTES
+            return self.flush(body_data)
         elif body_code == RES_HEAD_BODY:  # NOTE: if omit_flag is present, write headers for peeked resource only for HEAD reqs.
             self.send_header("Content-Type", mime_str)
             self.send_header("Content-Length", f'{len(body_data)}')
-            write_ok = self.writer.write(consts.HTTP_ENDL.encode(encoding="ascii")) > 0
         else:  # NOTE: otherwise, write an empty body for a non-HEAD reply such as an HTTP or server error message.
             self.send_header("Content-Type", "*/*")
             self.send_header("Content-Length", "0")
-            write_ok = self.writer.write(consts.HTTP_ENDL.encode(encoding="ascii")) > 0
 
-        self.writer.flush()
+        self.out_buffer += consts.HTTP_ENDL_BYTES
 
-        return write_ok
+        return self.flush()
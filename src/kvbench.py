@@ -0,0 +1,137 @@
+"""
+    @file kvbench.py\n
+    @description Benchmarks the handler state stores under many threads against one dict behind one lock, then checks the shared memory store's counters across processes.\n
+    @author Derek Tan
+"""
+
+import argparse
+import multiprocessing
+import random
+from threading import Lock, Thread, Barrier
+from time import perf_counter
+
+from utils.kvstore import ShardedStore, SharedMemoryStore
+
+class LockedDict:
+    """
+        @description Baseline: the plain dict `HandlerCtx.attributes` used to be, made safe with one lock.
+    """
+    def __init__(self):
+        self.lock = Lock()
+        self.data = {}
+
+    def get(self, key, default = None):
+        with self.lock:
+            return self.data.get(key, default)
+
+    def set(self, key, value, ttl: float = None):
+        with self.lock:
+            self.data[key] = value
+
+    def incr(self, key, delta: int = 1, ttl: float = None):
+        with self.lock:
+            value = self.data.get(key, 0) + delta
+            self.data[key] = value
+
+        return value
+
+    def update(self, key, func, default = None, ttl: float = None):
+        with self.lock:
+            value = func(self.data.get(key, default))
+            self.data[key] = value
+
+        return value
+
+def touch_session(session: dict):
+    """
+        @description A heavier write: copies a small session dict with one field changed, as handlers updating sessions would.
+    """
+    result = dict(session)
+    result["hits"] = result.get("hits", 0) + 1
+    result["last"] = sorted(result.get("pages", ()))[-3:]
+
+    return result
+
+def run_ops(store, keys: list[str], op_count: int, write_ratio: float, write_op, barrier: Barrier, seed: int):
+    picker = random.Random(seed)
+    plan = [(picker.choice(keys), picker.random() < write_ratio) for _ in range(op_count)]
+    barrier.wait()
+
+    for key, is_write in plan:
+        if is_write:
+            write_op(store, key)
+        else:
+            store.get(key)
+
+def bench(store, thread_count: int, op_count: int, write_ratio: float, write_op, key_count: int):
+    keys = [f'key{n}' for n in range(key_count)]
+
+    for key in keys:
+        store.set(key, {"pages": [f'/page{n}' for n in range(16)]} if write_op is update_session else 0)
+
+    barrier = Barrier(thread_count + 1)
+    threads = [Thread(target=run_ops, args=(store, keys, op_count, write_ratio, write_op, barrier, n)) for n in range(thread_count)]
+
+    for thread in threads:
+        thread.start()
+
+    # NOTE start timing before releasing the threads, as they may finish before this thread runs again.
+    start_time = perf_counter()
+    barrier.wait()
+
+    for thread in threads:
+        thread.join()
+
+    return thread_count * op_count / (perf_counter() - start_time)
+
+def incr_counter(store, key: str):
+    store.incr(key)
+
+def update_session(store, key: str):
+    store.update(key, touch_session)
+
+def count_in_child(store: SharedMemoryStore, op_count: int):
+    for n in range(op_count):
+        store.incr(f'counter{n % 8}')
+
+def main():
+    """
+        @description Runs the thread benchmarks for each write mix, then the shared memory check across processes.
+    """
+    arg_parser = argparse.ArgumentParser(description="Benchmark the handler state stores.")
+    arg_parser.add_argument("--threads", type=int, nargs="+", default=[1, 8, 32])
+    arg_parser.add_argument("--ops", type=int, default=20000, help="operations per thread")
+    arg_parser.add_argument("--keys", type=int, default=256)
+    arg_parser.add_argument("--procs", type=int, default=4, help="processes for the shared memory check")
+    args = arg_parser.parse_args()
+
+    stores = (
+        ("locked dict", LockedDict),
+        ("sharded", ShardedStore)
+    )
+
+    for write_name, write_op in (("counter incr", incr_counter), ("session update", update_session)):
+        for write_ratio in (0.05, 0.5):
+            print(f'{write_name}, {int(write_ratio * 100)}% writes:')
+
+            for thread_count in args.threads:
+                results = [f'{name} {bench(make_store(), thread_count, args.ops, write_ratio, write_op, args.keys):,.0f}' for name, make_store in stores]
+                print(f'  {thread_count:3} threads, ops/s: ' + ", ".join(results))
+
+    shared_store = SharedMemoryStore()
+    children = [multiprocessing.get_context("fork").Process(target=count_in_child, args=(shared_store, args.ops)) for _ in range(args.procs)]
+    start_time = perf_counter()
+
+    for child in children:
+        child.start()
+
+    for child in children:
+        child.join()
+
+    elapsed = perf_counter() - start_time
+    counted = sum(shared_store.get(f'counter{n}', 0) for n in range(8))
+    print(f'shared memory: {args.procs} processes counted {counted} of {args.procs * args.ops} increments, {counted / elapsed:,.0f} ops/s')
+    shared_store.cleanup()
+
+if __name__ == "__main__":
+    main()
@@ -5,50 +5,13 @@
     @author Derek Tan
 """
 
-import atexit  # For key interrupt handler
-import json
 from http1.request import SimpleRequest
-from http1.scanner import HttpScanner
 from http1.sender import SimpleSender, RES_ERR_BODY, RES_GET_BODY, RES_HEAD_BODY
 from handlers.ctx.context import HandlerCtx
 
+from core.config import load_config
 from core.instance import Tippy, TIPPY_VERSION_STRING
-
-my_server = None
-
-# MISC. HELPERS
-
-def get_config_json(file_path: str):
-    """
-        @description Reads a config file for the server startup.
-    """
-    result = {
-        "serveaddr": "localhost",
-        "port": 8080
-    }
-
-    fs = None
-    file_size = 0
-    raw_json = None
-
-    try:
-        fs = open(file_path, "r")
-
-        fs.seek(0, 2)
-        file_size = fs.tell()
-        fs.seek(0, 0)
-
-        raw_json = fs.read(file_size)
-        result = json.loads(raw_json)
-    except OSError as err:
-        print(err.with_traceback(err))
-    except Exception as ex:
-        print(ex.with_traceback(ex))
-    else:
-        if fs is not None:
-            fs.close()
-
-    return result
+from utils.profiling import install_profile_signals
 
 # HANDLERS
 
@@ -145,25 +108,30 @@ def handle_css(context: HandlerCtx, request: SimpleRequest, response: SimpleSend
     else:
         return response.send_body(RES_GET_BODY, temp_resource.get_mime_type(), temp_resource.as_bytes())
 
-def interrupt_handler():
+# RUN SERVER
+
+def main():
     """
-        @summary This is an `atexit` handler. This closes and stops the listening producer before stopping all workers. No race conditions may occur since the closings in the `Tippy.stop_service` method are done in order.\n
-        @author Derek Tan
+        @description Loads `./config.json`, registers the app handlers and serves until CTRL+C.
     """
-    my_server.stop_service()
-    print('Stopped Tippy web server.')
+    my_server = Tippy(config=load_config('./config.json'))
 
-# RUN SERVER
+    my_server.set_fallback_handler(handle_fallback)
+    my_server.set_handler(["/index.html"], handle_index)
+    my_server.set_handler(["/info.html"], handle_info)
+    my_server.set_handler(["/style.css"], handle_css)
+    my_server.set_handler(["/favicon-32x32.png", "/favicon.ico"], handle_favicon)
 
-atexit.register(interrupt_handler)  # NOTE This handles SIGINTs (CTRL+C) to gracefully close the server.
+    install_profile_signals(my_server.profiler)  # NOTE `kill -USR1` toggles stack sampling, `kill -USR2` profiles the next requests.
 
-config_dict = get_config_json('./config.json')
-my_server = Tippy(host_name=config_dict['serveaddr'], host_port=config_dict['port'], backlog=config_dict['backlog'])
+    try:
+        # NOTE leaving the `with` block, including by CTRL+C, stops the producer before the workers.
+        with my_server:
+            my_server.wait_stopped()
+    except KeyboardInterrupt:
+        pass
 
-my_server.set_fallback_handler(handle_fallback)
-my_server.set_handler(["/index.html"], handle_index)
-my_server.set_handler(["/info.html"], handle_info)
-my_server.set_handler(["/style.css"], handle_css)
-my_server.set_handler(["/favicon-32x32.png", "/favicon.ico"], handle_favicon)
+    print('Stopped Tippy web server.')
 
-my_server.run_service()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+"""
+    @file pack.py\n
+    @description Build step packing a public folder into an asset bundle for `Tippy(bundle_path=...)`.\n
+    @author Derek Tan
+"""
+
+import sys
+from time import perf_counter
+
+from utils.bundle import build_bundle
+
+def main():
+    """
+        @description Packs the folder named by the first argument into the bundle file named by the second.
+    """
+    if len(sys.argv) != 3:
+        print('Usage: python src/pack.py <public folder> <bundle file>')
+        sys.exit(1)
+
+    start_time = perf_counter()
+    file_count = build_bundle(sys.argv[1], sys.argv[2])
+
+    print(f'Packed {file_count} files into {sys.argv[2]} in {(perf_counter() - start_time) * 1000:.1f} ms')
+
+if __name__ == "__main__":
+    main()
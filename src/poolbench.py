@@ -0,0 +1,119 @@
+"""
+    @file poolbench.py\n
+    @description Benchmarks request latency under bursty keep-alive load for fixed worker pools against the elastic pool, and reports how far the elastic pool grew and shrank.\n
+    @author Derek Tan
+"""
+
+import argparse
+import socket
+from threading import Thread, Barrier
+from time import monotonic, sleep
+
+from core.config import TippyConfig
+from core.instance import Tippy
+from http1.request import SimpleRequest
+from http1.sender import SimpleSender, RES_GET_BODY, RES_ERR_BODY
+from http1.scanner import HttpScanner
+from handlers.ctx.context import HandlerCtx
+from utils.replay import ReplayResponse, read_response
+
+def make_work_handler(work_ms: float):
+    def handle_work(context: HandlerCtx, request: SimpleRequest, response: SimpleSender):
+        # NOTE stands in for a handler waiting on a database or disk, which holds its worker without using the CPU.
+        sleep(work_ms / 1000)
+        response.send_heading("200")
+        response.send_header("Date", context.get_gmt_str())
+
+        return response.send_body(RES_GET_BODY, "text/plain", b'done\n')
+
+    return handle_work
+
+def handle_fallback(context: HandlerCtx, request: SimpleRequest, response: SimpleSender):
+    response.send_heading("404")
+
+    return response.send_body(RES_ERR_BODY, "*/*", None)
+
+def run_client(port: int, request_count: int, barrier: Barrier, latencies: list):
+    barrier.wait()
+    start_time = monotonic()
+
+    try:
+        client_sock = socket.create_connection(("localhost", port), timeout=30.0)
+    except OSError:
+        return
+
+    scanner = HttpScanner(client_sock)
+
+    # NOTE the first request's latency includes waiting for a worker to take the connection.
+    try:
+        for _ in range(request_count):
+            client_sock.sendall(b"GET /work HTTP/1.1\r\nHost: bench\r\n\r\n")
+            read_response(scanner, "GET", ReplayResponse())
+            latencies.append(monotonic() - start_time)
+            start_time = monotonic()
+    except OSError:
+        pass
+    finally:
+        client_sock.close()
+
+def run_bursts(server: Tippy, burst_count: int, burst_size: int, request_count: int, gap: float):
+    latencies = []
+    port = server.get_port()
+
+    for _ in range(burst_count):
+        barrier = Barrier(burst_size)
+        clients = [Thread(target=run_client, args=(port, request_count, barrier, latencies)) for _ in range(burst_size)]
+
+        for client in clients:
+            client.start()
+
+        for client in clients:
+            client.join()
+
+        sleep(gap)
+
+    return sorted(latencies)
+
+def percentile(values: list, fraction: float):
+    return values[min(len(values) - 1, int(fraction * len(values)))] * 1000 if values else 0.0
+
+def main():
+    """
+        @description Runs the same bursts against each pool in turn, then prints their latencies and how far each pool scaled.
+    """
+    arg_parser = argparse.ArgumentParser(description="Benchmark fixed and elastic worker pools under bursty load.")
+    arg_parser.add_argument("--bursts", type=int, default=5)
+    arg_parser.add_argument("--burst", type=int, default=32, help="concurrent connections per burst")
+    arg_parser.add_argument("--requests", type=int, default=10, help="keep-alive requests per connection")
+    arg_parser.add_argument("--work", type=float, default=2.0, help="milliseconds each request holds its worker")
+    arg_parser.add_argument("--gap", type=float, default=2.0, help="idle seconds between bursts")
+    arg_parser.add_argument("--max-workers", type=int, default=32)
+    arg_parser.add_argument("--idle-timeout", type=float, default=1.0, help="seconds an elastic worker idles before retiring")
+    args = arg_parser.parse_args()
+
+    pools = (
+        ("fixed 2", 2, 2),
+        (f'fixed {args.max_workers}', args.max_workers, args.max_workers),
+        (f'elastic 2-{args.max_workers}', 2, args.max_workers)
+    )
+
+    results = []
+
+    for name, min_workers, max_workers in pools:
+        server = Tippy(config=TippyConfig(host_port=0, backlog=args.burst * 2, min_workers=min_workers, max_workers=max_workers, worker_idle_timeout=args.idle_timeout))
+        server.set_fallback_handler(handle_fallback)
+        server.set_handler(["/work"], make_work_handler(args.work))
+
+        with server:
+            latencies = run_bursts(server, args.bursts, args.burst, args.requests, args.gap)
+            stats = server.get_pool_stats()
+
+        results.append((name, latencies, stats))
+
+    print(f'{args.bursts} bursts of {args.burst} connections x {args.requests} requests, {args.work:.1f} ms of work each, {args.gap:.1f} s apart:')
+
+    for name, latencies, stats in results:
+        print(f'  {name:>12}: {len(latencies)} answered, p50 {percentile(latencies, 0.5):7.2f} ms, p99 {percentile(latencies, 0.99):8.2f} ms, max {percentile(latencies, 1.0):8.2f} ms | workers peak {stats["peak"]}, at end {stats["size"]}, spawned {stats["spawned"]}, retired {stats["retired"]}')
+
+if __name__ == "__main__":
+    main()
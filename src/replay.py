@@ -0,0 +1,54 @@
+"""
+    @file replay.py\n
+    @description Replays a traffic capture from `Tippy(recorder=...)` against a server, reporting latency and throughput, and optionally diffs the responses of a second server.\n
+    @author Derek Tan
+"""
+
+import argparse
+
+from utils.traffic import read_capture
+from utils.replay import run_replay, summarize, diff_results
+
+def parse_target(text: str):
+    host, _, port = text.rpartition(":")
+
+    return (host or "localhost", int(port))
+
+def print_summary(name: str, stats: dict):
+    print(f'{name}: {stats["answered"]}/{stats["requests"]} answered in {stats["wall_s"]:.2f} s, {stats["throughput_rps"]:.1f} req/s')
+    print(f'  latency p50 {stats["p50_ms"]:.2f} ms, p90 {stats["p90_ms"]:.2f} ms, p99 {stats["p99_ms"]:.2f} ms, max {stats["max_ms"]:.2f} ms')
+
+def main():
+    """
+        @description Replays the capture against `--target`, and against `--compare` when given to diff their responses.
+    """
+    arg_parser = argparse.ArgumentParser(description="Replay captured traffic against a server.")
+    arg_parser.add_argument("capture", help="capture log written by a TrafficRecorder")
+    arg_parser.add_argument("--target", default="localhost:8080", help="server to replay against, as host:port")
+    arg_parser.add_argument("--compare", default=None, help="second server to replay against and diff responses with")
+    arg_parser.add_argument("--speed", type=float, default=1.0, help="time scale of the replay, 0 for no waits")
+    arg_parser.add_argument("--max-diffs", type=int, default=10, help="most response diffs to print")
+    args = arg_parser.parse_args()
+
+    conns = read_capture(args.capture)
+    print(f'Loaded {len(conns)} connections from {args.capture}')
+
+    base_results, base_time = run_replay(parse_target(args.target), conns, args.speed)
+    print_summary(args.target, summarize(base_results, base_time))
+
+    if args.compare is not None:
+        other_results, other_time = run_replay(parse_target(args.compare), conns, args.speed)
+        print_summary(args.compare, summarize(other_results, other_time))
+
+        diff_count = 0
+
+        for diff_text in diff_results(base_results, other_results, args.target, args.compare):
+            if diff_count < args.max_diffs:
+                print(diff_text)
+
+            diff_count += 1
+
+        print(f'{diff_count} responses differ')
+
+if __name__ == "__main__":
+    main()
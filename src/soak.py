@@ -0,0 +1,79 @@
+"""
+    @file soak.py\n
+    @description Soaks an in-process Tippy with steady mixed traffic for a long time, sampling RSS, traced memory, open FDs, threads and latency, and fails when any of them grows past its threshold.\n
+    @author Derek Tan
+"""
+
+import argparse
+import csv
+import sys
+
+from core.config import TIPPY_DEFAULT_WWW_DIR
+from utils.soak import SoakHarness, SOAK_POOL_ELASTIC, SOAK_POOL_FIXED
+
+SOAK_REPORT_FIELDS = ["elapsed_s", "rss_mb", "traced_mb", "fds", "threads", "requests", "errors", "p50_ms", "p99_ms"]
+
+def print_sample(sample: dict):
+    print(f'{sample["elapsed_s"]:8.1f} s  rss {sample["rss_mb"]:7.2f} MB  traced {sample["traced_mb"]:7.3f} MB  fds {sample["fds"]:4}  threads {sample["threads"]:3}  reqs {sample["requests"]:6}  errs {sample["errors"]:4}  p50 {sample["p50_ms"]:6.2f} ms  p99 {sample["p99_ms"]:7.2f} ms')
+
+def main():
+    """
+        @description Soaks for `--duration` seconds, then prints the report and exits with status 1 when any threshold failed.
+    """
+    arg_parser = argparse.ArgumentParser(description="Soak a local server and check it for leaks and latency drift.")
+    arg_parser.add_argument("--duration", type=float, default=3600.0, help="seconds to soak for")
+    arg_parser.add_argument("--rate", type=float, default=200.0, help="requests per second across all clients")
+    arg_parser.add_argument("--clients", type=int, default=8, help="client threads")
+    arg_parser.add_argument("--interval", type=float, default=10.0, help="seconds between samples")
+    arg_parser.add_argument("--warmup", type=float, default=30.0, help="seconds before the growth baseline is taken")
+    arg_parser.add_argument("--pool", choices=[SOAK_POOL_ELASTIC, SOAK_POOL_FIXED], default=SOAK_POOL_ELASTIC, help="default elastic worker pool, or one worker per client")
+    arg_parser.add_argument("--public", default=TIPPY_DEFAULT_WWW_DIR, help="folder of static files to serve")
+    arg_parser.add_argument("--report", default=None, help="CSV file for the sample time series")
+    arg_parser.add_argument("--max-rss-growth", type=float, default=16.0, help="MB of RSS growth allowed")
+    arg_parser.add_argument("--max-traced-growth", type=float, default=4.0, help="MB of tracemalloc growth allowed")
+    arg_parser.add_argument("--max-fd-growth", type=int, default=8)
+    arg_parser.add_argument("--max-thread-growth", type=int, default=2)
+    arg_parser.add_argument("--max-p99-drift", type=float, default=3.0, help="allowed ratio of late to early p99 latency")
+    arg_parser.add_argument("--max-error-rate", type=float, default=0.01)
+    args = arg_parser.parse_args()
+
+    thresholds = {
+        "max_rss_growth_mb": args.max_rss_growth,
+        "max_traced_growth_mb": args.max_traced_growth,
+        "max_fd_growth": args.max_fd_growth,
+        "max_thread_growth": args.max_thread_growth,
+        "max_p99_drift": args.max_p99_drift,
+        "max_error_rate": args.max_error_rate
+    }
+
+    harness = SoakHarness(args.public, args.rate, args.clients, args.interval, args.warmup, thresholds, args.pool)
+    print(f'Soaking for {args.duration:.0f} s at {args.rate:.0f} req/s over {args.clients} clients, {args.pool} pool')
+    samples = harness.run(args.duration, print_sample)
+
+    if args.report is not None:
+        with open(args.report, "w", newline="") as fs:
+            writer = csv.DictWriter(fs, fieldnames=SOAK_REPORT_FIELDS)
+            writer.writeheader()
+            writer.writerows(samples)
+
+        print(f'Wrote {len(samples)} samples to {args.report}')
+
+    print("Top allocation growth since warmup:")
+
+    for line in harness.top_allocators:
+        print(f'  {line}')
+
+    print("Requests by scenario: " + ", ".join(f'{name} {count}' for name, count in harness.scenario_counts.items()))
+    print(f'Workers: peak {harness.pool_stats["peak"]}, at stop {harness.pool_stats["size"]}, spawned {harness.pool_stats["spawned"]}, retired {harness.pool_stats["retired"]}')
+    failures = harness.judge()
+
+    if failures:
+        for reason in failures:
+            print(f'FAIL: {reason}')
+
+        sys.exit(1)
+
+    print("PASS")
+
+if __name__ == "__main__":
+    main()
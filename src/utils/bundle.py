@@ -0,0 +1,205 @@
+"""
+    @file bundle.py
+    @description Packs a public folder into one asset bundle file, and serves resources straight out of a memory map of it.
+    @author Derek Tan
+"""
+
+import mmap
+import os
+import struct
+import utils.resources as resources
+
+BUNDLE_MAGIC = b"TIPPYBN1"
+BUNDLE_GZIP_MIN_SAVING = 0.1  # NOTE: only keep a gzip variant when it is at least 10% smaller.
+BUNDLE_GZIP_ETAG_SUFFIX = "-gzip"  # NOTE: variants are distinct representations, so each needs its own strong ETag.
+
+# Layout: header, then fixed-size index records sorted by path, then a string table, then file data.
+# Header: magic, record count, string table offset, string table length.
+BUNDLE_HEADER = struct.Struct("<8sIQQ")
+# Record: path offset + length and MIME offset + length in the string table, mtime, data offset + length, gzip offset + length (0 if none), ETag.
+BUNDLE_RECORD = struct.Struct("<IHIHqQQQQ18s")
+
+class BundledResource:
+    """
+        @description A resource inside a mapped bundle. Matches the `StaticResource` interface, but its bytes are zero-copy slices of the map.
+    """
+    __slots__ = ("type", "data", "length", "modify_date", "etag", "gzip_data")
+
+    def __init__(self, mime_type: str, data: memoryview, modify_date: int, etag: str, gzip_data: memoryview):
+        self.type = mime_type
+        self.data = data
+        self.length = len(data)
+        self.modify_date = modify_date
+        self.etag = etag
+        self.gzip_data = gzip_data
+
+    def get_mime_type(self):
+        return self.type
+
+    def get_content_len(self):
+        return self.length
+
+    def get_modify_date(self):
+        return self.modify_date
+
+    def get_etag(self, encoding: str = None):
+        """
+            @description Gets the ETag of the plain bytes, or of the variant for `encoding`. Gives `None` when there is no such variant.
+        """
+        if encoding is None:
+            return self.etag
+
+        if encoding == "gzip" and self.gzip_data is not None:
+            return f'{self.etag[:-1]}{BUNDLE_GZIP_ETAG_SUFFIX}"'
+
+        return None
+
+    def get_encoded(self, encoding: str):
+        """
+            @description Gets a precomputed compressed variant, or `None` if the bundle has none for this encoding.
+        """
+        if encoding == "gzip":
+            return self.gzip_data
+
+        return None
+
+    def as_bytes(self):
+        return self.data
+
+    def as_text(self):
+        return bytes(self.data).decode(encoding="ascii")
+
+class AssetBundle:
+    """
+        @description Read-only view of a bundle file. Opening it only maps the file and reads the header, so startup cost does not grow with the file count. Processes mapping the same bundle share its pages.
+        @note The map never changes and lookups keep no state, so any number of threads may call `find` at once.
+    """
+    def __init__(self, bundle_path: str):
+        with open(bundle_path, "rb") as fs:
+            self.map = mmap.mmap(fs.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.view = memoryview(self.map)
+        magic, self.count, self.strings_offset, strings_len = BUNDLE_HEADER.unpack_from(self.map, 0)
+
+        if magic != BUNDLE_MAGIC:
+            raise ValueError(f'{__name__}: {bundle_path} is not an asset bundle')
+
+    def read_record(self, index: int):
+        return BUNDLE_RECORD.unpack_from(self.map, BUNDLE_HEADER.size + index * BUNDLE_RECORD.size)
+
+    def read_string(self, offset: int, length: int):
+        start = self.strings_offset + offset
+
+        return self.map[start : start + length]
+
+    def find(self, res_path: str):
+        """
+            @description Binary searches the sorted index for a path such as `/index.html`. Returns a `BundledResource` or `None`.
+        """
+        key = res_path.encode(encoding="utf-8")
+        low = 0
+        high = self.count
+
+        while low < high:
+            middle = (low + high) // 2
+            record = self.read_record(middle)
+            middle_key = self.read_string(record[0], record[1])
+
+            if middle_key < key:
+                low = middle + 1
+            elif middle_key > key:
+                high = middle
+            else:
+                return self.make_resource(record)
+
+        return None
+
+    def make_resource(self, record: tuple):
+        _, _, mime_off, mime_len, mtime, data_off, data_len, gzip_off, gzip_len, etag = record
+        gzip_data = self.view[gzip_off : gzip_off + gzip_len] if gzip_len > 0 else None
+
+        return BundledResource(self.read_string(mime_off, mime_len).decode(encoding="ascii"), self.view[data_off : data_off + data_len], mtime, etag.decode(encoding="ascii"), gzip_data)
+
+    def iter_paths(self):
+        for index in range(self.count):
+            record = self.read_record(index)
+            yield self.read_string(record[0], record[1]).decode(encoding="utf-8")
+
+    def close(self):
+        """
+            @note The map only closes once no resource slices of it are left, so one still held elsewhere leaves it to the garbage collector.
+        """
+        self.view.release()
+
+        try:
+            self.map.close()
+        except BufferError:
+            print(f'{__name__}: Bundle still in use, leaving its map open')
+
+def get_file_mime(file_path: str):
+    file_ext = os.path.splitext(file_path)[1][1:]
+
+    return resources.FILE_EXTS_TO_MIME.get(file_ext, resources.MIME_TYPE_ANY)
+
+def build_bundle(public_dirname: str, bundle_path: str):
+    """
+        @description Packs every file under `public_dirname` into a bundle at `bundle_path`. Paths are stored as `/<relative path>` with forward slashes.
+        @returns The number of packed files.
+    """
+    # NOTE: only the build step compresses and hashes, so servers mapping a bundle skip these imports.
+    import gzip
+    import hashlib
+
+    entries = []
+
+    for dir_path, _, file_names in os.walk(public_dirname):
+        for file_name in file_names:
+            file_path = os.path.join(dir_path, file_name)
+            res_path = "/" + os.path.relpath(file_path, public_dirname).replace(os.sep, "/")
+            entries.append((res_path.encode(encoding="utf-8"), file_path))
+
+    entries.sort()
+
+    strings = bytearray()
+    string_offsets = {}
+
+    def add_string(text: bytes):
+        if text not in string_offsets:
+            string_offsets[text] = len(strings)
+            strings.extend(text)
+
+        return string_offsets[text]
+
+    blobs = []
+
+    for res_path, file_path in entries:
+        with open(file_path, "rb") as fs:
+            data = fs.read()
+
+        gzip_data = gzip.compress(data, 9, mtime=0)
+
+        if len(gzip_data) > len(data) * (1 - BUNDLE_GZIP_MIN_SAVING):
+            gzip_data = b''
+
+        mime = get_file_mime(file_path).encode(encoding="ascii")
+        etag = f'"{hashlib.blake2b(data, digest_size=8).hexdigest()}"'.encode(encoding="ascii")
+        blobs.append((add_string(res_path), len(res_path), add_string(mime), len(mime), int(os.stat(file_path).st_mtime), data, gzip_data, etag))
+
+    strings_offset = BUNDLE_HEADER.size + len(blobs) * BUNDLE_RECORD.size
+    data_offset = strings_offset + len(strings)
+
+    with open(bundle_path, "wb") as out:
+        out.write(BUNDLE_HEADER.pack(BUNDLE_MAGIC, len(blobs), strings_offset, len(strings)))
+
+        for path_off, path_len, mime_off, mime_len, mtime, data, gzip_data, etag in blobs:
+            gzip_offset = data_offset + len(data) if gzip_data else 0
+            out.write(BUNDLE_RECORD.pack(path_off, path_len, mime_off, mime_len, mtime, data_offset, len(data), gzip_offset, len(gzip_data), etag))
+            data_offset += len(data) + len(gzip_data)
+
+        out.write(strings)
+
+        for blob in blobs:
+            out.write(blob[5])
+            out.write(blob[6])
+
+    return len(blobs)
@@ -0,0 +1,154 @@
+"""
+    @file cachepolicy.py
+    @description Contains client caching rules, matched by path and MIME type once per route into ready-made `Cache-Control` and `Expires` header bytes.
+    @author Derek Tan
+"""
+
+import time
+from fnmatch import fnmatchcase
+
+import http1.consts as consts
+from utils.rescache import ResourceCache
+
+class CacheRule:
+    """
+        @description One caching rule. `path` is a glob over request paths like `"/static/*"` and `mime` an optional glob over MIME types like `"image/*"`. The other arguments are the `Cache-Control` directives to send, plus an `Expires` of `max_age` seconds from now when `expires` is set.
+        @note A rule with no directives sends no headers, which exempts its paths from later rules.
+    """
+    def __init__(self, path: str = "*", mime: str = None, max_age: int = None, s_maxage: int = None, stale_while_revalidate: int = None, immutable: bool = False, no_cache: bool = False, no_store: bool = False, private: bool = False, expires: bool = False):
+        if expires and max_age is None:
+            raise ValueError(f'{__name__}: Rule for {path} sets expires without max_age')
+
+        for name, seconds in (("max_age", max_age), ("s_maxage", s_maxage), ("stale_while_revalidate", stale_while_revalidate)):
+            if seconds is not None and seconds < 0:
+                raise ValueError(f'{__name__}: Rule for {path} has negative {name}')
+
+        self.path = path
+        self.mime = mime
+        self.max_age = max_age
+        self.s_maxage = s_maxage
+        self.stale_while_revalidate = stale_while_revalidate
+        self.immutable = immutable
+        self.no_cache = no_cache
+        self.no_store = no_store
+        self.private = private
+        self.expires = expires
+        self.directives = self.to_directives()
+
+    def matches(self, res_path: str, mime_type: str = None):
+        """
+            @note A rule naming a MIME type never matches dynamic routes, whose type is unknown until their handler runs.
+        """
+        if not fnmatchcase(res_path, self.path):
+            return False
+
+        if self.mime is None:
+            return True
+
+        return mime_type is not None and fnmatchcase(mime_type, self.mime)
+
+    def to_directives(self):
+        directives = []
+
+        if self.private:
+            directives.append("private")
+
+        if self.no_store:
+            directives.append("no-store")
+
+        if self.no_cache:
+            directives.append("no-cache")
+
+        if self.max_age is not None:
+            directives.append(f'max-age={self.max_age}')
+
+        if self.s_maxage is not None:
+            directives.append(f's-maxage={self.s_maxage}')
+
+        if self.stale_while_revalidate is not None:
+            directives.append(f'stale-while-revalidate={self.stale_while_revalidate}')
+
+        if self.immutable:
+            directives.append("immutable")
+
+        return ", ".join(directives)
+
+class CacheHeaders:
+    """
+        @description The resolved headers of one route. Only rules with `expires` do any work per response: their `Expires` line is formatted once per second.
+    """
+    __slots__ = ("header_bytes", "expires_after", "expires_cache")
+
+    def __init__(self, rule: CacheRule):
+        self.header_bytes = f'Cache-Control: {rule.directives}{consts.HTTP_ENDL}'.encode(encoding="ascii")
+        self.expires_after = rule.max_age if rule.expires else None
+        self.expires_cache = (0, self.header_bytes)
+
+    def get_bytes(self):
+        if self.expires_after is None:
+            return self.header_bytes
+
+        now = int(time.time())
+        cached_second, cached_bytes = self.expires_cache
+
+        # NOTE the second and its bytes are swapped in as one tuple, so racing workers never mix them up.
+        if cached_second != now:
+            expires_str = time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(now + self.expires_after))
+            cached_bytes = self.header_bytes + f'Expires: {expires_str}{consts.HTTP_ENDL}'.encode(encoding="ascii")
+            self.expires_cache = (now, cached_bytes)
+
+        return cached_bytes
+
+class CachePolicy:
+    """
+        @description An ordered list of `CacheRule`s where the first match wins. Rules are evaluated once per route when resources load or handlers are set, so serving a request is one dict lookup.
+        @note Bundled resources are only found on first request, so they are resolved then and remembered. Paths matching no route are never resolved nor remembered.
+    """
+    def __init__(self, rules: list[CacheRule]):
+        self.rules = rules
+        self.entries: dict[str, CacheHeaders] = {}
+
+    def resolve(self, res_path: str, mime_type: str = None):
+        for rule in self.rules:
+            if rule.matches(res_path, mime_type):
+                return CacheHeaders(rule) if rule.directives else None
+
+        return None
+
+    def prepare_paths(self, res_paths: list[str], rescache: ResourceCache):
+        for res_path in res_paths:
+            resource = rescache.get_item(res_path)
+            self.entries[res_path] = self.resolve(res_path, resource.get_mime_type() if resource is not None else None)
+
+    def prepare_resources(self, rescache: ResourceCache):
+        self.prepare_paths(list(rescache.indexes.keys()), rescache)
+
+    def lookup(self, res_path: str, rescache: ResourceCache):
+        try:
+            return self.entries[res_path]
+        except KeyError:
+            pass
+
+        resource = rescache.get_item(res_path)
+
+        if resource is None:
+            return None
+
+        entry = self.resolve(res_path, resource.get_mime_type())
+        self.entries[res_path] = entry
+
+        return entry
+
+def make_cache_policy(raw_rules: list):
+    """
+        @description Builds a `CachePolicy` from rule dicts as found in a JSON config, whose keys are `CacheRule` argument names.
+    """
+    rules = []
+
+    for raw_rule in raw_rules:
+        try:
+            rules.append(raw_rule if isinstance(raw_rule, CacheRule) else CacheRule(**raw_rule))
+        except TypeError as rule_error:
+            raise ValueError(f'{__name__}: Bad cache rule {raw_rule}: {rule_error}') from rule_error
+
+    return CachePolicy(rules)
@@ -0,0 +1,374 @@
+"""
+    @file kvstore.py
+    @description Thread-safe key-value stores for state shared by handlers, such as counters, sessions and lookups. Locks are striped over shards, so threads working on different keys rarely contend.
+    @author Derek Tan
+"""
+
+import os
+import struct
+import zlib
+from threading import Event, Lock, Thread
+from time import monotonic, time
+
+STORE_DEFAULT_SHARDS = 16
+STORE_DEFAULT_SWEEP = 5.0
+STORE_MISSING = object()
+
+# Shared memory slots: state, value, deadline (0 for none) and the UTF-8 key padded with zeros.
+SHM_SLOT = struct.Struct("<B7xqd48s")
+SHM_KEY_MAX = 48
+SHM_DEFAULT_SLOTS = 1024
+
+SHM_SLOT_EMPTY = 0
+SHM_SLOT_USED = 1
+SHM_SLOT_DELETED = 2
+
+class KeyValueStore:
+    """
+        @description Base of the stores: runs the periodic sweep of expired keys on its own thread between `start` and `cleanup`.
+    """
+    def __init__(self, sweep_interval: float):
+        self.sweep_interval = sweep_interval
+        self.stop_flag = Event()
+        self.sweeper = None
+
+    def start(self):
+        if self.sweep_interval is None or self.sweeper is not None:
+            return
+
+        self.sweeper = Thread(target=self.run_sweeper, name="store_sweeper", daemon=True)
+        self.sweeper.start()
+
+    def run_sweeper(self):
+        while not self.stop_flag.wait(self.sweep_interval):
+            self.sweep()
+
+    def sweep(self):
+        return 0
+
+    def cleanup(self):
+        self.stop_flag.set()
+
+        if self.sweeper is not None:
+            self.sweeper.join()
+            self.sweeper = None
+
+class StoreShard:
+    __slots__ = ("lock", "data", "deadlines")
+
+    def __init__(self):
+        self.lock = Lock()
+        self.data = {}
+        self.deadlines = {}  # NOTE: only keys with a TTL appear here, so sweeps skip the rest.
+
+class ShardedStore(KeyValueStore):
+    """
+        @description In-process store of any values. Every key maps to one of `shard_count` shards, each a dict behind its own lock. Keys may expire after a TTL in seconds: expired keys vanish on access and get swept every `sweep_interval` seconds.
+        @note Values are shared between threads as they are, so change mutable ones only through `update`.
+    """
+    def __init__(self, shard_count: int = STORE_DEFAULT_SHARDS, sweep_interval: float = STORE_DEFAULT_SWEEP):
+        if shard_count < 1 or shard_count & (shard_count - 1):
+            raise ValueError(f'{__name__}: Shard count {shard_count} is not a power of 2')
+
+        super().__init__(sweep_interval)
+        self.shards = [StoreShard() for _ in range(shard_count)]
+        self.shard_mask = shard_count - 1
+
+    def get_shard(self, key):
+        return self.shards[hash(key) & self.shard_mask]
+
+    def read_locked(self, shard: StoreShard, key):
+        """
+            @description Reads a key, dropping it when expired. Needs the shard lock held.
+        """
+        value = shard.data.get(key, STORE_MISSING)
+
+        if value is not STORE_MISSING and key in shard.deadlines and shard.deadlines[key] <= monotonic():
+            self.delete_locked(shard, key)
+            return STORE_MISSING
+
+        return value
+
+    def write_locked(self, shard: StoreShard, key, value, ttl: float = None):
+        shard.data[key] = value
+
+        if ttl is not None:
+            shard.deadlines[key] = monotonic() + ttl
+        else:
+            shard.deadlines.pop(key, None)
+
+    def delete_locked(self, shard: StoreShard, key):
+        if shard.data.pop(key, STORE_MISSING) is STORE_MISSING:
+            return False
+
+        shard.deadlines.pop(key, None)
+
+        return True
+
+    def get(self, key, default = None):
+        shard = self.shards[hash(key) & self.shard_mask]
+
+        with shard.lock:
+            value = shard.data.get(key, STORE_MISSING)
+
+            # NOTE only keys with a TTL need the clock.
+            if value is STORE_MISSING or (shard.deadlines and key in shard.deadlines and self.read_locked(shard, key) is STORE_MISSING):
+                return default
+
+        return value
+
+    def set(self, key, value, ttl: float = None):
+        shard = self.get_shard(key)
+
+        with shard.lock:
+            self.write_locked(shard, key, value, ttl)
+
+    def delete(self, key):
+        shard = self.get_shard(key)
+
+        with shard.lock:
+            return self.delete_locked(shard, key)
+
+    def incr(self, key, delta: int = 1, ttl: float = None):
+        """
+            @description Atomically adds `delta` to a number, starting missing keys at 0. Returns the new value.
+            @note `ttl` only applies when this creates the key, so fixed windows such as rate limits keep their first deadline.
+        """
+        shard = self.shards[hash(key) & self.shard_mask]
+
+        with shard.lock:
+            value = self.read_locked(shard, key)
+
+            if value is STORE_MISSING:
+                value = delta
+                self.write_locked(shard, key, value, ttl)
+            else:
+                value += delta
+                shard.data[key] = value
+
+        return value
+
+    def compare_and_set(self, key, expected, value, ttl: float = None):
+        """
+            @description Atomically sets `key` to `value` if its current value equals `expected`, `None` meaning missing. Returns whether it did.
+        """
+        shard = self.get_shard(key)
+
+        with shard.lock:
+            current = self.read_locked(shard, key)
+
+            if (None if current is STORE_MISSING else current) != expected:
+                return False
+
+            self.write_locked(shard, key, value, ttl)
+
+        return True
+
+    def update(self, key, func, default = None, ttl: float = None):
+        """
+            @description Atomically replaces a value with `func(old value or default)` and returns the result. Keep `func` short, as it runs under the shard lock.
+        """
+        shard = self.get_shard(key)
+
+        with shard.lock:
+            current = self.read_locked(shard, key)
+            value = func(default if current is STORE_MISSING else current)
+            self.write_locked(shard, key, value, ttl)
+
+        return value
+
+    def sweep(self):
+        """
+            @description Drops expired keys one shard at a time, so each lock is only held for its own shard. Returns how many keys were dropped.
+        """
+        dropped_count = 0
+
+        for shard in self.shards:
+            now = monotonic()
+
+            with shard.lock:
+                expired_keys = [key for key, deadline in shard.deadlines.items() if deadline <= now]
+
+                for key in expired_keys:
+                    self.delete_locked(shard, key)
+
+            dropped_count += len(expired_keys)
+
+        return dropped_count
+
+    def get_stats(self):
+        sizes = [len(shard.data) for shard in self.shards]
+
+        return {
+            "keys": sum(sizes),
+            "largest_shard": max(sizes),
+            "expiring": sum(len(shard.deadlines) for shard in self.shards)
+        }
+
+class SharedMemoryStore(KeyValueStore):
+    """
+        @description Store of integers in a shared memory segment, for servers running as several processes. Create it before forking so children inherit the mapping and the shard locks. Keys are strings of at most `SHM_KEY_MAX` UTF-8 bytes.
+        @note Each shard is an open-addressed table of `slots_per_shard` fixed-size slots behind a process-shared lock. Deadlines use the wall clock so all processes agree on them. There is no read cache, since other processes' writes cannot invalidate it.
+    """
+    def __init__(self, shard_count: int = STORE_DEFAULT_SHARDS, slots_per_shard: int = SHM_DEFAULT_SLOTS, sweep_interval: float = STORE_DEFAULT_SWEEP, name: str = None):
+        # NOTE: multiprocessing is slow to import and most servers never need it.
+        import multiprocessing
+        from multiprocessing import shared_memory
+
+        super().__init__(sweep_interval)
+        self.shard_count = shard_count
+        self.slots_per_shard = slots_per_shard
+        self.memory = shared_memory.SharedMemory(name=name, create=True, size=shard_count * slots_per_shard * SHM_SLOT.size)
+        self.locks = [multiprocessing.Lock() for _ in range(shard_count)]
+        self.owner_pid = os.getpid()
+
+    def encode_key(self, key: str):
+        raw_key = key.encode(encoding="utf-8")
+
+        if len(raw_key) > SHM_KEY_MAX:
+            raise ValueError(f'{__name__}: Key {key} is over {SHM_KEY_MAX} bytes')
+
+        return raw_key
+
+    def locate(self, raw_key: bytes):
+        key_hash = zlib.crc32(raw_key)
+
+        return key_hash % self.shard_count, (key_hash // self.shard_count) % self.slots_per_shard
+
+    def read_slot(self, shard_n: int, slot_n: int):
+        return SHM_SLOT.unpack_from(self.memory.buf, (shard_n * self.slots_per_shard + slot_n) * SHM_SLOT.size)
+
+    def write_slot(self, shard_n: int, slot_n: int, state: int, value: int, deadline: float, raw_key: bytes):
+        SHM_SLOT.pack_into(self.memory.buf, (shard_n * self.slots_per_shard + slot_n) * SHM_SLOT.size, state, value, deadline, raw_key)
+
+    def find_locked(self, shard_n: int, home_n: int, raw_key: bytes):
+        """
+            @description Probes a shard for a key. Returns its slot and value, or `None` and a free slot for inserting it. Expired keys are freed on the way. Needs the shard lock held.
+        """
+        free_n = None
+        padded_key = raw_key.ljust(SHM_KEY_MAX, b"\0")
+
+        for probe_n in range(self.slots_per_shard):
+            slot_n = (home_n + probe_n) % self.slots_per_shard
+            state, value, deadline, slot_key = self.read_slot(shard_n, slot_n)
+
+            if state == SHM_SLOT_EMPTY:
+                return (None, slot_n if free_n is None else free_n)
+
+            if state == SHM_SLOT_USED and slot_key == padded_key:
+                if deadline and deadline <= time():
+                    self.write_slot(shard_n, slot_n, SHM_SLOT_DELETED, 0, 0.0, b"")
+                    return (None, slot_n if free_n is None else free_n)
+
+                return (value, slot_n)
+
+            if state == SHM_SLOT_DELETED and free_n is None:
+                free_n = slot_n
+
+        return (None, free_n)
+
+    def store_locked(self, shard_n: int, slot_n: int, raw_key: bytes, value: int, ttl: float = None):
+        if slot_n is None:
+            raise MemoryError(f'{__name__}: Shared store shard {shard_n} is full')
+
+        self.write_slot(shard_n, slot_n, SHM_SLOT_USED, value, time() + ttl if ttl is not None else 0.0, raw_key)
+
+    def get(self, key: str, default: int = None):
+        raw_key = self.encode_key(key)
+        shard_n, home_n = self.locate(raw_key)
+
+        with self.locks[shard_n]:
+            value, _ = self.find_locked(shard_n, home_n, raw_key)
+
+        return default if value is None else value
+
+    def set(self, key: str, value: int, ttl: float = None):
+        raw_key = self.encode_key(key)
+        shard_n, home_n = self.locate(raw_key)
+
+        with self.locks[shard_n]:
+            _, slot_n = self.find_locked(shard_n, home_n, raw_key)
+            self.store_locked(shard_n, slot_n, raw_key, value, ttl)
+
+    def delete(self, key: str):
+        raw_key = self.encode_key(key)
+        shard_n, home_n = self.locate(raw_key)
+
+        with self.locks[shard_n]:
+            value, slot_n = self.find_locked(shard_n, home_n, raw_key)
+
+            if value is None:
+                return False
+
+            self.write_slot(shard_n, slot_n, SHM_SLOT_DELETED, 0, 0.0, b"")
+
+        return True
+
+    def incr(self, key: str, delta: int = 1, ttl: float = None):
+        """
+            @description Atomically adds `delta`, starting missing keys at 0. Returns the new value. `ttl` only applies when this creates the key.
+        """
+        raw_key = self.encode_key(key)
+        shard_n, home_n = self.locate(raw_key)
+
+        with self.locks[shard_n]:
+            value, slot_n = self.find_locked(shard_n, home_n, raw_key)
+
+            if value is None:
+                value = delta
+                self.store_locked(shard_n, slot_n, raw_key, value, ttl)
+            else:
+                value += delta
+                _, _, deadline, _ = self.read_slot(shard_n, slot_n)
+                self.write_slot(shard_n, slot_n, SHM_SLOT_USED, value, deadline, raw_key)
+
+        return value
+
+    def compare_and_set(self, key: str, expected: int, value: int, ttl: float = None):
+        raw_key = self.encode_key(key)
+        shard_n, home_n = self.locate(raw_key)
+
+        with self.locks[shard_n]:
+            current, slot_n = self.find_locked(shard_n, home_n, raw_key)
+
+            if current != expected:
+                return False
+
+            self.store_locked(shard_n, slot_n, raw_key, value, ttl)
+
+        return True
+
+    def sweep(self):
+        dropped_count = 0
+
+        for shard_n in range(self.shard_count):
+            now = time()
+
+            with self.locks[shard_n]:
+                for slot_n in range(self.slots_per_shard):
+                    state, _, deadline, _ = self.read_slot(shard_n, slot_n)
+
+                    if state == SHM_SLOT_USED and deadline and deadline <= now:
+                        self.write_slot(shard_n, slot_n, SHM_SLOT_DELETED, 0, 0.0, b"")
+                        dropped_count += 1
+
+        return dropped_count
+
+    def get_stats(self):
+        used_count = 0
+
+        for shard_n in range(self.shard_count):
+            with self.locks[shard_n]:
+                used_count += sum(1 for slot_n in range(self.slots_per_shard) if self.read_slot(shard_n, slot_n)[0] == SHM_SLOT_USED)
+
+        return {
+            "keys": used_count,
+            "capacity": self.shard_count * self.slots_per_shard
+        }
+
+    def cleanup(self):
+        super().cleanup()
+        self.memory.close()
+
+        if os.getpid() == self.owner_pid:
+            self.memory.unlink()
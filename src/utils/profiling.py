@@ -0,0 +1,235 @@
+"""
+    @file profiling.py
+    @description On-demand profiling for a running server: cProfile captures of handler calls, a stack-sampling profiler over all threads and tracemalloc snapshots.
+    @author Derek Tan
+"""
+
+import os
+import signal
+import sys
+import time
+from collections import Counter
+from threading import Event, Lock, Thread, get_ident, enumerate as enumerate_threads
+
+PROFILE_DEFAULT_DIR = "./profiles"
+PROFILE_DEFAULT_REQUESTS = 100
+PROFILE_DEFAULT_SAMPLE_INTERVAL = 0.005
+PROFILE_MALLOC_FRAMES = 16
+
+class ProfileHub:
+    """
+        @description Holds the profiling switches for one server. Everything is off by default: workers only read the `armed` flag per request, and the sampler thread only exists while sampling.
+        @note Output files go to `out_dir`: `.prof` files load with `pstats` or snakeviz, `.folded` files are collapsed stacks for flamegraph.pl or speedscope, and `.snap` files load with `tracemalloc.Snapshot.load`.
+    """
+    def __init__(self, out_dir: str = PROFILE_DEFAULT_DIR, sample_interval: float = PROFILE_DEFAULT_SAMPLE_INTERVAL):
+        self.out_dir = out_dir
+        self.sample_interval = sample_interval
+        self.lock = Lock()
+
+        # cProfile capture:
+        self.profile_lock = Lock()  # NOTE: held by the one handler call being profiled.
+        self.armed = False
+        self.route = None
+        self.remaining = 0
+        self.stats = None
+
+        # Stack sampler:
+        self.sampler_thread = None
+        self.sampler_eventer = Event()
+        self.samples = Counter()
+
+    def make_out_path(self, kind: str, extension: str):
+        os.makedirs(self.out_dir, exist_ok=True)
+
+        return os.path.join(self.out_dir, f'{kind}-{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}.{extension}')
+
+    # CPROFILE
+
+    def arm_cprofile(self, request_count: int = PROFILE_DEFAULT_REQUESTS, route: str = None):
+        """
+            @description Profiles the next `request_count` handler calls, optionally only those for `route`, then writes one merged `.prof` file.
+        """
+        if request_count < 1:
+            raise ValueError(f'{__name__}: Invalid profiled request count {request_count}')
+
+        with self.lock:
+            if self.armed:
+                return False
+
+            self.route = route
+            self.remaining = request_count
+            self.stats = None
+            self.armed = True
+
+        print(f'{__name__}: Profiling next {request_count} requests for {route or "all routes"}')
+
+        return True
+
+    def profile_call(self, path: str, handler, *args):
+        """
+            @description Runs a handler under its own `cProfile.Profile`. Only called while armed.
+            @note Only one call is profiled at a time, as Python 3.12+ refuses to enable a second profiler while another is active. Calls arriving meanwhile run unprofiled and do not count towards the capture.
+        """
+        if self.route is not None and path != self.route:
+            return handler(*args)
+
+        if not self.profile_lock.acquire(blocking=False):
+            return handler(*args)
+
+        try:
+            import cProfile  # NOTE: profiling modules load on first use, keeping them off the startup path.
+
+            profile = cProfile.Profile()
+            profile.enable()
+
+            try:
+                return handler(*args)
+            finally:
+                profile.disable()
+                self.add_profile(profile)
+        finally:
+            self.profile_lock.release()
+
+    def add_profile(self, profile):
+        import pstats
+
+        out_path = None
+
+        with self.lock:
+            if not self.armed:
+                return
+
+            if self.stats is None:
+                self.stats = pstats.Stats(profile)
+            else:
+                self.stats.add(profile)
+
+            self.remaining -= 1
+
+            if self.remaining <= 0:
+                self.armed = False
+                out_path = self.make_out_path("cprofile", "prof")
+                self.stats.dump_stats(out_path)
+                self.stats = None
+
+        if out_path is not None:
+            print(f'{__name__}: Wrote cProfile stats to {out_path}')
+
+    # STACK SAMPLER
+
+    def is_sampling(self):
+        return self.sampler_thread is not None
+
+    def start_sampler(self):
+        with self.lock:
+            if self.sampler_thread is not None:
+                return False
+
+            self.samples = Counter()
+            self.sampler_eventer.clear()
+            self.sampler_thread = Thread(target=self.run_sampler, name='profile_sampler', daemon=True)
+            self.sampler_thread.start()
+
+        print(f'{__name__}: Started stack sampler')
+
+        return True
+
+    def stop_sampler(self):
+        """
+            @description Stops sampling and writes the collapsed stacks, returning the file path.
+        """
+        with self.lock:
+            temp_thread = self.sampler_thread
+            self.sampler_thread = None
+
+        if temp_thread is None:
+            return None
+
+        self.sampler_eventer.set()
+        temp_thread.join()
+
+        out_path = self.make_out_path("stacks", "folded")
+
+        with open(out_path, "w") as fs:
+            for stack, count in self.samples.most_common():
+                fs.write(f'{stack} {count}\n')
+
+        print(f'{__name__}: Wrote {sum(self.samples.values())} stack samples to {out_path}')
+
+        return out_path
+
+    def toggle_sampler(self):
+        if self.is_sampling():
+            return self.stop_sampler()
+
+        self.start_sampler()
+
+        return None
+
+    def run_sampler(self):
+        sampler_id = get_ident()
+        thread_names = {}
+
+        while not self.sampler_eventer.wait(self.sample_interval):
+            # NOTE thread names are only looked up again when an unknown thread shows up.
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == sampler_id:
+                    continue
+
+                thread_name = thread_names.get(thread_id)
+
+                if thread_name is None:
+                    thread_names = {thread.ident: thread.name for thread in enumerate_threads()}
+                    thread_name = thread_names.get(thread_id, str(thread_id))
+
+                frames = []
+
+                while frame is not None:
+                    code = frame.f_code
+                    frames.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                    frame = frame.f_back
+
+                frames.append(thread_name)
+                frames.reverse()
+                self.samples[";".join(frames)] += 1
+
+    # TRACEMALLOC
+
+    def toggle_tracemalloc(self):
+        """
+            @description Starts tracing allocations, or if already tracing, writes a snapshot, stops tracing and returns the file path.
+        """
+        import tracemalloc
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(PROFILE_MALLOC_FRAMES)
+            print(f'{__name__}: Started tracemalloc')
+            return None
+
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+
+        out_path = self.make_out_path("malloc", "snap")
+        snapshot.dump(out_path)
+        print(f'{__name__}: Wrote tracemalloc snapshot to {out_path}')
+
+        return out_path
+
+    def cleanup(self):
+        self.stop_sampler()
+
+        with self.lock:
+            self.armed = False
+            self.stats = None
+
+def install_profile_signals(hub: ProfileHub, request_count: int = PROFILE_DEFAULT_REQUESTS):
+    """
+        @description Makes `SIGUSR1` toggle the stack sampler and `SIGUSR2` arm a cProfile capture of the next `request_count` requests. Must run on the main thread, and does nothing on platforms without these signals.
+    """
+    if not hasattr(signal, "SIGUSR1"):
+        return False
+
+    signal.signal(signal.SIGUSR1, lambda signum, frame: hub.toggle_sampler())
+    signal.signal(signal.SIGUSR2, lambda signum, frame: hub.arm_cprofile(request_count))
+
+    return True
@@ -0,0 +1,228 @@
+"""
+    @file replay.py
+    @description Replays captured traffic against a server, keeping each connection's keep-alive and pipelining, and compares responses between two servers.
+    @author Derek Tan
+"""
+
+import difflib
+import hashlib
+import socket
+from threading import Thread
+from time import perf_counter, sleep
+
+from http1.scanner import HttpScanner
+from utils.traffic import CapturedConn
+
+REPLAY_READ_TIMEOUT = 10.0
+REPLAY_IGNORED_HEADERS = (b"date",)  # NOTE: headers expected to differ between runs, left out of comparisons.
+
+class ReplayResponse:
+    __slots__ = ("sent_time", "done_time", "head_lines", "body_len", "body_hash")
+
+    def __init__(self):
+        self.sent_time = None
+        self.done_time = None
+        self.head_lines = []
+        self.body_len = 0
+        self.body_hash = ""
+
+    def describe(self):
+        """
+            @description Gives comparable text lines for this response: its status line, sorted headers without volatile ones, and a body digest.
+        """
+        lines = [line.decode(encoding="latin-1") for line in self.head_lines]
+
+        return lines[:1] + sorted(lines[1:]) + [f'<body {self.body_len} bytes, blake2b {self.body_hash}>']
+
+def split_requests(data: bytes):
+    """
+        @description Splits a connection's raw bytes into requests. Returns `(end offset, method)` pairs, `end offset` being just past each request.
+    """
+    requests = []
+    offset = 0
+
+    while offset < len(data):
+        head_end = data.find(b"\r\n\r\n", offset)
+
+        if head_end < 0:
+            break
+
+        head = data[offset : head_end].lower()
+        method = data[offset : data.find(b" ", offset)].decode(encoding="latin-1")
+        end = head_end + 4
+
+        if b"\r\ntransfer-encoding: chunked" in head:
+            end = data.find(b"\r\n0\r\n\r\n", head_end) + 7
+
+            if end < 7:
+                break
+        else:
+            len_pos = head.find(b"\r\ncontent-length:")
+
+            if len_pos >= 0:
+                len_end = head.find(b"\r\n", len_pos + 2)
+                end += int(head[len_pos + 17 : len_end if len_end >= 0 else len(head)])
+
+        requests.append((end, method))
+        offset = end
+
+    return requests
+
+def read_response(scanner: HttpScanner, method: str, response: ReplayResponse):
+    status_line = bytes(scanner.read_line())
+    response.head_lines = [status_line]
+    status_code = int(status_line.split(b" ", 2)[1])
+    content_len = None
+    is_chunked = False
+
+    while True:
+        line = bytes(scanner.read_line())
+
+        if not line:
+            break
+
+        name = line[0 : line.find(b":")].strip().lower()
+
+        if name == b"content-length":
+            content_len = int(line[line.find(b":") + 1 :])
+        elif name == b"transfer-encoding":
+            is_chunked = b"chunked" in line.lower()
+
+        if name not in REPLAY_IGNORED_HEADERS:
+            response.head_lines.append(line)
+
+    digest = hashlib.blake2b(digest_size=8)
+
+    if method == "HEAD" or status_code < 200 or status_code in (204, 304):
+        pass
+    elif is_chunked:
+        chunk_len = int(bytes(scanner.read_line()).split(b";", 1)[0], 16)
+
+        while chunk_len > 0:
+            chunk = scanner.read_exact(chunk_len)
+            digest.update(chunk)
+            response.body_len += chunk_len
+            scanner.read_line()
+            chunk_len = int(bytes(scanner.read_line()).split(b";", 1)[0], 16)
+
+        while scanner.read_line():
+            pass
+    elif content_len is not None:
+        chunk = scanner.read_exact(content_len)
+        digest.update(chunk)
+        response.body_len = content_len
+    else:
+        chunk = scanner.read_some(65536)
+
+        while chunk:
+            digest.update(chunk)
+            response.body_len += len(chunk)
+            chunk = scanner.read_some(65536)
+
+    response.body_hash = digest.hexdigest()
+
+def replay_conn(target: tuple[str, int], conn: CapturedConn, time_base: float, speed: float, responses: list[ReplayResponse]):
+    """
+        @description Replays one connection: sends its chunks at their recorded times divided by `speed` (no waits when `speed` is 0) while a reader thread collects the responses.
+    """
+    data = b"".join(chunk for _, chunk in conn.chunks)
+    requests = split_requests(data)
+    responses.extend(ReplayResponse() for _ in requests)
+
+    def wait_until(event_time: float):
+        if speed > 0:
+            delay = time_base + event_time / speed - perf_counter()
+
+            if delay > 0:
+                sleep(delay)
+
+    def read_all(scanner: HttpScanner):
+        try:
+            for (_, method), response in zip(requests, responses):
+                read_response(scanner, method, response)
+                response.done_time = perf_counter()
+        except (OSError, ValueError, IndexError):
+            pass
+
+    wait_until(conn.open_time)
+
+    try:
+        client = socket.create_connection(target, timeout=REPLAY_READ_TIMEOUT)
+    except OSError:
+        return
+
+    reader = Thread(target=read_all, args=(HttpScanner(client),), daemon=True)
+    reader.start()
+    sent_bytes = 0
+    next_request = 0
+
+    try:
+        for chunk_time, chunk in conn.chunks:
+            wait_until(chunk_time)
+            client.sendall(chunk)
+            sent_bytes += len(chunk)
+            sent_time = perf_counter()
+
+            # NOTE a request counts as sent once its last byte is.
+            while next_request < len(requests) and requests[next_request][0] <= sent_bytes:
+                responses[next_request].sent_time = sent_time
+                next_request += 1
+    except OSError:
+        pass
+
+    reader.join(REPLAY_READ_TIMEOUT)
+
+    if conn.close_time is not None:
+        wait_until(conn.close_time)
+
+    client.close()
+
+def run_replay(target: tuple[str, int], conns: list[CapturedConn], speed: float = 1.0):
+    """
+        @description Replays all connections concurrently. Returns the responses per connection and the wall time taken.
+    """
+    results = [[] for _ in conns]
+    time_base = perf_counter()
+    threads = [Thread(target=replay_conn, args=(target, conn, time_base, speed, results[n]), daemon=True) for n, conn in enumerate(conns)]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    return results, perf_counter() - time_base
+
+def summarize(results: list[list[ReplayResponse]], wall_time: float):
+    latencies = sorted(response.done_time - response.sent_time for conn_results in results for response in conn_results if response.done_time is not None and response.sent_time is not None)
+    total = sum(len(conn_results) for conn_results in results)
+
+    def percentile(fraction: float):
+        if not latencies:
+            return 0.0
+
+        return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] * 1000
+
+    return {
+        "requests": total,
+        "answered": len(latencies),
+        "failed": total - len(latencies),
+        "wall_s": wall_time,
+        "throughput_rps": len(latencies) / wall_time if wall_time > 0 else 0.0,
+        "p50_ms": percentile(0.5),
+        "p90_ms": percentile(0.9),
+        "p99_ms": percentile(0.99),
+        "max_ms": latencies[-1] * 1000 if latencies else 0.0
+    }
+
+def diff_results(base_results: list[list[ReplayResponse]], other_results: list[list[ReplayResponse]], base_name: str, other_name: str):
+    """
+        @description Yields unified diffs for responses that differ between two replays of the same capture.
+    """
+    for conn_n, (base_conn, other_conn) in enumerate(zip(base_results, other_results)):
+        for request_n, (base_res, other_res) in enumerate(zip(base_conn, other_conn)):
+            base_lines = base_res.describe()
+            other_lines = other_res.describe()
+
+            if base_lines != other_lines:
+                yield f'conn {conn_n} request {request_n}:\n' + "\n".join(difflib.unified_diff(base_lines, other_lines, base_name, other_name, lineterm=""))
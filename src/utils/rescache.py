@@ -5,15 +5,24 @@
 """
 
 import os
+from threading import Lock
 import utils.resources as resources
+from utils.bundle import AssetBundle
 
 class ResourceCache:
     """
         @description Stores a mapping of names to pre-loaded files to serve.
+        @note Given a `bundle_path`, resources come from a memory-mapped asset bundle instead (see `src/pack.py`), and are only looked up on first request.
     """
-    def __init__(self, public_dirname: str):
+    def __init__(self, public_dirname: str, bundle_path: str = None):
         self.indexes = {}  # NOTE: maps paths to resource indexes
         self.resources = []  # NOTE: maps indexes to resources
+        self.bundle = None
+        self.bundle_lock = Lock()
+
+        if bundle_path is not None:
+            self.bundle = AssetBundle(bundle_path)
+            return
 
         dir_entry = os.scandir(public_dirname)
 
@@ -40,7 +49,7 @@ class ResourceCache:
         if len(res_paths) < 1:
             return False
 
-        pre_index = self.indexes.get(res_paths[0])
+        pre_index = self.get_index(res_paths[0])
 
         if pre_index is None:
             return False
@@ -52,9 +61,43 @@ class ResourceCache:
 
         return True
 
-    def get_item(self, res_path: str):
+    def get_index(self, res_path: str):
         res_index = self.indexes.get(res_path)
 
+        # NOTE bundled resources are found by binary search once, then remembered like scanned ones. The search needs no lock, so misses such as 404s and dynamic routes never wait on other workers.
+        bundle = self.bundle
+
+        if res_index is None and bundle is not None:
+            res_obj = bundle.find(res_path)
+
+            if res_obj is None:
+                return None
+
+            with self.bundle_lock:
+                res_index = self.indexes.get(res_path)
+
+                if res_index is None:
+                    self.add_item(res_path[1:], res_obj)
+                    res_index = len(self.resources) - 1
+
+        return res_index
+
+    def cleanup(self):
+        """
+            @description Drops bundled resources and unmaps the bundle.
+        """
+        if self.bundle is None:
+            return
+
+        with self.bundle_lock:
+            self.indexes.clear()
+            self.resources.clear()
+            self.bundle.close()
+            self.bundle = None
+
+    def get_item(self, res_path: str):
+        res_index = self.get_index(res_path)
+
         if res_index is None:
             return None
 
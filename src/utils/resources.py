@@ -62,6 +62,15 @@ class StaticResource:
     def get_modify_date(self):
         return self.modify_date
 
+    def get_etag(self, encoding: str = None):
+        """
+            @note Only bundled resources carry ETags and compressed variants (see `utils/bundle.py`).
+        """
+        return None
+
+    def get_encoded(self, encoding: str):
+        return None
+
     def as_bytes(self):
         return self.data
     
@@ -0,0 +1,376 @@
+"""
+    @file soak.py
+    @description Soak harness: drives steady mixed traffic at an in-process server for a long time while sampling memory, file descriptors, threads and latency, then judges their growth against thresholds.
+    @author Derek Tan
+"""
+
+import os
+import random
+import socket
+import threading
+import tracemalloc
+from time import monotonic, sleep
+
+from core.config import TippyConfig
+from core.pool import POOL_DEFAULT_MAX
+from core.instance import Tippy
+from http1.request import SimpleRequest
+from http1.sender import SimpleSender, RES_GET_BODY, RES_HEAD_BODY, RES_ERR_BODY
+from http1.scanner import HttpScanner
+from handlers.ctx.context import HandlerCtx
+from handlers.handcache import EXEC_CLASS_SLOW
+from handlers.sse import SseHandler
+from utils.replay import ReplayResponse, read_response
+
+SOAK_TOP_ALLOCATORS = 10
+SOAK_KEEPALIVE_REQUESTS = 50  # NOTE: keep-alive clients reconnect after this many requests, so connection setup stays in the mix.
+
+SOAK_POOL_ELASTIC = "elastic"
+SOAK_POOL_FIXED = "fixed"
+
+# Scenario weights: how often each kind of client behaviour is picked.
+SOAK_SCENARIOS = {
+    "static": 40,
+    "dynamic": 20,
+    "close": 10,
+    "pipeline": 8,
+    "slow": 6,
+    "not_found": 6,
+    "bad_request": 4,
+    "abort": 3,
+    "events": 3
+}
+
+def handle_soak_static(context: HandlerCtx, request: SimpleRequest, response: SimpleSender):
+    resource = context.get_resource(request.path)
+    response.send_heading("200")
+    response.send_header("Date", context.get_gmt_str())
+
+    return response.send_body(RES_HEAD_BODY if request.method == "HEAD" else RES_GET_BODY, resource.get_mime_type(), resource.as_bytes())
+
+def handle_soak_dynamic(context: HandlerCtx, request: SimpleRequest, response: SimpleSender):
+    hits = context.store.incr("soak_hits")
+    response.send_heading("200")
+    response.send_header("Date", context.get_gmt_str())
+
+    return response.send_body(RES_GET_BODY, "text/plain", f'hit {hits}\n'.encode(encoding="ascii"))
+
+def handle_soak_slow(context: HandlerCtx, request: SimpleRequest, response: SimpleSender):
+    sleep(0.005)
+
+    return handle_soak_dynamic(context, request, response)
+
+def handle_soak_fallback(context: HandlerCtx, request: SimpleRequest, response: SimpleSender):
+    response.send_heading("404")
+    response.send_header("Date", context.get_gmt_str())
+
+    return response.send_body(RES_ERR_BODY, "*/*", None)
+
+def read_rss():
+    """
+        @description Gets the resident set size in bytes from `/proc`, or the peak RSS where `/proc` is missing.
+    """
+    try:
+        with open("/proc/self/statm", "r") as fs:
+            return int(fs.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def count_fds():
+    for fd_dir in ("/proc/self/fd", "/dev/fd"):
+        if os.path.isdir(fd_dir):
+            return len(os.listdir(fd_dir))
+
+    return -1
+
+class SoakClient(threading.Thread):
+    """
+        @description One traffic thread, running scenarios picked by weight at its share of the target rate.
+    """
+    def __init__(self, harness, client_n: int, rate: float):
+        super().__init__(name=f'soak_client{client_n}', daemon=True)
+        self.harness = harness
+        self.interval = 1.0 / rate
+        self.picker = random.Random(client_n)
+        self.scenarios = list(SOAK_SCENARIOS.keys())
+        self.weights = list(SOAK_SCENARIOS.values())
+        self.keepalive = None
+        self.keepalive_left = 0
+
+    def connect(self):
+        client_sock = socket.create_connection(self.harness.address, timeout=5.0)
+
+        return client_sock, HttpScanner(client_sock)
+
+    def exchange(self, conn, raw_request: bytes, method: str = "GET", count: int = 1):
+        client_sock, scanner = conn
+        client_sock.sendall(raw_request)
+        response = ReplayResponse()
+
+        for _ in range(count):
+            read_response(scanner, method, response)
+
+        return response.head_lines[0]
+
+    def run_static(self):
+        if self.keepalive_left <= 0:
+            self.drop_keepalive()
+            self.keepalive = self.connect()
+            self.keepalive_left = SOAK_KEEPALIVE_REQUESTS
+
+        self.keepalive_left -= 1
+        path = self.picker.choice(("/index.html", "/info.html", "/style.css"))
+
+        return self.exchange(self.keepalive, f'GET {path} HTTP/1.1\r\nHost: soak\r\n\r\n'.encode(encoding="ascii"))
+
+    def run_once(self, raw_request: bytes, count: int = 1):
+        conn = self.connect()
+
+        try:
+            return self.exchange(conn, raw_request, count=count)
+        finally:
+            conn[0].close()
+
+    def run_scenario(self, scenario: str):
+        if scenario == "static":
+            return self.run_static()
+        elif scenario == "dynamic":
+            return self.run_once(b"GET /soak/dynamic HTTP/1.1\r\nHost: soak\r\n\r\n")
+        elif scenario == "close":
+            return self.run_once(b"GET /index.html HTTP/1.1\r\nHost: soak\r\nConnection: Close\r\n\r\n")
+        elif scenario == "pipeline":
+            return self.run_once(b"GET /style.css HTTP/1.1\r\nHost: soak\r\n\r\n" * 3, count=3)
+        elif scenario == "slow":
+            return self.run_once(b"GET /soak/slow HTTP/1.1\r\nHost: soak\r\n\r\n")
+        elif scenario == "not_found":
+            return self.run_once(b"GET /soak/missing HTTP/1.1\r\nHost: soak\r\n\r\n")
+        elif scenario == "bad_request":
+            return self.run_once(b"GET /index.html HTTP/1.1\r\n\r\n")
+        elif scenario == "abort":
+            client_sock, _ = self.connect()
+            client_sock.sendall(b"GET /index.html HTTP/1.1\r\nHo")
+            client_sock.close()
+            return b"aborted"
+
+        # NOTE event streams subscribe, read the preamble and hang up, churning the hub's subscriber set.
+        client_sock, scanner = self.connect()
+
+        try:
+            client_sock.sendall(b"GET /soak/events HTTP/1.1\r\nHost: soak\r\n\r\n")
+
+            while scanner.read_line():
+                pass
+
+            return scanner.read_line()
+        finally:
+            client_sock.close()
+
+    def drop_keepalive(self):
+        if self.keepalive is not None:
+            self.keepalive[0].close()
+            self.keepalive = None
+
+    def run(self):
+        next_time = monotonic()
+
+        while not self.harness.stop_flag.is_set():
+            scenario = self.picker.choices(self.scenarios, self.weights)[0]
+            start_time = monotonic()
+
+            try:
+                self.run_scenario(scenario)
+                self.harness.note_result(scenario, monotonic() - start_time, True)
+            except (OSError, ValueError, IndexError, BufferError):
+                self.harness.note_result(scenario, monotonic() - start_time, False)
+
+                if scenario == "static":
+                    self.drop_keepalive()
+                    self.keepalive_left = 0
+
+            # NOTE pace by schedule rather than by sleeping a fixed gap, so slow responses do not lower the rate.
+            next_time = max(next_time + self.interval, monotonic() - self.interval)
+            delay = next_time - monotonic()
+
+            if delay > 0:
+                self.harness.stop_flag.wait(delay)
+
+        self.drop_keepalive()
+
+class SoakHarness:
+    """
+        @description Runs a `Tippy` on an ephemeral port in this process, drives it with `clients` threads totalling `rate` requests per second and samples resources every `interval` seconds.
+        @note Growth is judged from the first sample after `warmup` seconds to the last one, so caches and pools filling up at startup do not count as leaks. Client threads and sockets are steady, so they show up in the baseline rather than as growth. Any server thread still alive after stopping fails the run.
+    """
+    def __init__(self, public_folder: str, rate: float, clients: int, interval: float, warmup: float, thresholds: dict, pool: str = SOAK_POOL_ELASTIC):
+        if pool not in (SOAK_POOL_ELASTIC, SOAK_POOL_FIXED):
+            raise ValueError(f'{__name__}: Unknown pool kind {pool}')
+
+        self.public_folder = public_folder
+        self.pool = pool
+        self.rate = rate
+        self.clients = clients
+        self.interval = interval
+        self.warmup = warmup
+        self.thresholds = thresholds
+        self.stop_flag = threading.Event()
+        self.address = None
+
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.error_count = 0
+        self.request_count = 0
+        self.scenario_counts = {name: 0 for name in SOAK_SCENARIOS}
+        self.samples: list[dict] = []
+        self.baseline_snapshot = None
+        self.top_allocators = []
+        self.pool_stats = None
+        self.leaked_threads = []
+
+    def note_result(self, scenario: str, latency: float, is_ok: bool):
+        with self.lock:
+            self.request_count += 1
+            self.scenario_counts[scenario] += 1
+
+            if is_ok:
+                self.latencies.append(latency)
+            else:
+                self.error_count += 1
+
+    def take_sample(self, elapsed: float):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            self.latencies = []
+            errors = self.error_count
+            self.error_count = 0
+            requests = self.request_count
+            self.request_count = 0
+
+        def percentile(fraction: float):
+            return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] * 1000 if latencies else 0.0
+
+        traced_now, _ = tracemalloc.get_traced_memory()
+
+        return {
+            "elapsed_s": round(elapsed, 1),
+            "rss_mb": round(read_rss() / 1048576, 2),
+            "traced_mb": round(traced_now / 1048576, 3),
+            "fds": count_fds(),
+            "threads": threading.active_count(),
+            "requests": requests,
+            "errors": errors,
+            "p50_ms": round(percentile(0.5), 3),
+            "p99_ms": round(percentile(0.99), 3)
+        }
+
+    def build_server(self):
+        # NOTE each worker serves one connection at a time, so either pool must fit a worker per client thread to keep its keep-alive connection on.
+        if self.pool == SOAK_POOL_FIXED:
+            config = TippyConfig(host_port=0, backlog=64, min_workers=self.clients + 2, max_workers=self.clients + 2, public_folder=self.public_folder, event_streams=True)
+        else:
+            config = TippyConfig(host_port=0, backlog=64, max_workers=max(POOL_DEFAULT_MAX, self.clients + 2), public_folder=self.public_folder, event_streams=True)
+
+        server = Tippy(config=config)
+        server.set_fallback_handler(handle_soak_fallback)
+
+        # NOTE later routes in one `set_handler` call are aliases of the first resource, so each file gets its own call.
+        for res_path in ("/index.html", "/info.html", "/style.css"):
+            server.set_handler([res_path], handle_soak_static)
+
+        server.set_handler(["/soak/dynamic"], handle_soak_dynamic)
+        server.set_handler(["/soak/slow"], handle_soak_slow, EXEC_CLASS_SLOW)
+        server.set_handler(["/soak/events"], SseHandler("soak"))
+
+        return server
+
+    def run(self, duration: float, on_sample = None):
+        """
+            @description Soaks for `duration` seconds. Returns the list of samples, each also passed to `on_sample` as it is taken.
+        """
+        tracemalloc.start(1)
+        threads_before = set(threading.enumerate())
+        server = self.build_server()
+        server.run_service()
+        self.address = ("localhost", server.get_port())
+
+        clients = [SoakClient(self, client_n, self.rate / self.clients) for client_n in range(self.clients)]
+
+        for client in clients:
+            client.start()
+
+        start_time = monotonic()
+        next_sample = start_time + self.interval
+
+        try:
+            while monotonic() - start_time < duration:
+                sleep(max(0.0, min(1.0, next_sample - monotonic())))
+                server.publish("soak", "tick")
+
+                if monotonic() < next_sample:
+                    continue
+
+                next_sample += self.interval
+                sample = self.take_sample(monotonic() - start_time)
+                self.samples.append(sample)
+
+                if self.baseline_snapshot is None and sample["elapsed_s"] >= self.warmup:
+                    self.baseline_snapshot = tracemalloc.take_snapshot()
+
+                if on_sample is not None:
+                    on_sample(sample)
+        finally:
+            self.stop_flag.set()
+
+            for client in clients:
+                client.join()
+
+            if self.baseline_snapshot is not None:
+                stats = tracemalloc.take_snapshot().compare_to(self.baseline_snapshot, "lineno")
+                self.top_allocators = [str(stat) for stat in stats[:SOAK_TOP_ALLOCATORS]]
+
+            self.pool_stats = server.get_pool_stats()
+            server.stop_service()
+            tracemalloc.stop()
+
+            self.leaked_threads = [thread.name for thread in threading.enumerate() if thread not in threads_before]
+
+        return self.samples
+
+    def judge(self):
+        """
+            @description Compares the last sample with the first one after warmup. Returns a list of broken thresholds, empty when the run passed.
+        """
+        settled = [sample for sample in self.samples if sample["elapsed_s"] >= self.warmup]
+
+        if len(settled) < 2:
+            return ["too few samples after warmup to judge growth"]
+
+        first = settled[0]
+        last = settled[-1]
+        failures = []
+
+        for key, limit_key in (("rss_mb", "max_rss_growth_mb"), ("traced_mb", "max_traced_growth_mb"), ("fds", "max_fd_growth"), ("threads", "max_thread_growth")):
+            growth = last[key] - first[key]
+
+            if growth > self.thresholds[limit_key]:
+                failures.append(f'{key} grew by {growth:.2f} (limit {self.thresholds[limit_key]})')
+
+        # NOTE compare p99 over the later half with the earlier half, as single intervals are noisy.
+        half = len(settled) // 2
+        early_p99 = max(sample["p99_ms"] for sample in settled[:half])
+        late_p99 = max(sample["p99_ms"] for sample in settled[half:])
+
+        if early_p99 > 0 and late_p99 / early_p99 > self.thresholds["max_p99_drift"]:
+            failures.append(f'p99 latency drifted from {early_p99:.2f} ms to {late_p99:.2f} ms (limit x{self.thresholds["max_p99_drift"]})')
+
+        total_requests = sum(sample["requests"] for sample in settled)
+        total_errors = sum(sample["errors"] for sample in settled)
+
+        if total_requests and total_errors / total_requests > self.thresholds["max_error_rate"]:
+            failures.append(f'error rate {total_errors / total_requests:.4f} (limit {self.thresholds["max_error_rate"]})')
+
+        if self.leaked_threads:
+            failures.append(f'threads left after stop: {", ".join(self.leaked_threads)}')
+
+        return failures
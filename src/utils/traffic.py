@@ -0,0 +1,127 @@
+"""
+    @file traffic.py
+    @description Compact binary capture of raw client traffic, for replaying it later against a server build.
+    @author Derek Tan
+"""
+
+import random
+import struct
+from socket import socket
+from threading import Lock
+from time import monotonic
+
+CAPTURE_MAGIC = b"TIPPYCAP"
+CAPTURE_VERSION = 1
+
+# Event kinds:
+CAPTURE_EV_OPEN = 0
+CAPTURE_EV_DATA = 1
+CAPTURE_EV_CLOSE = 2
+
+# Event: kind, connection id, seconds since capture start, data length. Data bytes follow DATA events.
+CAPTURE_EVENT = struct.Struct("<BIdI")
+CAPTURE_HEADER = struct.Struct("<8sH")
+
+class TrafficRecorder:
+    """
+        @description Records the raw request bytes of a sample of connections, with timestamps and connection open/close boundaries.
+        @note Sampling is per connection, so recorded connections are always complete. A connection handed to a lane and back keeps its id.
+    """
+    def __init__(self, log_path: str, sample_rate: float = 1.0):
+        if not 0 < sample_rate <= 1:
+            raise ValueError(f'{__name__}: Invalid sample rate {sample_rate}')
+
+        self.sample_rate = sample_rate
+        self.start_time = monotonic()
+        self.lock = Lock()
+        self.next_id = 0
+        self.conn_ids: dict[socket, int] = {}  # NOTE: unsampled connections map to None so handed-back ones are not re-sampled.
+        self.log = open(log_path, "wb")
+        self.log.write(CAPTURE_HEADER.pack(CAPTURE_MAGIC, CAPTURE_VERSION))
+
+    def write_event(self, kind: int, conn_id: int, data = b''):
+        with self.lock:
+            if self.log is None:
+                return
+
+            self.log.write(CAPTURE_EVENT.pack(kind, conn_id, monotonic() - self.start_time, len(data)))
+
+            if data:
+                self.log.write(data)
+
+    def open_conn(self, client_sock: socket):
+        """
+            @description Gets the capture id for a connection, deciding whether to sample it the first time it is seen. Returns `None` for unsampled connections.
+        """
+        with self.lock:
+            if client_sock in self.conn_ids:
+                return self.conn_ids[client_sock]
+
+            conn_id = None
+
+            if random.random() < self.sample_rate:
+                conn_id = self.next_id
+                self.next_id += 1
+
+            self.conn_ids[client_sock] = conn_id
+
+        if conn_id is not None:
+            self.write_event(CAPTURE_EV_OPEN, conn_id)
+
+        return conn_id
+
+    def note_data(self, conn_id: int, data):
+        self.write_event(CAPTURE_EV_DATA, conn_id, data)
+
+    def note_close(self, client_sock: socket):
+        with self.lock:
+            conn_id = self.conn_ids.pop(client_sock, None)
+
+        if conn_id is not None:
+            self.write_event(CAPTURE_EV_CLOSE, conn_id)
+
+    def cleanup(self):
+        with self.lock:
+            if self.log is not None:
+                self.log.close()
+                self.log = None
+
+class CapturedConn:
+    """
+        @description One recorded connection: its open/close times and the `(time, bytes)` chunks it sent, in order.
+    """
+    def __init__(self, conn_id: int, open_time: float):
+        self.id = conn_id
+        self.open_time = open_time
+        self.close_time = None
+        self.chunks: list[tuple[float, bytes]] = []
+
+def read_capture(log_path: str):
+    """
+        @description Loads a capture log into a list of `CapturedConn`, ordered by open time.
+    """
+    conns = {}
+
+    with open(log_path, "rb") as fs:
+        magic, version = CAPTURE_HEADER.unpack(fs.read(CAPTURE_HEADER.size))
+
+        if magic != CAPTURE_MAGIC or version != CAPTURE_VERSION:
+            raise ValueError(f'{__name__}: {log_path} is not a capture log')
+
+        event_bytes = fs.read(CAPTURE_EVENT.size)
+
+        while len(event_bytes) == CAPTURE_EVENT.size:
+            kind, conn_id, event_time, data_len = CAPTURE_EVENT.unpack(event_bytes)
+            data = fs.read(data_len) if data_len > 0 else b''
+
+            if kind == CAPTURE_EV_OPEN:
+                conns[conn_id] = CapturedConn(conn_id, event_time)
+            elif conn_id in conns:
+                if kind == CAPTURE_EV_DATA:
+                    conns[conn_id].chunks.append((event_time, data))
+                else:
+                    conns[conn_id].close_time = event_time
+
+            event_bytes = fs.read(CAPTURE_EVENT.size)
+
+    return sorted(conns.values(), key=lambda conn: conn.open_time)
@@ -0,0 +1,34 @@
+"""
+    @file conftest.py
+    @description Puts the server sources on the import path and checks that no test leaves threads running.
+    @author Derek Tan
+"""
+
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+TEST_THREAD_GRACE = 2.0
+
+@pytest.fixture(autouse=True)
+def no_leaked_threads():
+    """
+        @description Fails a test when threads it started are still alive after it, such as workers, lanes or hub threads of a stopped server.
+    """
+    threads_before = set(threading.enumerate())
+
+    yield
+
+    deadline = time.monotonic() + TEST_THREAD_GRACE
+    leaked = [thread for thread in threading.enumerate() if thread not in threads_before]
+
+    while leaked and time.monotonic() < deadline:
+        time.sleep(0.02)
+        leaked = [thread for thread in leaked if thread.is_alive()]
+
+    assert not leaked, f'Threads left running: {[thread.name for thread in leaked]}'
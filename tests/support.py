@@ -0,0 +1,221 @@
+"""
+    @file support.py
+    @description Helpers shared by the tests: servers on ephemeral ports, small handlers, raw and `http.client` exchanges, and a scripted upstream for the proxy.
+    @author Derek Tan
+"""
+
+import os
+import socket
+import time
+from http.client import HTTPConnection
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+
+from core.config import TippyConfig
+from core.instance import Tippy
+from http1.request import SimpleRequest
+from http1.sender import SimpleSender, RES_GET_BODY, RES_HEAD_BODY, RES_ERR_BODY
+from handlers.ctx.context import HandlerCtx
+
+TEST_HOST = "127.0.0.1"
+TEST_TIMEOUT = 5.0
+TEST_PUBLIC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "public")
+
+# SERVERS
+
+def make_server(**options):
+    """
+        @description Builds a server on an ephemeral loopback port serving the repo's public folder. Keyword arguments are `TippyConfig` options. Use it as `with make_server(...) as server:`.
+    """
+    options.setdefault("host_name", TEST_HOST)
+    options.setdefault("host_port", 0)
+    options.setdefault("public_folder", TEST_PUBLIC_DIR)
+
+    server = Tippy(config=TippyConfig(**options))
+    server.set_fallback_handler(handle_not_found)
+
+    return server
+
+def send_reply(request: SimpleRequest, response: SimpleSender, status: str, body: bytes, mime: str = "text/plain", headers: dict = None):
+    response.send_heading(status)
+
+    if headers is not None:
+        for header_name, header_value in headers.items():
+            response.send_header(header_name, header_value)
+
+    response.send_header("Connection", "Close" if request.before_close() else "Keep-Alive")
+
+    return response.send_body(RES_HEAD_BODY if request.method == "HEAD" else RES_GET_BODY, mime, body)
+
+def handle_not_found(context: HandlerCtx, request: SimpleRequest, response: SimpleSender):
+    response.send_heading("404")
+    response.send_header("Connection", "Close" if request.before_close() else "Keep-Alive")
+
+    return response.send_body(RES_ERR_BODY, "*/*", None)
+
+def make_text_handler(text: str, status: str = "200", headers: dict = None, calls: list = None, gate = None):
+    """
+        @description Makes a handler replying with `text`. Each call appends its request path to `calls`, and waits for the `gate` event first if one is given.
+    """
+    body = text.encode(encoding="utf-8")
+
+    def handle_text(context: HandlerCtx, request: SimpleRequest, response: SimpleSender):
+        if calls is not None:
+            calls.append(request.path)
+
+        if gate is not None:
+            gate.wait(TEST_TIMEOUT)
+
+        return send_reply(request, response, status, body, headers=headers)
+
+    return handle_text
+
+def wait_for(predicate, timeout: float = TEST_TIMEOUT):
+    """
+        @description Polls `predicate` until it holds or `timeout` seconds pass, returning its last result.
+    """
+    deadline = time.monotonic() + timeout
+
+    while not predicate():
+        if time.monotonic() >= deadline:
+            return False
+
+        time.sleep(0.01)
+
+    return True
+
+# CLIENTS
+
+def open_conn(server: Tippy, timeout: float = TEST_TIMEOUT):
+    return HTTPConnection(TEST_HOST, server.get_port(), timeout=timeout)
+
+def fetch(server: Tippy, path: str, method: str = "GET", headers: dict = None, body: bytes = None):
+    """
+        @description Makes one request on a new connection and returns `(status, headers, body)`, with header names lowercased.
+    """
+    conn = open_conn(server)
+
+    try:
+        conn.request(method, path, body=body, headers=headers or {})
+        reply = conn.getresponse()
+        reply_body = reply.read()
+
+        return reply.status, {name.lower(): value for name, value in reply.getheaders()}, reply_body
+    finally:
+        conn.close()
+
+def exchange_raw(address, data: bytes, timeout: float = TEST_TIMEOUT, family: int = socket.AF_INET):
+    """
+        @description Sends raw bytes and reads until the server closes the connection, returning everything it sent.
+    """
+    with socket.socket(family, socket.SOCK_STREAM) as client:
+        client.settimeout(timeout)
+        client.connect(address)
+
+        if data:
+            client.sendall(data)
+
+        return read_until_close(client)
+
+def read_until_close(client: socket.socket):
+    received = bytearray()
+
+    while True:
+        chunk = client.recv(4096)
+
+        if not chunk:
+            return bytes(received)
+
+        received += chunk
+
+def get_status(raw_reply: bytes):
+    """
+        @description Gets the status code of a raw reply, or `None` when nothing was sent.
+    """
+    if not raw_reply:
+        return None
+
+    return int(raw_reply.split(b' ', 2)[1])
+
+def get_raw_header(raw_reply: bytes, header_name: str):
+    head = raw_reply.split(b'\r\n\r\n', 1)[0].decode(encoding="latin-1")
+
+    for line in head.split("\r\n")[1:]:
+        name, _, value = line.partition(":")
+
+        if name.strip().lower() == header_name.lower():
+            return value.strip()
+
+    return None
+
+# UPSTREAMS
+
+class RecordingHandler(BaseHTTPRequestHandler):
+    """
+        @description Upstream request handler echoing the method, path and body it got, and recording each request on its server.
+    """
+    protocol_version = "HTTP/1.1"
+    timeout = TEST_TIMEOUT
+
+    def setup(self):
+        super().setup()
+        self.server.note_conn()
+
+    def reply(self):
+        body_length = int(self.headers.get("Content-Length") or 0)
+        request_body = self.rfile.read(body_length) if body_length else b''
+        self.server.note_request(self.command, self.path, request_body)
+
+        reply_body = f'{self.command} {self.path} '.encode(encoding="utf-8") + request_body
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(reply_body)))
+        self.end_headers()
+
+        if self.command != "HEAD":
+            self.wfile.write(reply_body)
+
+    do_GET = reply
+    do_HEAD = reply
+    do_POST = reply
+    do_PUT = reply
+    do_DELETE = reply
+
+    def log_message(self, format, *args):
+        pass
+
+class RecordingUpstream(ThreadingHTTPServer):
+    """
+        @description An upstream on an ephemeral loopback port that keeps every request it served as `(method, path, body)` and counts the connections it got. Use it as a context manager.
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__((TEST_HOST, 0), RecordingHandler)
+        self.requests = []
+        self.conn_count = 0
+        self.requests_lock = Lock()
+        self.serve_thread = Thread(target=self.serve_forever, name='test_upstream', args=(0.05,), daemon=True)
+
+    def get_address(self):
+        return self.server_address[0 : 2]
+
+    def note_conn(self):
+        with self.requests_lock:
+            self.conn_count += 1
+
+    def note_request(self, method: str, path: str, body: bytes):
+        with self.requests_lock:
+            self.requests.append((method, path, body))
+
+    def __enter__(self):
+        self.serve_thread.start()
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+        self.server_close()
+        self.serve_thread.join(TEST_TIMEOUT)
+
+        return False
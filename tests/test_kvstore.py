@@ -0,0 +1,160 @@
+"""
+    @file test_kvstore.py
+    @description Tests for the key-value stores: atomic operations under concurrency, expiry, the attributes view and the store handlers see.
+    @author Derek Tan
+"""
+
+import multiprocessing
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from handlers.ctx.context import StoreAttributes
+from utils.kvstore import ShardedStore, SharedMemoryStore
+from tests.support import make_server, send_reply, fetch, wait_for
+
+def add_many(store, key: str, count: int):
+    for _ in range(count):
+        store.incr(key)
+
+def test_concurrent_incr_is_exact():
+    store = ShardedStore(sweep_interval=None)
+
+    with ThreadPoolExecutor(8) as adders:
+        for _ in range(8):
+            adders.submit(add_many, store, "hits", 2000)
+
+    assert store.get("hits") == 8 * 2000
+
+def test_concurrent_update_is_exact():
+    store = ShardedStore(sweep_interval=None)
+
+    def append_many(worker_n: int):
+        for item_n in range(500):
+            store.update("log", lambda items: items + ((worker_n, item_n),), ())
+
+    with ThreadPoolExecutor(4) as appenders:
+        for worker_n in range(4):
+            appenders.submit(append_many, worker_n)
+
+    assert len(store.get("log")) == 4 * 500
+
+def test_compare_and_set():
+    store = ShardedStore(sweep_interval=None)
+
+    assert store.compare_and_set("owner", None, "a")
+    assert not store.compare_and_set("owner", None, "b")
+    assert store.compare_and_set("owner", "a", "b")
+    assert store.get("owner") == "b"
+
+def test_delete():
+    store = ShardedStore(sweep_interval=None)
+    store.set("key", 1)
+
+    assert store.delete("key")
+    assert not store.delete("key")
+    assert store.get("key", "gone") == "gone"
+
+def test_ttl_expires_on_access_and_sweep():
+    store = ShardedStore(sweep_interval=None)
+    store.set("short", 1, ttl=0.05)
+    store.set("swept", 1, ttl=0.05)
+    store.set("long", 1)
+
+    time.sleep(0.1)
+
+    assert store.get("short") is None
+    assert store.sweep() == 1
+    assert store.get_stats() == {"keys": 1, "largest_shard": 1, "expiring": 0}
+
+def test_incr_ttl_keeps_the_first_deadline():
+    store = ShardedStore(sweep_interval=None)
+
+    assert store.incr("window", ttl=0.1) == 1
+    time.sleep(0.06)
+    assert store.incr("window", ttl=0.1) == 2
+    time.sleep(0.06)
+    assert store.incr("window", ttl=0.1) == 1
+
+def test_shard_count_must_be_a_power_of_two():
+    with pytest.raises(ValueError):
+        ShardedStore(shard_count=12)
+
+def test_sweeper_thread_drops_expired_keys():
+    store = ShardedStore(sweep_interval=0.05)
+    store.start()
+
+    try:
+        store.set("short", 1, ttl=0.01)
+        assert wait_for(lambda: store.get_stats()["keys"] == 0)
+    finally:
+        store.cleanup()
+
+def test_attributes_view_acts_like_a_dict():
+    attributes = StoreAttributes(ShardedStore(sweep_interval=None))
+    attributes["name"] = "tippy"
+
+    assert "name" in attributes
+    assert attributes["name"] == "tippy"
+    assert attributes.get("other", 0) == 0
+
+    del attributes["name"]
+
+    with pytest.raises(KeyError):
+        attributes["name"]
+
+    with pytest.raises(KeyError):
+        del attributes["name"]
+
+def add_in_child(store: SharedMemoryStore, count: int):
+    add_many(store, "hits", count)
+
+def test_shared_memory_store_counts_across_processes():
+    store = SharedMemoryStore(shard_count=4, slots_per_shard=16, sweep_interval=None)
+
+    try:
+        child = multiprocessing.get_context("fork").Process(target=add_in_child, args=(store, 500))
+        child.start()
+        add_many(store, "hits", 500)
+        child.join(10.0)
+
+        assert child.exitcode == 0
+        assert store.get("hits") == 1000
+        assert store.compare_and_set("hits", 1000, 0)
+        assert store.get_stats()["keys"] == 1
+    finally:
+        store.cleanup()
+
+def test_shared_memory_store_rejects_long_keys():
+    store = SharedMemoryStore(shard_count=1, slots_per_shard=4, sweep_interval=None)
+
+    try:
+        with pytest.raises(ValueError):
+            store.set("k" * 49, 1)
+    finally:
+        store.cleanup()
+
+def test_handlers_share_the_server_store():
+    def handle_count(context, request, response):
+        return send_reply(request, response, "200", str(context.store.incr("visits")).encode(encoding="ascii"))
+
+    with make_server(min_workers=4, max_workers=4) as server:
+        server.set_handler(["/count"], handle_count)
+
+        with ThreadPoolExecutor(4) as clients:
+            bodies = list(clients.map(lambda _: fetch(server, "/count")[2], range(20)))
+
+        visits = server.context.attributes["visits"]
+
+    assert sorted(int(body) for body in bodies) == list(range(1, 21))
+    assert visits == 20
+
+def test_store_is_not_built_until_used():
+    with make_server() as server:
+        assert server.store is None
+
+        server.context.set_attr("key", "value")
+
+        assert server.store is not None
+        assert server.context.get_attr("key") == "value"
@@ -0,0 +1,126 @@
+"""
+    @file test_lanes.py
+    @description Tests for routes run on lanes: hand-off and return of kept-alive connections, 503s from saturated lanes and bounded shutdown.
+    @author Derek Tan
+"""
+
+import socket
+import time
+from threading import Event, current_thread
+
+from handlers.handcache import EXEC_CLASS_SLOW
+from tests.support import TEST_HOST, TEST_TIMEOUT, make_server, make_text_handler, send_reply, exchange_raw, read_until_close, get_status, get_raw_header, open_conn, wait_for
+
+def send_held(address):
+    """
+        @description Opens a connection and sends a kept-alive request for the slow route, leaving the reply unread.
+    """
+    held_client = socket.create_connection(address, TEST_TIMEOUT)
+    held_client.sendall(b'GET /slow HTTP/1.1\r\nHost: t\r\n\r\n')
+
+    return held_client
+
+def test_lane_route_runs_off_the_workers_and_returns_the_connection():
+    thread_names = []
+
+    def handle_slow(context, request, response):
+        thread_names.append(current_thread().name)
+        return send_reply(request, response, "200", b'slow')
+
+    with make_server() as server:
+        server.set_handler(["/slow"], handle_slow, EXEC_CLASS_SLOW)
+        server.set_handler(["/fast"], make_text_handler("fast"))
+        conn = open_conn(server)
+
+        conn.request("GET", "/slow")
+        slow_body = conn.getresponse().read()
+        conn.request("GET", "/fast")
+        fast_body = conn.getresponse().read()
+        conn.close()
+
+        lane_stats = server.get_lane_stats()[EXEC_CLASS_SLOW]
+
+    assert (slow_body, fast_body) == (b'slow', b'fast')
+    assert thread_names[0].startswith(f'{EXEC_CLASS_SLOW}_lane')
+    assert lane_stats["done"] == 1
+
+def test_inline_routes_serve_while_the_lane_is_busy():
+    gate = Event()
+
+    with make_server() as server:
+        server.set_handler(["/slow"], make_text_handler("slow", gate=gate), EXEC_CLASS_SLOW)
+        server.set_handler(["/fast"], make_text_handler("fast"))
+
+        with socket.create_connection((TEST_HOST, server.get_port()), TEST_TIMEOUT) as slow_client:
+            slow_client.sendall(b'GET /slow HTTP/1.1\r\nHost: t\r\nConnection: Close\r\n\r\n')
+
+            fast_reply = exchange_raw((TEST_HOST, server.get_port()), b'GET /fast HTTP/1.1\r\nHost: t\r\nConnection: Close\r\n\r\n')
+            gate.set()
+
+    assert get_status(fast_reply) == 200
+
+def test_saturated_lane_gets_503_with_retry_after_and_close():
+    gate = Event()
+
+    with make_server(lane_workers=1, lane_queue=1, retry_after=7) as server:
+        server.set_handler(["/slow"], make_text_handler("slow", gate=gate), EXEC_CLASS_SLOW)
+        address = (TEST_HOST, server.get_port())
+        lane = server.lanes[EXEC_CLASS_SLOW]
+        held_clients = []
+
+        try:
+            # NOTE one request runs and one waits in the queue, so the third finds the lane full.
+            held_clients.append(send_held(address))
+            assert wait_for(lambda: lane.get_stats()["done"] == 1)
+            held_clients.append(send_held(address))
+            assert wait_for(lambda: lane.get_stats()["queued"] == 1)
+
+            shed_reply = exchange_raw(address, b'GET /slow HTTP/1.1\r\nHost: t\r\n\r\n')
+        finally:
+            gate.set()
+
+            for held_client in held_clients:
+                held_client.close()
+
+    assert get_status(shed_reply) == 503
+    assert get_raw_header(shed_reply, "Retry-After") == "7"
+    assert get_raw_header(shed_reply, "Connection") == "Close"
+    assert lane.get_stats()["rejected"] == 1
+
+def test_stop_does_not_wait_past_the_deadline_for_a_stuck_lane():
+    gate = Event()
+    server = make_server(lane_workers=1, lane_queue=1, stop_timeout=0.5)
+    server.set_handler(["/slow"], make_text_handler("slow", gate=gate), EXEC_CLASS_SLOW)
+    held_clients = []
+
+    try:
+        with server:
+            lane = server.lanes[EXEC_CLASS_SLOW]
+
+            address = (TEST_HOST, server.get_port())
+
+            held_clients.append(send_held(address))
+            assert wait_for(lambda: lane.get_stats()["done"] == 1)
+            held_clients.append(send_held(address))
+            assert wait_for(lambda: lane.get_stats()["queued"] == 1)
+            stop_start = time.monotonic()
+
+        stop_time = time.monotonic() - stop_start
+
+        # NOTE the queued request's connection is closed to make room for the stop item.
+        held_clients[1].settimeout(TEST_TIMEOUT)
+        queued_reply = held_clients[1].recv(4096)
+
+        # NOTE the stuck request still gets its reply, then its connection is closed as no worker is left to take it back.
+        gate.set()
+        held_clients[0].settimeout(TEST_TIMEOUT)
+        late_reply = read_until_close(held_clients[0])
+    finally:
+        gate.set()
+
+        for held_client in held_clients:
+            held_client.close()
+
+    assert stop_time < 0.5 + 0.5
+    assert queued_reply == b''
+    assert get_status(late_reply) == 200
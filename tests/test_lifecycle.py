@@ -0,0 +1,98 @@
+"""
+    @file test_lifecycle.py
+    @description Tests for embedding a server: ephemeral ports, the context manager lifecycle, optional subsystems and clean shutdown.
+    @author Derek Tan
+"""
+
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from core.config import TippyConfig
+from core.instance import Tippy
+from tests.support import TEST_HOST, TEST_PUBLIC_DIR, make_server, make_text_handler, fetch, open_conn
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+def test_ephemeral_port_serves_inside_with():
+    with make_server() as server:
+        assert server.get_port() > 0
+        server.set_handler(["/hello"], make_text_handler("hi"))
+
+        status, _, body = fetch(server, "/hello")
+
+    assert status == 200
+    assert body == b'hi'
+
+def test_stop_ends_every_thread_with_open_connections():
+    threads_before = set(threading.enumerate())
+    server = make_server(event_streams=True)
+    server.set_handler(["/hello"], make_text_handler("hi"))
+
+    with server:
+        # NOTE: a kept-alive client parks a worker on its socket, which `stop_service` must shut down.
+        conn = open_conn(server)
+        conn.request("GET", "/hello")
+        assert conn.getresponse().read() == b'hi'
+
+        server.context.store.set("touched", 1)
+
+    leftover = [thread.name for thread in threading.enumerate() if thread not in threads_before and thread.is_alive()]
+    conn.close()
+
+    assert leftover == []
+
+def test_stop_twice_is_harmless():
+    server = make_server()
+
+    with server:
+        pass
+
+    server.stop_service()
+
+    assert server.stopped_flag.is_set()
+
+def test_optional_modules_load_only_when_used():
+    probe = (
+        "import sys\n"
+        f"sys.path.insert(0, {SRC_DIR!r})\n"
+        "from core.config import TippyConfig\n"
+        "from core.instance import Tippy\n"
+        f"with Tippy(config=TippyConfig(host_name={TEST_HOST!r}, host_port=0, public_folder={TEST_PUBLIC_DIR!r})):\n"
+        "    pass\n"
+        "print(sorted(name for name in ('core.broadcast', 'utils.kvstore', 'utils.traffic') if name in sys.modules))\n"
+    )
+    probe_run = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, timeout=30)
+
+    assert probe_run.returncode == 0, probe_run.stderr
+    assert probe_run.stdout.strip().splitlines()[-1] == "[]"
+
+def test_event_stats_without_streams():
+    with make_server() as server:
+        assert server.get_event_stats() is None
+        assert server.publish("news", "ignored") == 0
+
+def test_store_is_built_on_first_use():
+    with make_server(store_sweep=0) as server:
+        assert server.store is None
+
+        server.context.attributes["visits"] = 3
+
+        assert server.store is not None
+        assert server.context.store.incr("visits") == 4
+
+def test_failed_init_releases_listeners():
+    fd_dir = "/proc/self/fd"
+
+    if not os.path.isdir(fd_dir):
+        pytest.skip("needs /proc to count open files")
+
+    fds_before = len(os.listdir(fd_dir))
+
+    with pytest.raises(ValueError):
+        Tippy(config=TippyConfig(host_name=TEST_HOST, host_port=0, public_folder=TEST_PUBLIC_DIR, lane_workers=0))
+
+    assert len(os.listdir(fd_dir)) == fds_before
@@ -0,0 +1,98 @@
+"""
+    @file test_limits.py
+    @description Tests for scanner limits: per-phase deadlines and caps on request lines, headers and bodies.
+    @author Derek Tan
+"""
+
+import socket
+import time
+
+from http1.limits import CUT_IDLE_TIMEOUT, CUT_HEAD_TIMEOUT, CUT_BODY_TIMEOUT, CUT_LINE_TOO_LONG, CUT_TOO_MANY_HEADERS, CUT_HEADERS_TOO_LARGE, CUT_BODY_TOO_LARGE, CUT_BAD_LENGTH
+from tests.support import TEST_HOST, TEST_TIMEOUT, make_server, make_text_handler, exchange_raw, get_status, get_raw_header
+
+def serve_raw(raw_request: bytes, **options):
+    """
+        @description Sends `raw_request` to a fresh server built with `options` and returns the raw reply plus the server's cut-off counters.
+    """
+    with make_server(**options) as server:
+        server.set_handler(["/hello"], make_text_handler("hi"), methods=frozenset(("GET", "POST")))
+        raw_reply = exchange_raw((TEST_HOST, server.get_port()), raw_request)
+        limit_stats = server.get_limit_stats()
+
+    return raw_reply, limit_stats
+
+def test_idle_connection_is_closed_quietly():
+    raw_reply, limit_stats = serve_raw(b'', idle_timeout=0.2)
+
+    assert raw_reply == b''
+    assert limit_stats[CUT_IDLE_TIMEOUT] == 1
+
+def test_slow_head_gets_408():
+    raw_reply, limit_stats = serve_raw(b'GET /hello HTTP/1.1\r\nHost: t\r\n', head_timeout=0.2)
+
+    assert get_status(raw_reply) == 408
+    assert get_raw_header(raw_reply, "Connection") == "Close"
+    assert limit_stats[CUT_HEAD_TIMEOUT] == 1
+
+def test_slow_body_gets_408():
+    raw_reply, limit_stats = serve_raw(b'POST /hello HTTP/1.1\r\nHost: t\r\nContent-Length: 10\r\n\r\nab', body_timeout=0.2)
+
+    assert get_status(raw_reply) == 408
+    assert limit_stats[CUT_BODY_TIMEOUT] == 1
+
+def test_large_declared_body_gets_413():
+    raw_reply, limit_stats = serve_raw(b'POST /hello HTTP/1.1\r\nHost: t\r\nContent-Length: 100\r\n\r\n', max_body_bytes=10)
+
+    assert get_status(raw_reply) == 413
+    assert limit_stats[CUT_BODY_TOO_LARGE] == 1
+
+def test_large_chunked_body_gets_413():
+    raw_reply, limit_stats = serve_raw(b'POST /hello HTTP/1.1\r\nHost: t\r\nTransfer-Encoding: chunked\r\n\r\n8\r\n12345678\r\n8\r\n12345678\r\n0\r\n\r\n', max_body_bytes=10)
+
+    assert get_status(raw_reply) == 413
+    assert limit_stats[CUT_BODY_TOO_LARGE] == 1
+
+def test_long_request_line_gets_414():
+    raw_reply, limit_stats = serve_raw(b'GET /' + b'a' * 200 + b' HTTP/1.1\r\nHost: t\r\n\r\n', max_line_bytes=64)
+
+    assert get_status(raw_reply) == 414
+    assert limit_stats[CUT_LINE_TOO_LONG] == 1
+
+def test_too_many_headers_get_431():
+    extra_headers = b''.join(f'X-Extra-{n}: 1\r\n'.encode(encoding="ascii") for n in range(5))
+    raw_reply, limit_stats = serve_raw(b'GET /hello HTTP/1.1\r\nHost: t\r\n' + extra_headers + b'\r\n', max_headers=3)
+
+    assert get_status(raw_reply) == 431
+    assert limit_stats[CUT_TOO_MANY_HEADERS] == 1
+
+def test_large_headers_get_431():
+    raw_reply, limit_stats = serve_raw(b'GET /hello HTTP/1.1\r\nHost: t\r\nX-Big: ' + b'b' * 200 + b'\r\n\r\n', max_header_bytes=128)
+
+    assert get_status(raw_reply) == 431
+    assert limit_stats[CUT_HEADERS_TOO_LARGE] == 1
+
+def test_bad_content_length_gets_400():
+    raw_reply, limit_stats = serve_raw(b'POST /hello HTTP/1.1\r\nHost: t\r\nContent-Length: ten\r\n\r\n')
+
+    assert get_status(raw_reply) == 400
+    assert limit_stats[CUT_BAD_LENGTH] == 1
+
+def test_requests_within_limits_pass():
+    raw_reply, limit_stats = serve_raw(b'POST /hello HTTP/1.1\r\nHost: t\r\nContent-Length: 4\r\nConnection: Close\r\n\r\nbody', max_body_bytes=10, max_headers=3)
+
+    assert get_status(raw_reply) == 200
+    assert sum(limit_stats.values()) == 0
+
+def test_slow_client_does_not_hold_the_only_worker():
+    with make_server(min_workers=1, max_workers=1, head_timeout=0.3) as server:
+        server.set_handler(["/hello"], make_text_handler("hi"))
+        address = (TEST_HOST, server.get_port())
+
+        with socket.create_connection(address, TEST_TIMEOUT) as slow_client:
+            slow_client.sendall(b'GET /hello HTTP/1.1\r\n')
+            start_time = time.monotonic()
+            raw_reply = exchange_raw(address, b'GET /hello HTTP/1.1\r\nHost: t\r\nConnection: Close\r\n\r\n')
+            wait_time = time.monotonic() - start_time
+
+    assert get_status(raw_reply) == 200
+    assert wait_time < TEST_TIMEOUT / 2
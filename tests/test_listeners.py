@@ -0,0 +1,106 @@
+"""
+    @file test_listeners.py
+    @description Tests for listening endpoints: Unix domain sockets next to TCP, stale socket files and endpoint parsing.
+    @author Derek Tan
+"""
+
+import os
+import socket
+
+import pytest
+
+from core.listeners import TcpEndpoint, UnixEndpoint, parse_endpoint
+from tests.support import TEST_HOST, make_server, make_text_handler, exchange_raw, get_status
+
+REQUEST_CLOSE = b'GET /hello HTTP/1.1\r\nHost: t\r\nConnection: Close\r\n\r\n'
+
+def test_parse_endpoint():
+    assert str(parse_endpoint(("127.0.0.1", 80))) == "127.0.0.1:80"
+    assert str(parse_endpoint("[::1]:8080")) == "[::1]:8080"
+    assert isinstance(parse_endpoint("unix:/run/t.sock"), UnixEndpoint)
+    assert parse_endpoint("unix:/run/t.sock").path == "/run/t.sock"
+
+    with pytest.raises(ValueError):
+        parse_endpoint("localhost")
+
+def test_unix_socket_serves_and_is_removed_on_stop(tmp_path):
+    sock_path = str(tmp_path / "t.sock")
+
+    with make_server(endpoints=[f'unix:{sock_path}']) as server:
+        server.set_handler(["/hello"], make_text_handler("hi"))
+
+        assert server.get_port() is None
+        raw_reply = exchange_raw(sock_path, REQUEST_CLOSE, family=socket.AF_UNIX)
+
+    assert get_status(raw_reply) == 200
+    assert raw_reply.endswith(b'hi')
+    assert not os.path.exists(sock_path)
+
+def test_tcp_and_unix_listeners_together(tmp_path):
+    sock_path = str(tmp_path / "t.sock")
+
+    with make_server(endpoints=[f'unix:{sock_path}', (TEST_HOST, 0)]) as server:
+        server.set_handler(["/hello"], make_text_handler("hi"))
+
+        addresses = server.get_addresses()
+        unix_reply = exchange_raw(sock_path, REQUEST_CLOSE, family=socket.AF_UNIX)
+        tcp_reply = exchange_raw((TEST_HOST, server.get_port()), REQUEST_CLOSE)
+
+    assert len(addresses) == 2
+    assert (get_status(unix_reply), get_status(tcp_reply)) == (200, 200)
+
+def test_stale_socket_file_is_replaced(tmp_path):
+    sock_path = str(tmp_path / "t.sock")
+
+    # NOTE a bound but closed socket leaves its file behind, like a crashed server.
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as crashed:
+        crashed.bind(sock_path)
+
+    with make_server(endpoints=[f'unix:{sock_path}']) as server:
+        server.set_handler(["/hello"], make_text_handler("hi"))
+        raw_reply = exchange_raw(sock_path, REQUEST_CLOSE, family=socket.AF_UNIX)
+
+    assert get_status(raw_reply) == 200
+
+def test_live_socket_is_not_taken_over(tmp_path):
+    sock_path = str(tmp_path / "t.sock")
+
+    with make_server(endpoints=[f'unix:{sock_path}']):
+        with pytest.raises(OSError):
+            UnixEndpoint(sock_path).open(1)
+
+        assert os.path.exists(sock_path)
+
+def test_regular_file_is_not_replaced(tmp_path):
+    file_path = tmp_path / "t.sock"
+    file_path.write_text("data")
+
+    with pytest.raises(OSError):
+        UnixEndpoint(str(file_path)).open(1)
+
+    assert file_path.read_text() == "data"
+
+def test_close_keeps_a_newer_servers_socket(tmp_path):
+    sock_path = str(tmp_path / "t.sock")
+    old_endpoint = UnixEndpoint(sock_path)
+    old_listener = old_endpoint.open(1)
+
+    # NOTE a newer server replaced the file while the old listener was still open.
+    os.unlink(sock_path)
+    new_endpoint = UnixEndpoint(sock_path)
+    new_listener = new_endpoint.open(1)
+
+    old_endpoint.close(old_listener)
+    assert os.path.exists(sock_path)
+
+    new_endpoint.close(new_listener)
+    assert not os.path.exists(sock_path)
+
+def test_tcp_endpoint_binds_an_ephemeral_port():
+    endpoint = TcpEndpoint(TEST_HOST, 0)
+    listener = endpoint.open(1)
+
+    try:
+        assert listener.getsockname()[1] > 0
+    finally:
+        endpoint.close(listener)
@@ -0,0 +1,124 @@
+"""
+    @file test_microcache.py
+    @description Tests for micro-cached handlers: hits, single-flight misses, stale-while-revalidate and what is never stored.
+    @author Derek Tan
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+
+from handlers.microcache import CachedHandler, MicroCache
+from tests.support import make_server, make_text_handler, send_reply, fetch, open_conn, wait_for
+
+def make_counting_handler(calls: list):
+    """
+        @description Makes a handler whose body tells how many times it ran, e.g. `v1` on its first call.
+    """
+    def handle_count(context, request, response):
+        calls.append(request.path)
+
+        return send_reply(request, response, "200", f'v{len(calls)}'.encode(encoding="ascii"))
+
+    return handle_count
+
+def test_fresh_entry_is_served_without_the_handler():
+    calls = []
+    cache = MicroCache()
+
+    with make_server() as server:
+        server.set_handler(["/stats"], CachedHandler(make_counting_handler(calls), ttl=30.0, cache=cache))
+        conn = open_conn(server)
+
+        for _ in range(3):
+            conn.request("GET", "/stats")
+            assert conn.getresponse().read() == b'v1'
+
+        conn.close()
+
+    assert len(calls) == 1
+    assert cache.get_stats()["hits"] == 2
+
+def test_concurrent_misses_run_the_handler_once():
+    calls = []
+    gate = Event()
+    cache = MicroCache()
+    client_count = 6
+
+    with make_server(min_workers=client_count + 1, max_workers=client_count + 1) as server:
+        server.set_handler(["/slow"], CachedHandler(make_text_handler("shared", calls=calls, gate=gate), ttl=30.0, cache=cache))
+
+        with ThreadPoolExecutor(client_count) as clients:
+            replies = [clients.submit(fetch, server, "/slow") for _ in range(client_count)]
+
+            # NOTE hold the leader until every other request waits on its flight.
+            assert wait_for(lambda: cache.get_stats()["coalesced"] == client_count - 1)
+            gate.set()
+
+            bodies = [reply.result()[2] for reply in replies]
+
+    assert bodies == [b'shared'] * client_count
+    assert calls == ["/slow"]
+
+def test_stale_entry_is_served_while_one_refresh_runs():
+    calls = []
+    cache = MicroCache()
+
+    with make_server() as server:
+        server.set_handler(["/stats"], CachedHandler(make_counting_handler(calls), ttl=0.1, stale_ttl=30.0, cache=cache))
+        conn = open_conn(server)
+
+        conn.request("GET", "/stats")
+        assert conn.getresponse().read() == b'v1'
+
+        time.sleep(0.2)
+
+        conn.request("GET", "/stats")
+        assert conn.getresponse().read() == b'v1'
+
+        # NOTE the refresh runs in the background, so the next fresh request sees its result.
+        assert wait_for(lambda: len(calls) == 2 and cache.get_stats()["entries"] == 1 and not cache.flights)
+
+        conn.request("GET", "/stats")
+        assert conn.getresponse().read() == b'v2'
+        conn.close()
+
+    assert cache.get_stats()["stale_hits"] == 1
+
+def test_uncacheable_replies_are_passed_through():
+    calls = []
+
+    with make_server() as server:
+        server.set_handler(["/error"], CachedHandler(make_text_handler("oops", status="500", calls=calls), ttl=30.0))
+        server.set_handler(["/private"], CachedHandler(make_text_handler("mine", headers={"Cache-Control": "private"}, calls=calls), ttl=30.0))
+
+        replies = [fetch(server, path) for path in ("/error", "/error", "/private", "/private")]
+
+    assert [status for status, _, _ in replies] == [500, 500, 200, 200]
+    assert replies[3][1]["cache-control"] == "private"
+    assert calls == ["/error", "/error", "/private", "/private"]
+
+def test_vary_headers_split_entries():
+    calls = []
+
+    def handle_lang(context, request, response):
+        calls.append(request.path)
+        return send_reply(request, response, "200", request.get_header("accept-language").encode(encoding="latin-1"))
+
+    with make_server() as server:
+        server.set_handler(["/hello"], CachedHandler(handle_lang, ttl=30.0, vary=("Accept-Language",)))
+
+        bodies = [fetch(server, "/hello", headers={"Accept-Language": lang})[2] for lang in ("en", "fr", "en")]
+
+    assert bodies == [b'en', b'fr', b'en']
+    assert len(calls) == 2
+
+def test_uncached_methods_always_run_the_handler():
+    calls = []
+
+    with make_server() as server:
+        server.set_handler(["/form"], CachedHandler(make_counting_handler(calls), ttl=30.0), methods=frozenset(("GET", "POST")))
+
+        bodies = [fetch(server, "/form", method="POST", body=b'x')[2] for _ in range(2)]
+
+    assert bodies == [b'v1', b'v2']
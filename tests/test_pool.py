@@ -0,0 +1,130 @@
+"""
+    @file test_pool.py
+    @description Tests for the elastic worker pool: growth under load, retiring idle workers, shutdown and the worker settings in config files.
+    @author Derek Tan
+"""
+
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+
+import pytest
+
+from core.config import TippyConfig, load_config
+from core.instance import TIPPY_WORKER_NAME
+from core.pool import POOL_EVENT_UP, POOL_EVENT_DOWN
+from tests.support import make_server, make_text_handler, fetch, wait_for
+
+def get_worker_threads():
+    """
+        @description Gets the live connection worker threads, named by the pool's prefix and an id, leaving out its manager.
+    """
+    return [thread for thread in threading.enumerate() if thread.name.startswith(TIPPY_WORKER_NAME) and thread.name[len(TIPPY_WORKER_NAME) :].isdigit()]
+
+def test_fixed_pool_has_no_manager():
+    with make_server(min_workers=2, max_workers=2) as server:
+        pool_stats = server.get_pool_stats()
+
+        assert not server.pool.manager_thread.is_alive()
+
+    assert (pool_stats["size"], pool_stats["min"], pool_stats["max"]) == (2, 2, 2)
+    assert pool_stats["spawned"] == 0
+
+def test_pool_grows_while_workers_are_busy():
+    gate = Event()
+    client_count = 4
+
+    with make_server(min_workers=1, max_workers=client_count) as server:
+        server.set_handler(["/slow"], make_text_handler("slow", gate=gate))
+
+        with ThreadPoolExecutor(client_count) as clients:
+            replies = [clients.submit(fetch, server, "/slow") for _ in range(client_count)]
+
+            # NOTE every request holds a worker until the gate opens, so all of them being served means the pool grew.
+            try:
+                assert wait_for(lambda: server.get_pool_stats()["busy"] == client_count)
+            finally:
+                gate.set()
+
+            statuses = [reply.result()[0] for reply in replies]
+
+        pool_stats = server.get_pool_stats()
+
+    assert statuses == [200] * client_count
+    assert pool_stats["peak"] == client_count
+    assert pool_stats["spawned"] == client_count - 1
+    assert all(event[1] == POOL_EVENT_UP for event in pool_stats["events"])
+
+def test_idle_workers_retire_down_to_the_minimum():
+    gate = Event()
+
+    with make_server(min_workers=1, max_workers=3, worker_idle_timeout=0.2) as server:
+        server.set_handler(["/slow"], make_text_handler("slow", gate=gate))
+
+        with ThreadPoolExecutor(3) as clients:
+            replies = [clients.submit(fetch, server, "/slow") for _ in range(3)]
+
+            try:
+                assert wait_for(lambda: server.get_pool_stats()["size"] == 3)
+            finally:
+                gate.set()
+
+            for reply in replies:
+                reply.result()
+
+        assert wait_for(lambda: server.get_pool_stats()["size"] == 1)
+        pool_stats = server.get_pool_stats()
+
+        # NOTE retired workers leave the pool just before their threads end.
+        assert wait_for(lambda: len(get_worker_threads()) == 1)
+
+        # NOTE the one worker left still serves.
+        status, _, _ = fetch(server, "/slow")
+
+    assert pool_stats["retired"] == 2
+    assert pool_stats["events"][-1][1 : 3] == (POOL_EVENT_DOWN, 1)
+    assert status == 200
+
+def test_stop_ends_every_worker():
+    with make_server(min_workers=3, max_workers=6) as server:
+        assert len(get_worker_threads()) == 3
+
+    assert wait_for(lambda: not get_worker_threads(), 1.0)
+    assert not server.pool.manager_thread.is_alive()
+
+def test_bad_worker_limits_are_rejected():
+    with pytest.raises(ValueError):
+        TippyConfig(min_workers=4, max_workers=2)
+
+    with pytest.raises(ValueError):
+        TippyConfig(min_workers=0)
+
+def test_load_config_maps_legacy_worker_count(tmp_path):
+    config_path = tmp_path / "tippy.json"
+    config_path.write_text(json.dumps({"serveaddr": "127.0.0.1", "port": 0, "worker_count": 3}))
+
+    config = load_config(str(config_path))
+
+    assert (config.host_name, config.host_port) == ("127.0.0.1", 0)
+    assert (config.min_workers, config.max_workers) == (3, 3)
+
+def test_load_config_prefers_current_keys(tmp_path):
+    config_path = tmp_path / "tippy.json"
+    config_path.write_text(json.dumps({"max_workers": 8, "worker_count": 3}))
+
+    config = load_config(str(config_path))
+
+    assert (config.min_workers, config.max_workers) == (3, 8)
+
+def test_load_config_rejects_unknown_keys(tmp_path):
+    config_path = tmp_path / "tippy.json"
+    config_path.write_text(json.dumps({"workers": 3}))
+
+    with pytest.raises(ValueError):
+        load_config(str(config_path))
+
+def test_load_config_defaults_without_a_file(tmp_path):
+    config = load_config(str(tmp_path / "missing.json"))
+
+    assert config.max_workers == TippyConfig().max_workers
@@ -0,0 +1,191 @@
+"""
+    @file test_proxy.py
+    @description Tests for the reverse-proxy handler: forwarding, pooled connections, retries of dropped connections and upstream failures.
+    @author Derek Tan
+"""
+
+import socket
+from threading import Event, Lock, Thread
+
+from handlers.microcache import CachedHandler
+from handlers.proxy import ProxyHandler
+from tests.support import TEST_HOST, TEST_TIMEOUT, RecordingUpstream, make_server, fetch, open_conn, wait_for
+
+class HangUpUpstream:
+    """
+        @description Raw upstream that answers the first request on each connection and hangs up after reading the second, like a server closing a kept-alive connection just as it is reused.
+    """
+    def __init__(self, reply_delay: float = 0.0):
+        self.listener = socket.create_server((TEST_HOST, 0))
+        self.listener.settimeout(0.05)
+        self.reply_delay = reply_delay
+        self.requests = []
+        self.lock = Lock()
+        self.stop_flag = Event()
+        self.threads = [Thread(target=self.run_accept, name='test_hangup_upstream', daemon=True)]
+
+    def get_address(self):
+        return self.listener.getsockname()[0 : 2]
+
+    def run_accept(self):
+        while not self.stop_flag.is_set():
+            try:
+                conn, _ = self.listener.accept()
+            except TimeoutError:
+                continue
+
+            conn_thread = Thread(target=self.run_conn, name='test_hangup_conn', args=(conn,), daemon=True)
+
+            with self.lock:
+                self.threads.append(conn_thread)
+
+            conn_thread.start()
+
+    def run_conn(self, conn: socket.socket):
+        conn.settimeout(TEST_TIMEOUT)
+        reader = conn.makefile("rb")
+
+        try:
+            for request_n in range(2):
+                request_line = reader.readline()
+
+                if not request_line:
+                    return
+
+                body_length = 0
+
+                while True:
+                    header_line = reader.readline()
+
+                    if header_line in (b'\r\n', b''):
+                        break
+
+                    if header_line.lower().startswith(b'content-length:'):
+                        body_length = int(header_line.split(b':', 1)[1])
+
+                reader.read(body_length)
+
+                with self.lock:
+                    self.requests.append(request_line.split(b' ', 1)[0].decode(encoding="latin-1"))
+
+                if request_n == 1 or self.stop_flag.wait(self.reply_delay):
+                    return
+
+                conn.sendall(b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok')
+        except OSError:
+            pass
+        finally:
+            reader.close()
+            conn.close()
+
+    def __enter__(self):
+        self.threads[0].start()
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop_flag.set()
+
+        with self.lock:
+            temp_threads = list(self.threads)
+
+        for thread in temp_threads:
+            thread.join(TEST_TIMEOUT)
+
+        self.listener.close()
+
+        return False
+
+def get_free_address():
+    """
+        @description Gets a loopback address nothing listens on, so connecting to it is refused.
+    """
+    with socket.create_server((TEST_HOST, 0)) as probe:
+        return probe.getsockname()[0 : 2]
+
+def test_get_is_forwarded_with_headers():
+    with RecordingUpstream() as upstream:
+        with make_server() as server:
+            server.set_handler(["/api"], ProxyHandler([upstream.get_address()], health_interval=0))
+            status, headers, body = fetch(server, "/api", headers={"X-Token": "abc"})
+
+    assert status == 200
+    assert body == b'GET /api '
+    assert headers["content-type"] == "text/plain"
+    assert upstream.requests == [("GET", "/api", b'')]
+
+def test_kept_alive_client_reuses_one_upstream_connection():
+    with RecordingUpstream() as upstream:
+        with make_server() as server:
+            server.set_handler(["/api"], ProxyHandler([upstream.get_address()], health_interval=0))
+            conn = open_conn(server)
+
+            for _ in range(3):
+                conn.request("GET", "/api")
+                assert conn.getresponse().read() == b'GET /api '
+
+            conn.close()
+
+    assert len(upstream.requests) == 3
+    assert upstream.conn_count == 1
+
+def test_post_through_cached_handler_reaches_upstream():
+    with RecordingUpstream() as upstream:
+        with make_server() as server:
+            server.set_handler(["/api"], CachedHandler(ProxyHandler([upstream.get_address()], health_interval=0), ttl=5.0))
+
+            status, _, body = fetch(server, "/api", method="POST", body=b'payload', headers={"Content-Type": "text/plain"})
+            second_status, _, _ = fetch(server, "/api", method="POST", body=b'again')
+
+    assert (status, second_status) == (200, 200)
+    assert body == b'POST /api payload'
+    assert upstream.requests == [("POST", "/api", b'payload'), ("POST", "/api", b'again')]
+
+def test_get_is_retried_when_a_pooled_connection_drops():
+    with HangUpUpstream() as upstream:
+        with make_server() as server:
+            proxy = ProxyHandler([upstream.get_address()], health_interval=0)
+            server.set_handler(["/api"], proxy)
+
+            first_status, _, _ = fetch(server, "/api")
+            # NOTE the client may get its reply before the proxy pools the connection.
+            assert wait_for(lambda: len(proxy.upstreams[0].idle_conns) == 1)
+            second_status, _, second_body = fetch(server, "/api")
+
+    assert (first_status, second_status) == (200, 200)
+    assert second_body == b'ok'
+    assert upstream.requests == ["GET", "GET", "GET"]
+
+def test_post_is_never_resent():
+    with HangUpUpstream() as upstream:
+        with make_server() as server:
+            proxy = ProxyHandler([upstream.get_address()], health_interval=0)
+            server.set_handler(["/api"], proxy)
+
+            first_status, _, _ = fetch(server, "/api", method="POST", body=b'one')
+            assert wait_for(lambda: len(proxy.upstreams[0].idle_conns) == 1)
+            second_status, _, _ = fetch(server, "/api", method="POST", body=b'two')
+
+    assert (first_status, second_status) == (200, 502)
+    assert upstream.requests == ["POST", "POST"]
+
+def test_refused_upstream_gets_502_and_is_marked_down():
+    proxy = ProxyHandler([get_free_address()], health_interval=60.0)
+
+    with make_server() as server:
+        server.set_handler(["/api"], proxy)
+        status, _, _ = fetch(server, "/api")
+
+    assert status == 502
+    assert proxy.upstreams[0].healthy is False
+
+def test_slow_upstream_gets_504():
+    with HangUpUpstream(reply_delay=TEST_TIMEOUT) as upstream:
+        proxy = ProxyHandler([upstream.get_address()], read_timeout=0.2, health_interval=60.0)
+
+        with make_server() as server:
+            server.set_handler(["/api"], proxy)
+            status, _, _ = fetch(server, "/api")
+
+    assert status == 504
+    assert proxy.upstreams[0].healthy is True
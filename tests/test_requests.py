@@ -0,0 +1,111 @@
+"""
+    @file test_requests.py
+    @description Tests for request objects and for reading requests off kept-alive and pipelined connections.
+    @author Derek Tan
+"""
+
+import http1.consts as consts
+from http1.request import SimpleRequest
+from tests.support import TEST_HOST, make_server, send_reply, exchange_raw, get_status, open_conn
+
+def handle_echo(context, request, response):
+    """
+        @description Replies with the request's method, path, `X-Token` header and body.
+    """
+    body = request.get_body() or b''
+    echoed = f'{request.method} {request.path} {request.get_header("x-token")} '.encode(encoding="latin-1") + body
+
+    return send_reply(request, response, "200", echoed)
+
+def make_echo_server():
+    server = make_server()
+    server.set_handler(["/echo"], handle_echo, methods=frozenset(("GET", "HEAD", "POST")))
+
+    return server
+
+def test_headers_decode_lazily_and_reset_clears_them():
+    request = SimpleRequest("GET", "/a")
+    request.put_known_header(consts.HTTP_KNOWN_HDR_SLOTS["host"], b'example.org')
+    request.put_extra_header("x-token", b'abc')
+
+    assert request.get_raw_header(consts.HTTP_KNOWN_HDR_SLOTS["host"]) == b'example.org'
+    assert request.get_header("host") == "example.org"
+    assert request.get_header("x-token") == "abc"
+    assert dict(request.iter_raw_headers()) == {"host": b'example.org', "x-token": b'abc'}
+
+    request.reset("POST", "/b")
+
+    assert (request.method, request.path) == ("POST", "/b")
+    assert request.get_header("host") is None
+    assert request.get_header("x-token") is None
+
+def test_first_header_occurrence_wins():
+    request = SimpleRequest()
+    request.put_known_header(consts.HTTP_KNOWN_HDR_SLOTS["host"], b'first')
+    request.put_known_header(consts.HTTP_KNOWN_HDR_SLOTS["host"], b'second')
+
+    assert request.get_header("host") == "first"
+
+def test_copy_outlives_reset():
+    request = SimpleRequest("GET", "/kept")
+    request.put_extra_header("x-token", b'abc')
+    request.put_body(b'data')
+
+    kept = request.copy()
+    request.reset()
+
+    assert (kept.method, kept.path, kept.get_header("x-token"), kept.get_body()) == ("GET", "/kept", "abc", b'data')
+
+def test_keep_alive_requests_do_not_share_headers():
+    with make_echo_server() as server:
+        conn = open_conn(server)
+
+        conn.request("GET", "/echo", headers={"X-Token": "one"})
+        first_body = conn.getresponse().read()
+        conn.request("GET", "/echo")
+        second_body = conn.getresponse().read()
+        conn.close()
+
+    assert first_body == b'GET /echo one '
+    assert second_body == b'GET /echo None '
+
+def test_pipelined_requests_answer_in_order():
+    pipelined = (
+        b'GET /echo HTTP/1.1\r\nHost: t\r\nX-Token: 1\r\n\r\n'
+        b'POST /echo HTTP/1.1\r\nHost: t\r\nX-Token: 2\r\nContent-Length: 4\r\n\r\nbody'
+        b'GET /echo HTTP/1.1\r\nHost: t\r\nX-Token: 3\r\nConnection: Close\r\n\r\n'
+    )
+
+    with make_echo_server() as server:
+        raw_reply = exchange_raw((TEST_HOST, server.get_port()), pipelined)
+
+    assert raw_reply.count(b'HTTP/1.1 200') == 3
+    assert raw_reply.index(b'GET /echo 1 ') < raw_reply.index(b'POST /echo 2 body') < raw_reply.index(b'GET /echo 3 ')
+
+def test_chunked_body_is_joined():
+    chunked = b'POST /echo HTTP/1.1\r\nHost: t\r\nTransfer-Encoding: chunked\r\nConnection: Close\r\n\r\n3\r\nabc\r\n2\r\nde\r\n0\r\n\r\n'
+
+    with make_echo_server() as server:
+        raw_reply = exchange_raw((TEST_HOST, server.get_port()), chunked)
+
+    assert get_status(raw_reply) == 200
+    assert raw_reply.endswith(b'POST /echo None abcde')
+
+def test_missing_host_gets_400_and_close():
+    with make_echo_server() as server:
+        raw_reply = exchange_raw((TEST_HOST, server.get_port()), b'GET /echo HTTP/1.1\r\nConnection: Close\r\n\r\n')
+
+    assert get_status(raw_reply) == 400
+
+def test_unsupported_method_gets_501():
+    with make_echo_server() as server:
+        raw_reply = exchange_raw((TEST_HOST, server.get_port()), b'BREW /echo HTTP/1.1\r\nHost: t\r\nConnection: Close\r\n\r\n')
+
+    assert get_status(raw_reply) == 501
+
+def test_head_reply_has_no_body():
+    with make_echo_server() as server:
+        raw_reply = exchange_raw((TEST_HOST, server.get_port()), b'HEAD /echo HTTP/1.1\r\nHost: t\r\nConnection: Close\r\n\r\n')
+
+    assert get_status(raw_reply) == 200
+    assert raw_reply.endswith(b'\r\n\r\n')
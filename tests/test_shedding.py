@@ -0,0 +1,71 @@
+"""
+    @file test_shedding.py
+    @description Tests for load shedding in the accept thread: canned 503 replies with Retry-After and recovery once load drops.
+    @author Derek Tan
+"""
+
+import socket
+from threading import Event
+
+from tests.support import TEST_HOST, TEST_TIMEOUT, make_server, make_text_handler, exchange_raw, get_status, get_raw_header, open_conn, wait_for
+
+REQUEST_CLOSE = b'GET /hello HTTP/1.1\r\nHost: t\r\nConnection: Close\r\n\r\n'
+
+def test_no_shedder_without_thresholds():
+    with make_server() as server:
+        assert server.get_shed_stats() is None
+
+def test_active_connection_cap_sheds_with_retry_after():
+    with make_server(max_active_conns=1, retry_after=3) as server:
+        server.set_handler(["/hello"], make_text_handler("hi"))
+        address = (TEST_HOST, server.get_port())
+
+        held_conn = open_conn(server)
+        held_conn.request("GET", "/hello")
+        assert held_conn.getresponse().read() == b'hi'
+
+        shed_reply = exchange_raw(address, REQUEST_CLOSE)
+
+        held_conn.close()
+        assert wait_for(lambda: server.get_shed_stats()["active_conns"] == 0)
+
+        admitted_reply = exchange_raw(address, REQUEST_CLOSE)
+        shed_stats = server.get_shed_stats()
+
+    assert get_status(shed_reply) == 503
+    assert get_raw_header(shed_reply, "Retry-After") == "3"
+    assert get_raw_header(shed_reply, "Connection") == "Close"
+    assert get_status(admitted_reply) == 200
+    assert shed_stats["shed_active_conns"] == 1
+    assert shed_stats["shed_total"] == 1
+
+def test_queue_depth_cap_sheds_while_workers_are_busy():
+    gate = Event()
+
+    with make_server(min_workers=1, max_workers=1, max_queue_depth=1) as server:
+        server.set_handler(["/hello"], make_text_handler("hi", gate=gate))
+        address = (TEST_HOST, server.get_port())
+
+        # NOTE the only worker blocks in the handler, so the next connection stays queued and the one after it is over the depth cap.
+        with socket.create_connection(address, TEST_TIMEOUT) as busy_client:
+            busy_client.sendall(REQUEST_CLOSE)
+            assert wait_for(lambda: server.get_pool_stats()["busy"] == 1 and server.shared_queue.qsize() == 0)
+
+            with socket.create_connection(address, TEST_TIMEOUT) as queued_client:
+                queued_client.sendall(REQUEST_CLOSE)
+                assert wait_for(lambda: server.shared_queue.qsize() == 1)
+
+                shed_reply = exchange_raw(address, REQUEST_CLOSE)
+                gate.set()
+
+                busy_client.settimeout(TEST_TIMEOUT)
+                queued_client.settimeout(TEST_TIMEOUT)
+                busy_reply = busy_client.recv(4096)
+                queued_reply = queued_client.recv(4096)
+
+        shed_stats = server.get_shed_stats()
+
+    assert get_status(shed_reply) == 503
+    assert get_raw_header(shed_reply, "Retry-After") is not None
+    assert (get_status(busy_reply), get_status(queued_reply)) == (200, 200)
+    assert shed_stats["shed_queue_depth"] == 1
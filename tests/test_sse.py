@@ -0,0 +1,128 @@
+"""
+    @file test_sse.py
+    @description Tests for event streams: fan-out of published events, slow subscriber policy and clean-up of closed streams.
+    @author Derek Tan
+"""
+
+import socket
+import time
+
+from core.broadcast import encode_event
+from handlers.sse import SseHandler
+from tests.support import TEST_HOST, TEST_TIMEOUT, make_server, fetch, read_until_close, get_status, wait_for
+
+REQUEST_NEWS = b'GET /news HTTP/1.1\r\nHost: t\r\nAccept: text/event-stream\r\n\r\n'
+
+def read_until(client: socket.socket, marker: bytes):
+    """
+        @description Reads from a stream until `marker` was seen or it ends, returning everything read.
+    """
+    data = b''
+    deadline = time.monotonic() + TEST_TIMEOUT
+
+    while marker not in data and time.monotonic() < deadline:
+        chunk = client.recv(4096)
+
+        if not chunk:
+            break
+
+        data += chunk
+
+    return data
+
+def open_stream(address):
+    """
+        @description Subscribes to the news stream and reads its headers and preamble.
+    """
+    client = socket.create_connection(address, TEST_TIMEOUT)
+    client.sendall(REQUEST_NEWS)
+
+    return client, read_until(client, b'retry: 3000\n\n')
+
+def test_encode_event_splits_lines():
+    assert encode_event("a\nb", "tick", "7") == b'event: tick\nid: 7\ndata: a\ndata: b\n\n'
+
+def test_streams_need_event_streams_enabled():
+    with make_server() as server:
+        server.set_handler(["/news"], SseHandler("news"))
+        status, _, _ = fetch(server, "/news")
+
+        assert server.publish("news", "nobody") == 0
+        assert server.get_event_stats() is None
+
+    assert status == 503
+
+def test_event_reaches_every_subscriber():
+    with make_server(event_streams=True) as server:
+        server.set_handler(["/news"], SseHandler("news"))
+        address = (TEST_HOST, server.get_port())
+
+        first_client, first_preamble = open_stream(address)
+        second_client, _ = open_stream(address)
+
+        with first_client, second_client:
+            assert wait_for(lambda: server.get_event_stats()["topics"].get("news") == 2)
+
+            queued_count = server.publish("news", "hello", event="greeting")
+            first_event = read_until(first_client, b'\n\n')
+            second_event = read_until(second_client, b'\n\n')
+
+    assert get_status(first_preamble) == 200
+    assert b'Content-Type: text/event-stream' in first_preamble
+    assert queued_count == 2
+    assert first_event == second_event == b'event: greeting\ndata: hello\n\n'
+
+def test_closed_stream_is_unsubscribed():
+    with make_server(event_streams=True) as server:
+        server.set_handler(["/news"], SseHandler("news"))
+        client, _ = open_stream((TEST_HOST, server.get_port()))
+
+        assert wait_for(lambda: server.get_event_stats()["subscribers"] == 1)
+        client.close()
+
+        # NOTE the hub sees the close when the socket turns readable, without a publish.
+        assert wait_for(lambda: server.get_event_stats()["subscribers"] == 0)
+        assert server.publish("news", "late") == 0
+
+def test_event_over_the_buffer_is_dropped_for_the_subscriber():
+    with make_server(event_streams=True, event_buffer=64) as server:
+        server.set_handler(["/news"], SseHandler("news"))
+        client, _ = open_stream((TEST_HOST, server.get_port()))
+
+        with client:
+            assert wait_for(lambda: server.get_event_stats()["subscribers"] == 1)
+
+            big_count = server.publish("news", "x" * 128)
+            small_count = server.publish("news", "small")
+            small_event = read_until(client, b'\n\n')
+            event_stats = server.get_event_stats()
+
+    assert (big_count, small_count) == (0, 1)
+    assert small_event == b'data: small\n\n'
+    assert event_stats["dropped_events"] == 1
+
+def test_event_over_the_buffer_closes_the_stream_by_policy():
+    with make_server(event_streams=True, event_buffer=64, event_policy="disconnect") as server:
+        server.set_handler(["/news"], SseHandler("news"))
+        client, _ = open_stream((TEST_HOST, server.get_port()))
+
+        with client:
+            assert wait_for(lambda: server.get_event_stats()["subscribers"] == 1)
+
+            server.publish("news", "x" * 128)
+            rest = read_until_close(client)
+
+            assert wait_for(lambda: server.get_event_stats()["subscribers"] == 0)
+            event_stats = server.get_event_stats()
+
+    assert rest == b''
+    assert event_stats["slow_closed"] == 1
+
+def test_stop_closes_open_streams():
+    with make_server(event_streams=True) as server:
+        server.set_handler(["/news"], SseHandler("news"))
+        client, _ = open_stream((TEST_HOST, server.get_port()))
+        assert wait_for(lambda: server.get_event_stats()["subscribers"] == 1)
+
+    with client:
+        assert read_until_close(client) == b''